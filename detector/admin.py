@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import DetectionHistory, ScamReport, ScamStatistics
+from .models import DetectionHistory, DetectionRollup, ModelVersion, ScamReport, ScamStatistics
 
 
 @admin.register(DetectionHistory)
@@ -37,4 +37,19 @@ class ScamStatisticsAdmin(admin.ModelAdmin):
     
     def scam_percentage(self, obj):
         return f"{obj.scam_percentage:.1f}%"
-    scam_percentage.short_description = 'Scam %' 
\ No newline at end of file
+    scam_percentage.short_description = 'Scam %' 
+
+
+@admin.register(DetectionRollup)
+class DetectionRollupAdmin(admin.ModelAdmin):
+    list_display = ['granularity', 'bucket_start', 'user', 'is_scam', 'detections', 'feedback_correct', 'feedback_incorrect']
+    list_filter = ['granularity', 'is_scam', 'bucket_start']
+    ordering = ['-bucket_start']
+
+
+@admin.register(ModelVersion)
+class ModelVersionAdmin(admin.ModelAdmin):
+    list_display = ['version', 'is_active', 'created_at', 'activated_at', 'accuracy', 'vocab_size', 'source']
+    list_filter = ['is_active', 'source']
+    readonly_fields = ['version', 'path', 'created_at', 'activated_at', 'is_active']
+    ordering = ['-created_at']
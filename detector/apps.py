@@ -1,6 +1,28 @@
+import os
+import sys
+
 from django.apps import AppConfig
+from django.conf import settings
+
+
+def _running_management_command():
+    """manage.py commands other than runserver have no use for a preloaded model"""
+    program = os.path.basename(sys.argv[0]) if sys.argv else ''
+    return program in ('manage.py', 'django-admin') and sys.argv[1:2] != ['runserver']
 
 
 class DetectorConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'detector'
+
+    def ready(self):
+        from . import metrics
+        config = getattr(settings, 'SCAM_DETECTOR_METRICS', {})
+        metrics.set_enabled(config.get('ENABLED', True))
+        if config.get('BUCKETS'):
+            metrics.configure_buckets(config['BUCKETS'])
+
+        # Opt-in: load and warm the model once, before e.g. gunicorn --preload forks workers
+        if getattr(settings, 'SCAM_DETECTOR_PRELOAD', False) and not _running_management_command():
+            from .ml_model import preload_detector
+            preload_detector()
@@ -0,0 +1,147 @@
+"""
+Async versions of the JSON API views, for deployments served through
+scam_detector/asgi.py. Inference runs in a bounded thread pool and history
+writes go through the write-behind buffer (or the async ORM when it is off),
+so an ASGI worker never blocks its event loop on a single request. Enabled
+with SCAM_DETECTOR_ASYNC_API = True.
+
+Django 4.2's view decorators (require_POST, csrf_exempt) wrap async views in
+sync functions, so method checks are done inline here instead.
+"""
+import asyncio
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils import timezone
+
+from .metrics import span
+from .ml_model import get_scam_detector
+from .models import DetectionHistory
+from .rollups import catch_up_on_read, daily_totals
+from .views import find_detection, get_client_ip, parse_reference, prediction_cache_stats
+from .write_buffer import arecord_detections
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def get_inference_executor():
+    """Shared pool that runs CPU-bound inference off the event loop"""
+    global _executor
+    if _executor is None:
+        workers = getattr(settings, 'SCAM_DETECTOR_INFERENCE_WORKERS', None) or os.cpu_count() or 1
+        _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='scam-inference')
+    return _executor
+
+
+async def run_inference(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_inference_executor(), func, *args)
+
+
+def _predict(text):
+    detector = get_scam_detector()
+    return detector.predict(text), detector.model_version
+
+
+def _daily_stats(start_date, end_date):
+    catch_up_on_read()
+    return daily_totals(start_date, end_date)
+
+
+@sync_to_async
+def _get_user(request):
+    # request.user is a lazy object that queries the session/user tables
+    return request.user if request.user.is_authenticated else None
+
+
+async def api_detect(request):
+    """API endpoint for text detection"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST method required'}, status=405)
+    try:
+        with span('parse'):
+            data = json.loads(request.body)
+        text = data.get('text', '')
+        if not text:
+            return JsonResponse({'error': 'Text is required'}, status=400)
+        result, model_version = await run_inference(_predict, text)
+        await arecord_detections([DetectionHistory(
+            user=await _get_user(request),
+            text=text,
+            is_scam=result['is_scam'],
+            confidence_score=result['confidence'],
+            probability_spam=result['probability_spam'],
+            probability_ham=result['probability_ham'],
+            model_version=model_version or '',
+            ip_address=get_client_ip(request)
+        )])
+        return JsonResponse({
+            'success': True,
+            'result': result,
+            'text': text
+        })
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+async def api_statistics(request):
+    """API endpoint for statistics"""
+    days = request.GET.get('days', 7)
+    try:
+        days = int(days)
+    except ValueError:
+        days = 7
+
+    end_date = timezone.now().date()
+    start_date = end_date - timedelta(days=days)
+
+    stats = await sync_to_async(_daily_stats)(start_date, end_date)
+
+    return JsonResponse({
+        'success': True,
+        'stats': stats,
+        'days': days,
+        'prediction_cache': prediction_cache_stats()
+    })
+
+
+async def mark_detection_feedback(request):
+    """AJAX endpoint to mark a detection as correct/incorrect"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'POST method required'}, status=405)
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Invalid JSON.'}, status=400)
+    if not isinstance(data, dict):
+        return JsonResponse({'success': False, 'error': 'Invalid JSON.'}, status=400)
+    feedback = data.get('feedback')
+    if feedback not in ['correct', 'incorrect']:
+        return JsonResponse({'success': False, 'error': 'Invalid feedback value.'}, status=400)
+    reference = parse_reference(data.get('detection_id'))
+    if reference is None:
+        return JsonResponse({'success': False, 'error': 'Invalid detection id.'}, status=400)
+    try:
+        detection = await sync_to_async(find_detection)(reference)
+        detection.user_feedback = feedback
+        detection.feedback_at = timezone.now()
+        await detection.asave(update_fields=['user_feedback', 'feedback_at'])
+        return JsonResponse({'success': True, 'feedback': feedback})
+    except DetectionHistory.DoesNotExist:
+        return JsonResponse({'success': False, 'error': 'Detection not found.'}, status=404)
+    except Exception:
+        logger.exception('Could not save feedback for detection %s', reference)
+        return JsonResponse({'success': False, 'error': 'Could not save feedback.'}, status=500)
+
+
+mark_detection_feedback.csrf_exempt = True
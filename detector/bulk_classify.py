@@ -0,0 +1,337 @@
+"""
+Bulk classification of message dumps (see `manage.py classify_file`).
+
+Messages are read as a stream from CSV, JSON Lines or mbox (optionally
+gzipped), scored in chunks by a process pool that holds a copy of the
+served model, and written in input order as NDJSON or CSV. Only a few
+chunks are in flight at once, so memory does not grow with the input.
+
+Every record has an offset, its position in the input, and readers report
+the byte position just past each record. After each chunk is written and
+flushed, a checkpoint next to the output records the next offset, that
+byte position and the output size; a resumed run truncates the output
+back to that size (dropping a half-written chunk) and seeks the input to
+the byte position instead of re-parsing the records before it. Gzipped
+inputs still decompress up to that point on seek, but nothing is decoded
+or parsed on the way.
+"""
+import csv
+import email
+import email.policy
+import io
+import json
+import os
+import re
+import time
+from collections import deque
+from html import unescape
+from itertools import islice
+
+from detector.corpus import SNIFF_BYTES, _open_binary, sniff_encoding
+from detector.ml_model import predict_results
+
+FORMATS = ('csv', 'jsonl', 'mbox')
+OUTPUT_FORMATS = ('ndjson', 'csv')
+CSV_FIELDS = ['offset', 'id', 'label', 'is_scam', 'confidence', 'probability_spam', 'probability_ham']
+CHECKPOINT_SUFFIX = '.checkpoint'
+TAG_RE = re.compile(r'<[^>]+>')
+
+# Model installed in each worker by _install_model
+_model = None
+
+
+def detect_format(path):
+    name = path.lower()
+    if name.endswith('.gz'):
+        name = name[:-3]
+    if name.endswith(('.jsonl', '.ndjson', '.json')):
+        return 'jsonl'
+    if name.endswith(('.mbox', '.mbx')):
+        return 'mbox'
+    return 'csv'
+
+
+def _lines(f, encoding):
+    """Decoded lines of a binary file, with the byte position after each"""
+    for line in iter(f.readline, b''):
+        yield line.decode(encoding, errors='replace'), f.tell()
+
+
+def _open_input(path):
+    """Binary handle on a (possibly gzipped) file plus its sniffed text encoding"""
+    f = io.BufferedReader(_open_binary(path), buffer_size=SNIFF_BYTES)
+    return f, sniff_encoding(f.peek(SNIFF_BYTES)[:SNIFF_BYTES])
+
+
+def _iter_csv(path, text_column, id_column, position):
+    f, encoding = _open_input(path)
+    with f:
+        lines = _lines(f, encoding)
+        # csv pulls one line at a time, so after each row the last position
+        # seen is the end of that row, quoted newlines included
+        end = [0]
+
+        def feed(lines):
+            for line, end[0] in lines:
+                yield line
+
+        reader = csv.reader(feed(lines))
+        header = next(reader, None) or []
+        if position > end[0]:
+            f.seek(position)
+            # the decoder only strips a BOM at the very start of the file
+            lines = _lines(f, 'utf-8' if encoding == 'utf-8-sig' else encoding)
+            reader = csv.reader(feed(lines))
+        if text_column in header:
+            text_index = header.index(text_column)
+        else:
+            # No named column: spam.csv's layout (label, text) or a single column
+            text_index = 1 if len(header) > 1 else 0
+        id_index = header.index(id_column) if id_column in header else None
+        for row in reader:
+            text = row[text_index] if len(row) > text_index else ''
+            yield (row[id_index] if id_index is not None and len(row) > id_index else None), text, end[0]
+
+
+def _iter_jsonl(path, text_column, id_column, position):
+    f, encoding = _open_input(path)
+    with f:
+        if position:
+            f.seek(position)
+            encoding = 'utf-8' if encoding == 'utf-8-sig' else encoding
+        for line, end in _lines(f, encoding):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            yield record.get(id_column), record.get(text_column) or '', end
+
+
+def _mbox_messages(path, position=0):
+    """
+    (raw bytes, end position) of each message in an mbox file, without
+    indexing the file; position must be the start of a "From " line
+    """
+    lines = []
+    previous_blank = True
+    with _open_binary(path) as f:
+        f.seek(position)
+        line_start = position
+        for line in iter(f.readline, b''):
+            if line.startswith(b'From ') and previous_blank:
+                if lines:
+                    yield b''.join(lines), line_start
+                lines = []
+            else:
+                # mboxrd quoting of body lines that start with "From "
+                if line.startswith(b'>') and line.lstrip(b'>').startswith(b'From '):
+                    line = line[1:]
+                lines.append(line)
+            previous_blank = not line.strip()
+            line_start = f.tell()
+        if lines:
+            yield b''.join(lines), line_start
+
+
+def message_text(message):
+    """Subject plus the plain-text body (HTML parts with tags stripped as a fallback)"""
+    parts = {'plain': [], 'html': []}
+    for part in message.walk():
+        subtype = part.get_content_subtype() if part.get_content_maintype() == 'text' else None
+        if subtype not in parts or part.get_content_disposition() == 'attachment':
+            continue
+        try:
+            parts[subtype].append(part.get_content())
+        except (LookupError, UnicodeError):
+            payload = part.get_payload(decode=True) or b''
+            parts[subtype].append(payload.decode('latin-1'))
+    body = '\n'.join(parts['plain']) or unescape(TAG_RE.sub(' ', '\n'.join(parts['html'])))
+    subject = str(message.get('subject') or '')
+    return f'{subject}\n{body}' if subject else body
+
+
+def _iter_mbox(path, text_column, id_column, position):
+    for raw, end in _mbox_messages(path, position):
+        message = email.message_from_bytes(raw, policy=email.policy.default)
+        yield str(message.get('message-id') or '') or None, message_text(message), end
+
+
+def iter_messages(path, fmt=None, text_column='text', id_column='id', position=0):
+    """
+    Yield (id, text, end) per record, starting at byte position (a value of
+    end from an earlier pass); id is None when the input has none and end
+    is the byte position just past the record in the decompressed input.
+    """
+    fmt = fmt or detect_format(path)
+    readers = {'csv': _iter_csv, 'jsonl': _iter_jsonl, 'mbox': _iter_mbox}
+    if fmt not in readers:
+        raise Exception(f"Unknown input format {fmt!r}; use one of {FORMATS}.")
+    return readers[fmt](path, text_column, id_column, position)
+
+
+def _install_model(model):
+    global _model
+    _model = model
+
+
+def _score_chunk(texts):
+    """Worker: result dicts for one chunk, empty texts included"""
+    return predict_results(_model, [text or '' for text in texts])
+
+
+def _score_chunks(chunks, model, n_jobs):
+    """Yield (chunk, results) in input order with at most 2 * n_jobs chunks in flight"""
+    if n_jobs <= 1:
+        _install_model(model)
+        for chunk in chunks:
+            yield chunk, _score_chunk([text for _, _, text, _ in chunk])
+        return
+    from concurrent.futures import ProcessPoolExecutor
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=_install_model, initargs=(model,)) as pool:
+        for chunk in chunks:
+            pending.append((chunk, pool.submit(_score_chunk, [text for _, _, text, _ in chunk])))
+            if len(pending) >= 2 * n_jobs:
+                chunk, future = pending.popleft()
+                yield chunk, future.result()
+        while pending:
+            chunk, future = pending.popleft()
+            yield chunk, future.result()
+
+
+def _chunked(records, start, chunk_size):
+    """[(offset, id, text, end), ...] lists of chunk_size records, numbered from offset start"""
+    offset = start
+    while True:
+        chunk = [(offset + i, *record) for i, record in enumerate(islice(records, chunk_size))]
+        if not chunk:
+            return
+        yield chunk
+        offset += len(chunk)
+
+
+def read_checkpoint(output_path):
+    try:
+        with open(output_path + CHECKPOINT_SUFFIX) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_checkpoint(output_path, checkpoint):
+    tmp_path = output_path + CHECKPOINT_SUFFIX + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, output_path + CHECKPOINT_SUFFIX)
+
+
+class _Writer:
+    def __init__(self, f, output_format, include_text):
+        self.f = f
+        self.output_format = output_format
+        self.include_text = include_text
+        self.csv = None
+        if output_format == 'csv':
+            self.csv = csv.DictWriter(f, fieldnames=CSV_FIELDS + (['text'] if include_text else []))
+
+    def header(self):
+        if self.csv is not None:
+            self.csv.writeheader()
+
+    def write(self, offset, record_id, text, result):
+        row = {'offset': offset, 'id': record_id, **result}
+        if self.include_text:
+            row['text'] = text
+        if self.csv is not None:
+            self.csv.writerow(row)
+        else:
+            self.f.write(json.dumps(row) + '\n')
+
+
+def classify_file(input_path, output_path, model, model_version=None, fmt=None, output_format='ndjson',
+                  n_jobs=1, chunk_size=1000, resume=False, text_column='text', id_column='id',
+                  include_text=False, progress=None, progress_interval=10.0):
+    """
+    Score every message in input_path and write the results to output_path.
+    progress(stats) is called at most every progress_interval seconds and
+    once at the end. Returns the final stats dict.
+    """
+    fmt = fmt or detect_format(input_path)
+    checkpoint = read_checkpoint(output_path) if resume else None
+    if checkpoint is not None:
+        if checkpoint['input'] != os.path.abspath(input_path):
+            raise Exception(f"{output_path} was written for {checkpoint['input']}, not {input_path}")
+        if model_version and checkpoint['model_version'] not in (None, model_version):
+            raise Exception(
+                f"{output_path} was written by model {checkpoint['model_version'][:12]}, "
+                f"not {model_version[:12]}; start a new output instead of mixing verdicts"
+            )
+        output_format = checkpoint['output_format']
+    start_offset = checkpoint['next_offset'] if checkpoint else 0
+    start_position = checkpoint['next_position'] if checkpoint else 0
+
+    def save_checkpoint(finished):
+        _write_checkpoint(output_path, {
+            'input': os.path.abspath(input_path),
+            'format': fmt,
+            'output_format': output_format,
+            'model_version': model_version,
+            'next_offset': stats['next_offset'],
+            'next_position': next_position,
+            'output_bytes': os.fstat(f.fileno()).st_size,
+            'finished': finished,
+        })
+
+    if checkpoint:
+        with open(output_path, 'r+b') as f:
+            # Drop anything written after the last checkpoint
+            f.truncate(checkpoint['output_bytes'])
+    f = open(output_path, 'a' if checkpoint else 'w', newline='', encoding='utf-8')
+    stats = {
+        'input': input_path,
+        'output': output_path,
+        'start_offset': start_offset,
+        'next_offset': start_offset,
+        'classified': 0,
+        'scams': 0,
+        'elapsed_seconds': 0.0,
+        'messages_per_second': 0.0,
+        'finished': bool(checkpoint and checkpoint['finished']),
+    }
+    next_position = start_position
+    started = time.perf_counter()
+    last_report = started
+    try:
+        writer = _Writer(f, output_format, include_text)
+        if not checkpoint:
+            writer.header()
+        records = iter_messages(input_path, fmt, text_column, id_column, start_position)
+        chunks = _chunked(records, start_offset, chunk_size)
+        if stats['finished']:
+            chunks = []
+        for chunk, results in _score_chunks(chunks, model, n_jobs):
+            for (offset, record_id, text, _), result in zip(chunk, results):
+                writer.write(offset, record_id, text, result)
+                stats['scams'] += result['is_scam']
+            f.flush()
+            os.fsync(f.fileno())
+            stats['classified'] += len(chunk)
+            stats['next_offset'] = chunk[-1][0] + 1
+            next_position = chunk[-1][3]
+            save_checkpoint(False)
+            now = time.perf_counter()
+            stats['elapsed_seconds'] = now - started
+            stats['messages_per_second'] = stats['classified'] / stats['elapsed_seconds']
+            if progress is not None and now - last_report >= progress_interval:
+                last_report = now
+                progress(stats)
+        stats['finished'] = True
+        f.flush()
+        save_checkpoint(True)
+    finally:
+        f.close()
+    stats['elapsed_seconds'] = time.perf_counter() - started
+    stats['messages_per_second'] = stats['classified'] / stats['elapsed_seconds'] if stats['elapsed_seconds'] else 0.0
+    if progress is not None:
+        progress(stats)
+    return stats
@@ -0,0 +1,478 @@
+"""
+Near-duplicate index of known scam campaigns.
+
+A campaign sends many lightly edited copies of one message. Every confirmed
+scam is reduced to a MinHash signature of its word shingles. Confirmed scams
+are detections the user marked correct (or ham verdicts marked incorrect,
+as update_model counts them) and verified ScamReports. Two messages belong
+to the same campaign when the estimated Jaccard similarity of their shingle
+sets is at least THRESHOLD. Locality-sensitive hashing finds the candidates
+without a scan: the signature is cut into BANDS bands, and entries sharing
+any band with the message are compared. With the defaults (16 bands of 4
+rows) the pairs that become candidates are mostly those above 0.5.
+
+Only a few signatures are stored per campaign. A confirmation at least
+DUPLICATE_SIMILARITY similar to a stored entry just adds to its campaign's
+member count. At most MAX_CAMPAIGNS campaigns and MAX_ENTRIES entries are
+kept; the least recently seen campaigns are evicted first, with their
+entries and band keys, and a campaign left without entries goes too. An
+entry takes NUM_PERM * 4 + BANDS * 12 bytes and a campaign 41, so the index
+stays bounded however many copies arrive. Campaign ids are never reused.
+
+`manage.py update_campaigns` folds in confirmations since its watermark and
+writes a new generation of arrays (meta.json + .npy) to PATH/<generation>/,
+then points PATH/CURRENT at it. Serving processes map the current
+generation read-only and look at CURRENT every POLL_INTERVAL seconds.
+Configured by settings.SCAM_DETECTOR_CAMPAIGNS.
+"""
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import zlib
+
+import numpy as np
+
+DEFAULTS = {
+    'ENABLED': True,
+    'PATH': 'scam_detector_campaigns',
+    'NUM_PERM': 64,
+    'BANDS': 16,
+    'SHINGLE_SIZE': 3,
+    'THRESHOLD': 0.5,
+    'DUPLICATE_SIMILARITY': 0.9,
+    'MAX_ENTRIES': 250000,
+    'MAX_CAMPAIGNS': 100000,
+    'POLL_INTERVAL': 30.0,
+}
+INDEX_FORMAT = 'scam-detector-campaigns'
+INDEX_VERSION = 1
+META_FILE = 'meta.json'
+CURRENT_FILE = 'CURRENT'
+KEEP_GENERATIONS = 2
+# Entries compared per band at most, so a crowded bucket cannot slow a lookup down
+BUCKET_LIMIT = 64
+# Entries added to an index before they are merged into its sorted arrays
+PENDING_LIMIT = 4096
+# Fixed, so signatures agree across processes and runs
+HASH_SEED = 20240611
+SOURCE_DETECTION = 0
+SOURCE_REPORT = 1
+WORD_RE = re.compile(r'[a-z0-9]+')
+ENTRY_ARRAYS = ('signatures', 'entry_campaigns', 'keys', 'key_entries')
+CAMPAIGN_ARRAYS = ('campaign_ids', 'members', 'first_seen', 'last_seen', 'source_kind', 'source_id')
+CAMPAIGN_DTYPES = {
+    'campaign_ids': np.int64,
+    'members': np.int64,
+    'first_seen': np.float64,
+    'last_seen': np.float64,
+    'source_kind': np.int8,
+    'source_id': np.int64,
+}
+
+logger = logging.getLogger(__name__)
+
+
+def get_config():
+    try:
+        from django.conf import settings
+        return {**DEFAULTS, **getattr(settings, 'SCAM_DETECTOR_CAMPAIGNS', {})}
+    except Exception:
+        # Django not configured, e.g. the model used from a plain script
+        return dict(DEFAULTS, ENABLED=False)
+
+
+class MinHasher:
+    """MinHash signatures of word shingles (multiply-shift hashing of CRC32s)"""
+
+    def __init__(self, num_perm=64, bands=16, shingle_size=3):
+        if num_perm % bands:
+            raise Exception(f"NUM_PERM ({num_perm}) must be a multiple of BANDS ({bands}).")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(HASH_SEED)
+        high = np.iinfo(np.uint64).max
+        self._a = rng.integers(0, high, size=num_perm, dtype=np.uint64, endpoint=True) | np.uint64(1)
+        self._b = rng.integers(0, high, size=num_perm, dtype=np.uint64, endpoint=True)
+        self._band_mult = rng.integers(0, high, size=self.rows, dtype=np.uint64, endpoint=True) | np.uint64(1)
+        self._band_salt = rng.integers(0, high, size=bands, dtype=np.uint64, endpoint=True)
+
+    def shingles(self, text):
+        """Word k-grams; every number becomes 0, so changed amounts and phone numbers still match"""
+        words = ['0' if word.isdigit() else word for word in WORD_RE.findall(text.lower())]
+        k = self.shingle_size
+        if len(words) <= k:
+            return {' '.join(words)} if words else set()
+        return {' '.join(words[i:i + k]) for i in range(len(words) - k + 1)}
+
+    def signature(self, text):
+        """uint32 array of NUM_PERM minimum hashes, or None for a text without words"""
+        shingles = self.shingles(text)
+        if not shingles:
+            return None
+        x = np.fromiter((zlib.crc32(s.encode()) for s in shingles), dtype=np.uint64, count=len(shingles))
+        # Wraps modulo 2**64 by design; the high 32 bits are the hash
+        hashed = (x[:, None] * self._a + self._b) >> np.uint64(32)
+        return hashed.min(axis=0).astype(np.uint32)
+
+    def band_keys(self, signatures):
+        """uint64 key per band, shape (n, BANDS), for signatures of shape (n, NUM_PERM)"""
+        bands = signatures.reshape(len(signatures), self.bands, self.rows).astype(np.uint64)
+        return (bands * self._band_mult).sum(axis=2) + self._band_salt
+
+
+def _empty_arrays(num_perm):
+    arrays = {
+        'signatures': np.zeros((0, num_perm), dtype=np.uint32),
+        'entry_campaigns': np.zeros(0, dtype=np.int32),
+        'keys': np.zeros(0, dtype=np.uint64),
+        'key_entries': np.zeros(0, dtype=np.int32),
+    }
+    arrays.update({name: np.zeros(0, dtype=dtype) for name, dtype in CAMPAIGN_DTYPES.items()})
+    return arrays
+
+
+class CampaignIndex:
+    """
+    Entries and campaigns as arrays, plus a small buffer of the ones added
+    since the last merge (see _merge_pending). Campaign ids are handed out
+    in increasing order and never change, so campaign_ids stays sorted and
+    eviction (see _evict) only has to filter the arrays.
+    """
+
+    def __init__(self, config=None, arrays=None, meta=None):
+        config = config or get_config()
+        meta = meta or {}
+        self.hasher = MinHasher(
+            meta.get('num_perm', config['NUM_PERM']),
+            meta.get('bands', config['BANDS']),
+            meta.get('shingle_size', config['SHINGLE_SIZE']),
+        )
+        self.threshold = config['THRESHOLD']
+        self.duplicate_similarity = config['DUPLICATE_SIMILARITY']
+        self.max_entries = config['MAX_ENTRIES']
+        self.max_campaigns = config['MAX_CAMPAIGNS']
+        self.generation = meta.get('generation', 0)
+        self.watermark = meta.get('watermark', {})
+        arrays = arrays or _empty_arrays(self.hasher.num_perm)
+        for name in ENTRY_ARRAYS + CAMPAIGN_ARRAYS:
+            setattr(self, name, arrays[name])
+        self.next_campaign = meta.get('next_campaign', len(self.members))
+        self._new_signatures = []
+        self._new_entry_campaigns = []
+        self._new_keys = {}
+        self._new_campaigns = {name: [] for name in CAMPAIGN_ARRAYS}
+
+    @property
+    def n_entries(self):
+        return len(self.entry_campaigns) + len(self._new_entry_campaigns)
+
+    @property
+    def n_campaigns(self):
+        return len(self.members) + len(self._new_campaigns['members'])
+
+    def _candidates(self, keys):
+        candidates = set()
+        if len(self.keys):
+            lo = np.searchsorted(self.keys, keys, side='left').tolist()
+            hi = np.searchsorted(self.keys, keys, side='right').tolist()
+            for start, end in zip(lo, hi):
+                if end > start:
+                    candidates.update(self.key_entries[start:min(end, start + BUCKET_LIMIT)].tolist())
+        if self._new_keys:
+            for key in keys.tolist():
+                candidates.update(self._new_keys.get(key, ())[:BUCKET_LIMIT])
+        return candidates
+
+    def _entry_signature(self, entry):
+        stored = len(self.entry_campaigns)
+        return self.signatures[entry] if entry < stored else self._new_signatures[entry - stored]
+
+    def _entry_campaign(self, entry):
+        stored = len(self.entry_campaigns)
+        return int(self.entry_campaigns[entry]) if entry < stored else self._new_entry_campaigns[entry - stored]
+
+    def match_signature(self, signature):
+        """(campaign id, estimated similarity) of the closest entry at or above THRESHOLD, or None"""
+        candidates = self._candidates(self.hasher.band_keys(signature[None, :])[0])
+        if not candidates:
+            return None
+        entries = sorted(candidates)
+        similarities = (np.array([self._entry_signature(e) for e in entries]) == signature).mean(axis=1)
+        best = int(similarities.argmax())
+        if similarities[best] < self.threshold:
+            return None
+        return self._entry_campaign(entries[best]), float(similarities[best])
+
+    def match(self, text):
+        signature = self.hasher.signature(text)
+        return None if signature is None else self.match_signature(signature)
+
+    def _position(self, campaign):
+        """
+        (True, position in the campaign arrays) for a stored campaign, or
+        (False, position in the buffer) for one added since the last merge
+        """
+        new_ids = self._new_campaigns['campaign_ids']
+        if new_ids and campaign >= new_ids[0]:
+            return False, campaign - new_ids[0]
+        return True, int(np.searchsorted(self.campaign_ids, campaign))
+
+    def _touch(self, campaign, seen_at):
+        stored, position = self._position(campaign)
+        if stored:
+            if not self.members.flags.writeable:
+                self._make_writable()
+            self.members[position] += 1
+            self.last_seen[position] = max(self.last_seen[position], seen_at)
+        else:
+            self._new_campaigns['members'][position] += 1
+            last_seen = self._new_campaigns['last_seen']
+            last_seen[position] = max(last_seen[position], seen_at)
+
+    def _make_writable(self):
+        for name in CAMPAIGN_ARRAYS:
+            setattr(self, name, np.array(getattr(self, name)))
+
+    def add(self, text, seen_at, source_kind, source_id):
+        """
+        Fold one confirmed scam into the index. Returns (campaign id, outcome)
+        where outcome is 'duplicate' (only counted), 'entry' (stored as a new
+        variant of a known campaign) or 'campaign' (a new one), or None for a
+        text without words.
+        """
+        signature = self.hasher.signature(text)
+        if signature is None:
+            return None
+        match = self.match_signature(signature)
+        if match is not None and match[1] >= self.duplicate_similarity:
+            self._touch(match[0], seen_at)
+            return match[0], 'duplicate'
+        if match is not None:
+            campaign = match[0]
+            self._touch(campaign, seen_at)
+            outcome = 'entry'
+        else:
+            campaign = self.next_campaign
+            self.next_campaign += 1
+            for name, value in zip(CAMPAIGN_ARRAYS, (campaign, 1, seen_at, seen_at, source_kind, source_id)):
+                self._new_campaigns[name].append(value)
+            outcome = 'campaign'
+        entry = self.n_entries
+        self._new_signatures.append(signature)
+        self._new_entry_campaigns.append(campaign)
+        for key in self.hasher.band_keys(signature[None, :])[0].tolist():
+            self._new_keys.setdefault(key, []).append(entry)
+        if len(self._new_signatures) >= PENDING_LIMIT:
+            self._merge_pending()
+        return campaign, outcome
+
+    def campaign(self, campaign):
+        """Dict of one campaign's fields"""
+        stored, position = self._position(campaign)
+        if stored:
+            values = {name: getattr(self, name)[position].item() for name in CAMPAIGN_ARRAYS[1:]}
+        else:
+            values = {name: self._new_campaigns[name][position] for name in CAMPAIGN_ARRAYS[1:]}
+        return {'id': campaign, **values}
+
+    def _merge_pending(self):
+        """
+        Move the buffered entries and campaigns into the arrays. The new band
+        keys are sorted and inserted in one pass, which costs O(entries)
+        instead of re-sorting every key.
+        """
+        if self._new_campaigns['members']:
+            for name, dtype in CAMPAIGN_DTYPES.items():
+                setattr(self, name, np.concatenate([getattr(self, name), np.array(self._new_campaigns[name], dtype=dtype)]))
+                self._new_campaigns[name] = []
+        if self._new_signatures:
+            first = len(self.entry_campaigns)
+            signatures = np.array(self._new_signatures, dtype=np.uint32)
+            keys = self.hasher.band_keys(signatures).ravel()
+            order = np.argsort(keys, kind='stable')
+            positions = np.searchsorted(self.keys, keys[order], side='right')
+            self.keys = np.insert(self.keys, positions, keys[order])
+            self.key_entries = np.insert(self.key_entries, positions, (first + order // self.hasher.bands).astype(np.int32))
+            self.signatures = np.concatenate([self.signatures, signatures])
+            self.entry_campaigns = np.concatenate(
+                [self.entry_campaigns, np.array(self._new_entry_campaigns, dtype=np.int32)]
+            )
+            self._new_signatures = []
+            self._new_entry_campaigns = []
+            self._new_keys = {}
+
+    def _evict(self):
+        """
+        Drop the least recently seen campaigns beyond MAX_CAMPAIGNS, then the
+        entries of the least recently seen campaigns beyond MAX_ENTRIES, and
+        finally every campaign left without entries. Expects merged arrays.
+        """
+        positions = np.searchsorted(self.campaign_ids, self.entry_campaigns)
+        recency = self.last_seen[positions]
+        kept = np.ones(len(recency), dtype=bool)
+        if len(self.members) > self.max_campaigns:
+            live = np.zeros(len(self.members), dtype=bool)
+            live[np.argsort(-self.last_seen, kind='stable')[:self.max_campaigns]] = True
+            kept = live[positions]
+        if kept.sum() > self.max_entries:
+            candidates = np.flatnonzero(kept)
+            kept = np.zeros(len(recency), dtype=bool)
+            kept[candidates[np.argsort(-recency[candidates], kind='stable')[:self.max_entries]]] = True
+        if not kept.all():
+            self._drop_entries(kept)
+        live = np.zeros(len(self.members), dtype=bool)
+        live[positions[kept]] = True
+        if not live.all():
+            # Filtering keeps campaign_ids sorted
+            for name in CAMPAIGN_ARRAYS:
+                setattr(self, name, getattr(self, name)[live])
+
+    def _drop_entries(self, kept):
+        """Keep the entries set in a boolean mask, with their band keys"""
+        self.signatures = self.signatures[kept]
+        self.entry_campaigns = self.entry_campaigns[kept]
+        # Filtering keeps the band keys sorted; entries are renumbered
+        new_ids = (np.cumsum(kept) - 1).astype(np.int32)
+        key_kept = kept[self.key_entries]
+        self.keys = self.keys[key_kept]
+        self.key_entries = new_ids[self.key_entries[key_kept]]
+
+    def save(self, root=None):
+        """
+        Write this index as the next generation under root and make it the
+        current one. Old generations beyond KEEP_GENERATIONS are deleted.
+        Returns the generation's directory.
+        """
+        root = root or get_config()['PATH']
+        os.makedirs(root, exist_ok=True)
+        self._merge_pending()
+        self._evict()
+        generation = max([self.generation] + _generations(root)) + 1
+        tmp_path = tempfile.mkdtemp(prefix='.tmp-', dir=root)
+        try:
+            os.chmod(tmp_path, 0o755)
+            for name in ENTRY_ARRAYS + CAMPAIGN_ARRAYS:
+                np.save(os.path.join(tmp_path, name + '.npy'), getattr(self, name))
+            meta = {
+                'format': INDEX_FORMAT,
+                'version': INDEX_VERSION,
+                'generation': generation,
+                'num_perm': self.hasher.num_perm,
+                'bands': self.hasher.bands,
+                'shingle_size': self.hasher.shingle_size,
+                'entries': self.n_entries,
+                'campaigns': self.n_campaigns,
+                'next_campaign': self.next_campaign,
+                'watermark': self.watermark,
+            }
+            # Header last: a directory without meta.json is not a complete generation
+            with open(os.path.join(tmp_path, META_FILE), 'w') as f:
+                json.dump(meta, f, indent=2, sort_keys=True)
+            path = os.path.join(root, f'{generation:08d}')
+            os.rename(tmp_path, path)
+        except Exception:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+        current_tmp = os.path.join(root, CURRENT_FILE + '.tmp')
+        with open(current_tmp, 'w') as f:
+            f.write(os.path.basename(path))
+        os.replace(current_tmp, os.path.join(root, CURRENT_FILE))
+        for old in _generations(root)[:-KEEP_GENERATIONS]:
+            # Processes still mapping an old generation keep reading it until they reload
+            shutil.rmtree(os.path.join(root, f'{old:08d}'), ignore_errors=True)
+        return path
+
+
+def _generations(root):
+    try:
+        return sorted(int(name) for name in os.listdir(root) if name.isdigit())
+    except OSError:
+        return []
+
+
+def current_path(root=None):
+    """Directory of the current generation, or None before the first save"""
+    root = root or get_config()['PATH']
+    try:
+        with open(os.path.join(root, CURRENT_FILE)) as f:
+            name = f.read().strip()
+    except OSError:
+        return None
+    return os.path.join(root, name) if name else None
+
+
+def load(path=None, config=None, writable=False):
+    """
+    The index at path (default: the current generation), or an empty index
+    when there is none yet. The arrays are memory-mapped read-only unless
+    writable, in which case the campaign arrays are copied so add() can
+    update them.
+    """
+    config = config or get_config()
+    path = path or current_path(config['PATH'])
+    if path is None or not os.path.exists(os.path.join(path, META_FILE)):
+        return CampaignIndex(config)
+    with open(os.path.join(path, META_FILE)) as f:
+        meta = json.load(f)
+    if meta.get('format') != INDEX_FORMAT or meta.get('version') != INDEX_VERSION:
+        raise Exception(f"Unsupported campaign index at {path}: {meta.get('format')!r} v{meta.get('version')!r}")
+    arrays = {
+        name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+        for name in ENTRY_ARRAYS + CAMPAIGN_ARRAYS
+    }
+    index = CampaignIndex(config, arrays, meta)
+    if writable:
+        index._make_writable()
+    return index
+
+
+_index_lock = threading.Lock()
+_served = {'path': None, 'index': None, 'next_check': 0.0}
+
+
+def get_campaign_index():
+    """
+    The index served by this process, reloaded when CURRENT points at a new
+    generation (checked every POLL_INTERVAL seconds). None when disabled.
+    """
+    config = get_config()
+    if not config['ENABLED']:
+        return None
+    now = time.monotonic()
+    if now < _served['next_check']:
+        return _served['index']
+    with _index_lock:
+        if now < _served['next_check']:
+            return _served['index']
+        path = current_path(config['PATH'])
+        if path != _served['path']:
+            try:
+                # Empty until the first update_campaigns run, so results keep the same fields
+                _served['index'] = load(path, config)
+                _served['path'] = path
+                if path is not None:
+                    logger.info("Loaded campaign index generation %s from %s", _served['index'].generation, path)
+            except Exception as e:
+                logger.warning("Could not load campaign index at %s: %s", path, e)
+        _served['next_check'] = now + (config['POLL_INTERVAL'] or 0)
+    return _served['index']
+
+
+def annotate(texts, results):
+    """
+    Add campaign_id and campaign_similarity (percent) to prediction results;
+    both are None when there is no match or the index is disabled.
+    """
+    index = get_campaign_index()
+    for text, result in zip(texts, results):
+        match = index.match(text) if index is not None else None
+        result['campaign_id'] = match[0] if match else None
+        result['campaign_similarity'] = match[1] * 100 if match else None
+    return results
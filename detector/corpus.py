@@ -0,0 +1,120 @@
+"""
+Streaming corpus reader for training and evaluation.
+
+Files are read once, front to back, and handed out as (texts, labels) chunks
+of bounded size, so a multi-GB export never has to fit in memory. Supported
+inputs are CSV (label, text, ...) with a header row, JSON Lines with "label"
+and "text" keys, and gzip-compressed versions of either.
+"""
+import codecs
+import csv
+import gzip
+import io
+import json
+import random
+
+SNIFF_BYTES = 64 * 1024
+DEFAULT_CHUNK_SIZE = 10000
+
+# Labels used elsewhere in the code; anything else is passed through as-is.
+LABEL_ALIASES = {'0': 'ham', '1': 'spam', 'legitimate': 'ham', 'scam': 'spam'}
+
+
+def _is_gzip(path):
+    with open(path, 'rb') as f:
+        return f.read(2) == b'\x1f\x8b'
+
+
+def _open_binary(path):
+    return gzip.open(path, 'rb') if _is_gzip(path) else open(path, 'rb')
+
+
+def sniff_encoding(prefix):
+    """
+    Pick a text encoding from the first bytes of a file: UTF-8 (with or
+    without BOM) if the prefix decodes cleanly, otherwise Latin-1, which
+    accepts any byte sequence.
+    """
+    if prefix.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    try:
+        # final=False tolerates a multi-byte character cut off at the end
+        codecs.getincrementaldecoder('utf-8')().decode(prefix, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'latin-1'
+
+
+def open_text(path):
+    """
+    Open a (possibly gzipped) file for text reading. The encoding is sniffed
+    from a prefix once; undecodable bytes later on become U+FFFD, which the
+    tokenizer treats like any other non-letter.
+    """
+    raw = io.BufferedReader(_open_binary(path), buffer_size=SNIFF_BYTES)
+    encoding = sniff_encoding(raw.peek(SNIFF_BYTES)[:SNIFF_BYTES])
+    return io.TextIOWrapper(raw, encoding=encoding, errors='replace', newline='')
+
+
+def detect_format(path):
+    name = path.lower()
+    if name.endswith('.gz'):
+        name = name[:-3]
+    if name.endswith(('.jsonl', '.ndjson', '.json')):
+        return 'jsonl'
+    return 'csv'
+
+
+def iter_records(path, fmt=None):
+    """Yield (text, label) pairs; rows without text are skipped."""
+    fmt = fmt or detect_format(path)
+    with open_text(path) as f:
+        if fmt == 'jsonl':
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line)
+                text = record.get('text')
+                if text:
+                    yield text, _label(record.get('label'))
+        else:
+            reader = csv.reader(f)
+            next(reader, None)  # header
+            for row in reader:
+                if len(row) > 1 and row[1]:
+                    yield row[1], _label(row[0])
+
+
+def _label(value):
+    value = str(value).strip()
+    return LABEL_ALIASES.get(value.lower(), value)
+
+
+def iter_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE, fmt=None):
+    """Yield (texts, labels) lists of at most chunk_size records."""
+    texts, labels = [], []
+    for text, label in iter_records(path, fmt):
+        texts.append(text)
+        labels.append(label)
+        if len(texts) >= chunk_size:
+            yield texts, labels
+            texts, labels = [], []
+    if texts:
+        yield texts, labels
+
+
+def split_chunks(chunks, test_size=0.2, seed=42, test=False):
+    """
+    Streaming train/test split. Each record is assigned by a seeded random
+    draw in file order, so two passes over the same file with the same seed
+    see the same split. Yields only the train side, or only the test side
+    when test=True.
+    """
+    rng = random.Random(seed)
+    for texts, labels in chunks:
+        keep = [(rng.random() < test_size) == test for _ in labels]
+        yield (
+            [text for text, k in zip(texts, keep) if k],
+            [label for label, k in zip(labels, keep) if k],
+        )
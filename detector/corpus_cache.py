@@ -0,0 +1,265 @@
+"""
+Pre-tokenized corpus cache.
+
+One pass over a labelled corpus (see detector.corpus) writes it as arrays:
+
+    meta.json     source path and hash, classes, document and token counts
+    tokens.npy    int32 word id of every token, documents back to back
+    offsets.npy   int64 start of each document in tokens, plus the end
+    labels.npy    int8 class index of each document
+    vocab.npy     the words, as bytes, in order of first appearance
+
+Tokens are the ones NaiveBayesAlgorithmFromScratch.preprocess produces, so
+fitting or scoring from the cache gives the same model and predictions as
+the texts (count_token_ids / predict_token_ids). The arrays are opened with
+np.load(mmap_mode='r'): repeated runs read them straight from the page
+cache and do no text processing at all. Counting can be split over a
+process pool by document range (shards); workers open the same memory maps
+by path, so only the counts travel between processes.
+
+The cache directory is named after the SHA-256 of the source file, so an
+edited corpus gets a new cache instead of a stale one. Configured by
+settings.SCAM_DETECTOR_CORPUS_CACHE.
+"""
+import hashlib
+import json
+import os
+import random
+import shutil
+import tempfile
+from collections import Counter
+
+import numpy as np
+
+from detector.corpus import DEFAULT_CHUNK_SIZE, iter_chunks
+from detector.naive_bayes_scratch import TOKEN_RE
+
+DEFAULTS = {
+    'ENABLED': True,
+    'PATH': 'scam_detector_corpus_cache',
+}
+CACHE_FORMAT = 'scam-detector-corpus'
+# Bump when tokenization changes, so existing caches are rebuilt
+CACHE_VERSION = 1
+META_FILE = 'meta.json'
+ARRAY_NAMES = ('tokens', 'offsets', 'labels', 'vocab')
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# Corpora opened in this process by open_corpus, by path
+_open_corpora = {}
+
+
+def get_config():
+    try:
+        from django.conf import settings
+        return {**DEFAULTS, **getattr(settings, 'SCAM_DETECTOR_CORPUS_CACHE', {})}
+    except Exception:
+        # Django not configured, e.g. the model used from a plain script
+        return dict(DEFAULTS, ENABLED=False)
+
+
+def source_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class TokenizedCorpus:
+    """A cached corpus; tokens, offsets and labels are read-only memory maps"""
+
+    def __init__(self, path):
+        with open(os.path.join(path, META_FILE)) as f:
+            self.meta = json.load(f)
+        arrays = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r') for name in ARRAY_NAMES}
+        self.path = path
+        self.tokens = arrays['tokens']
+        self.offsets = arrays['offsets']
+        self.labels = arrays['labels']
+        self.classes = self.meta['classes']
+        # Decoded once; the model lookups work on str
+        self.words = [word.decode('ascii') for word in arrays['vocab'].tolist()]
+
+    def __len__(self):
+        return len(self.labels)
+
+    def split_mask(self, test_size=0.2, seed=42):
+        """
+        Test-side mask of detector.corpus.split_chunks: the same seeded draw
+        per record in file order, so both paths agree on the split.
+        """
+        rng = random.Random(seed)
+        return np.array([rng.random() < test_size for _ in range(len(self))], dtype=bool)
+
+    def select(self, mask=None, start=0, stop=None):
+        """
+        (ids, doc_ids, doc_labels) for the documents start..stop (all by
+        default) that are set in a boolean mask over that range (all when
+        None), documents numbered 0..n-1 in corpus order. Without a mask the
+        token array is sliced, without a copy.
+        """
+        stop = len(self) if stop is None else stop
+        offsets = self.offsets[start:stop + 1]
+        lengths = np.diff(offsets)
+        tokens = self.tokens[int(offsets[0]):int(offsets[-1])]
+        labels = self.labels[start:stop]
+        if mask is None:
+            ids = tokens
+            doc_ids = np.repeat(np.arange(stop - start), lengths)
+            label_ids = labels
+        else:
+            ids = tokens[np.repeat(mask, lengths)]
+            doc_ids = np.repeat(np.arange(int(mask.sum())), lengths[mask])
+            label_ids = labels[mask]
+        return ids, doc_ids, [self.classes[i] for i in label_ids.tolist()]
+
+    def shards(self, n_shards):
+        """
+        n_shards contiguous (start, stop) document ranges holding about the
+        same number of tokens each; empty ranges are dropped.
+        """
+        bounds = np.searchsorted(self.offsets, np.linspace(0, self.offsets[-1], n_shards + 1)).tolist()
+        bounds[0], bounds[-1] = 0, len(self)
+        return [(start, stop) for start, stop in zip(bounds, bounds[1:]) if stop > start]
+
+    def fit(self, model, mask=None, n_jobs=1):
+        """Fit model on the selected documents"""
+        model._fit_counts(*self.count(model, mask, n_jobs))
+        return model
+
+    def count(self, model, mask=None, n_jobs=1):
+        """
+        model.count() of the selected documents. With n_jobs > 1 the corpus
+        is counted in shards by a process pool and the shard counts are
+        merged in corpus order.
+        """
+        if n_jobs <= 1:
+            ids, doc_ids, doc_labels = self.select(mask)
+            return model.count_token_ids(self.words, ids, doc_ids, doc_labels)
+        tasks = [
+            (self.path, model._empty_copy(), start, stop, None if mask is None else mask[start:stop])
+            for start, stop in self.shards(n_jobs * 4)
+        ]
+        totals = (Counter(), {}, Counter())
+        # Training only; keeps multiprocessing out of the serving imports
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            for counts in pool.map(_count_shard, tasks):
+                model.merge_counts(totals, counts)
+        return totals
+
+    def predict(self, model, mask=None):
+        """(y_true, y_pred) label lists for the selected documents"""
+        ids, doc_ids, doc_labels = self.select(mask)
+        return doc_labels, model.predict_token_ids(self.words, ids, doc_ids, len(doc_labels))
+
+
+def open_corpus(path):
+    """The TokenizedCorpus at path, opened once per process (pool workers)"""
+    corpus = _open_corpora.get(path)
+    if corpus is None:
+        corpus = _open_corpora[path] = TokenizedCorpus(path)
+    return corpus
+
+
+def _count_shard(task):
+    """Worker: count() of one document range of a cached corpus"""
+    path, model, start, stop, mask = task
+    corpus = open_corpus(path)
+    ids, doc_ids, doc_labels = corpus.select(mask, start, stop)
+    return model.count_token_ids(corpus.words, ids, doc_ids, doc_labels)
+
+
+def _raw_to_npy(raw_path, npy_path, n, block=1 << 24):
+    """Copy a raw int32 file into an .npy file block by block, then delete it"""
+    array = np.lib.format.open_memmap(npy_path, mode='w+', dtype=np.int32, shape=(n,))
+    if n:
+        raw = np.memmap(raw_path, dtype=np.int32, mode='r', shape=(n,))
+        for start in range(0, n, block):
+            array[start:start + block] = raw[start:start + block]
+        del raw
+    array.flush()
+    del array
+    os.remove(raw_path)
+
+
+def build(source_path, path, chunk_size=DEFAULT_CHUNK_SIZE, digest=None):
+    """
+    Tokenize source_path into a cache directory at path. Written to a
+    temporary directory and renamed into place, so a reader never sees a
+    partial cache. Returns the TokenizedCorpus.
+    """
+    digest = digest or source_hash(source_path)
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    tmp_path = tempfile.mkdtemp(prefix='.tmp-', dir=parent)
+    try:
+        os.chmod(tmp_path, 0o755)
+        vocab = {}
+        classes = {}
+        offsets = [0]
+        labels = []
+        n_tokens = 0
+        # Token ids go straight to disk, so the corpus is never held in memory
+        with open(os.path.join(tmp_path, 'tokens.bin'), 'wb') as raw:
+            for texts, chunk_labels in iter_chunks(source_path, chunk_size):
+                ids = []
+                for text, label in zip(texts, chunk_labels):
+                    ids.extend([vocab.setdefault(word, len(vocab)) for word in TOKEN_RE.findall(text.lower())])
+                    offsets.append(n_tokens + len(ids))
+                    labels.append(classes.setdefault(label, len(classes)))
+                n_tokens += len(ids)
+                np.asarray(ids, dtype=np.int32).tofile(raw)
+        _raw_to_npy(os.path.join(tmp_path, 'tokens.bin'), os.path.join(tmp_path, 'tokens.npy'), n_tokens)
+        np.save(os.path.join(tmp_path, 'offsets.npy'), np.array(offsets, dtype=np.int64))
+        np.save(os.path.join(tmp_path, 'labels.npy'), np.array(labels, dtype=np.int8))
+        np.save(os.path.join(tmp_path, 'vocab.npy'), np.array([word.encode('ascii') for word in vocab], dtype=np.bytes_))
+        meta = {
+            'format': CACHE_FORMAT,
+            'version': CACHE_VERSION,
+            'source_path': os.path.abspath(source_path),
+            'source_hash': digest,
+            'classes': list(classes),
+            'documents': len(labels),
+            'tokens': n_tokens,
+            'vocab_size': len(vocab),
+        }
+        # Header last: a directory without meta.json is not a complete cache
+        with open(os.path.join(tmp_path, META_FILE), 'w') as f:
+            json.dump(meta, f, indent=2, sort_keys=True)
+        if os.path.isdir(path):
+            # Built concurrently by another process; theirs is identical
+            shutil.rmtree(tmp_path)
+        else:
+            os.rename(tmp_path, path)
+    except Exception:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    return TokenizedCorpus(path)
+
+
+def _is_current(path):
+    try:
+        with open(os.path.join(path, META_FILE)) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return meta.get('format') == CACHE_FORMAT and meta.get('version') == CACHE_VERSION
+
+
+def load_or_build(source_path, root=None):
+    """
+    The TokenizedCorpus for source_path, built on first use. Returns None
+    when the cache is disabled or the source does not exist.
+    """
+    config = get_config()
+    if not config['ENABLED'] or not os.path.isfile(source_path):
+        return None
+    digest = source_hash(source_path)
+    path = os.path.join(root or config['PATH'], f'{digest}-v{CACHE_VERSION}')
+    if _is_current(path):
+        return TokenizedCorpus(path)
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    return build(source_path, path, digest=digest)
@@ -0,0 +1,222 @@
+"""
+Stratified k-fold cross-validation without refitting.
+
+The corpus is streamed twice, in chunks, through a process pool:
+
+1. Every record is assigned to a fold and each fold's documents are
+   counted. Fold model i is then fitted from the global counts minus fold
+   i's counts (model.subtract_counts), which costs O(vocabulary) per fold
+   instead of re-tokenizing the other k - 1 folds.
+2. Every record is scored by the model that did not see it, and the
+   workers send back per-fold confusion counts.
+
+Fold assignment is stratified: within each class, every run of k records
+is spread over the k folds in a seeded random order, so each fold holds
+1/k of every class (give or take one) and two runs with the same seed
+agree. Nothing but counts and fold models is held in memory.
+
+Given a TokenizedCorpus (detector.corpus_cache) both passes run on its
+token ids instead: no text is parsed or tokenized and the folds are the
+same. The pool then gets document ranges of the cache, which workers read
+from its memory maps.
+"""
+import random
+import time
+from collections import Counter, deque
+from statistics import mean, pstdev
+
+import numpy as np
+
+from detector.corpus import DEFAULT_CHUNK_SIZE, iter_chunks
+from detector.corpus_cache import open_corpus
+from detector.evaluation import metrics_from_confusion
+
+# Fold models installed in each scoring worker by _install_models
+_fold_models = None
+
+
+class FoldAssigner:
+    """Stratified fold numbers for a stream of labels (blocked randomization)"""
+
+    def __init__(self, k, seed=42):
+        self.k = k
+        self.rng = random.Random(seed)
+        self._slots = {}
+
+    def assign(self, labels):
+        folds = []
+        for label in labels:
+            slots = self._slots.get(label)
+            if not slots:
+                slots = self._slots[label] = list(range(self.k))
+                self.rng.shuffle(slots)
+            folds.append(slots.pop())
+        return folds
+
+
+def _split_by_fold(X, y, folds):
+    parts = {}
+    for text, label, fold in zip(X, y, folds):
+        texts, labels = parts.setdefault(fold, ([], []))
+        texts.append(text)
+        labels.append(label)
+    return parts
+
+
+def _count_folds(task):
+    """Worker: {fold: count()} for one chunk"""
+    model, X, y, folds = task
+    return {fold: model.count(texts, labels) for fold, (texts, labels) in _split_by_fold(X, y, folds).items()}
+
+
+def _install_models(models):
+    global _fold_models
+    _fold_models = models
+
+
+def _score_folds(task):
+    """Worker: {fold: Counter of (true, predicted)} for one chunk"""
+    X, y, folds = task
+    return {
+        fold: Counter(zip(labels, _fold_models[fold].predict(texts)))
+        for fold, (texts, labels) in _split_by_fold(X, y, folds).items()
+    }
+
+
+def _count_corpus_folds(task):
+    """Worker: [count() per fold] for one document range of a corpus cache"""
+    path, model, start, stop, folds, k = task
+    corpus = open_corpus(path)
+    counts = []
+    for fold in range(k):
+        ids, doc_ids, doc_labels = corpus.select(folds == fold, start, stop)
+        counts.append(model.count_token_ids(corpus.words, ids, doc_ids, doc_labels))
+    return counts
+
+
+def _score_corpus_folds(task):
+    """Worker: [Counter of (true, predicted) per fold] for one document range of a corpus cache"""
+    path, start, stop, folds = task
+    corpus = open_corpus(path)
+    confusions = []
+    for fold, model in enumerate(_fold_models):
+        ids, doc_ids, doc_labels = corpus.select(folds == fold, start, stop)
+        y_pred = model.predict_token_ids(corpus.words, ids, doc_ids, len(doc_labels))
+        confusions.append(Counter(zip(doc_labels, y_pred)))
+    return confusions
+
+
+def _map_chunks(func, tasks, n_jobs, initializer=None, initargs=()):
+    """
+    Yield func(task) in task order. With n_jobs > 1 tasks run in a process
+    pool with at most 2 * n_jobs in flight, so a stream stays bounded.
+    """
+    if n_jobs <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        for task in tasks:
+            yield func(task)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=initializer, initargs=initargs) as pool:
+        for task in tasks:
+            pending.append(pool.submit(func, task))
+            if len(pending) >= 2 * n_jobs:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _fold_chunks(path, k, seed, chunk_size):
+    """(X, y, folds) per chunk; the same folds on every pass"""
+    assigner = FoldAssigner(k, seed)
+    for X, y in iter_chunks(path, chunk_size):
+        yield X, y, assigner.assign(y)
+
+
+def cross_validate(path, model, k=5, n_jobs=1, seed=42, chunk_size=DEFAULT_CHUNK_SIZE, corpus=None):
+    """
+    k-fold cross-validation of an unfitted model (its tokenizer settings
+    are used for every fold) on a labelled corpus, or on its corpus cache
+    when one is given. Returns a dict with per-fold metrics, aggregate
+    metrics and timings in seconds.
+    """
+    if k < 2:
+        raise Exception("Cross-validation needs at least 2 folds.")
+    start = time.perf_counter()
+    fold_counts = [(Counter(), {}, Counter()) for _ in range(k)]
+    if corpus is not None:
+        doc_folds = np.array(
+            FoldAssigner(k, seed).assign([corpus.classes[i] for i in corpus.labels.tolist()]), dtype=np.intp
+        )
+        shards = corpus.shards(n_jobs * 4 if n_jobs > 1 else 1)
+        tasks = ((corpus.path, model._empty_copy(), lo, hi, doc_folds[lo:hi], k) for lo, hi in shards)
+        for shard_counts in _map_chunks(_count_corpus_folds, tasks, n_jobs):
+            for fold, counts in enumerate(shard_counts):
+                model.merge_counts(fold_counts[fold], counts)
+    else:
+        tasks = ((model._empty_copy(), X, y, folds) for X, y, folds in _fold_chunks(path, k, seed, chunk_size))
+        for chunk_counts in _map_chunks(_count_folds, tasks, n_jobs):
+            for fold, counts in chunk_counts.items():
+                model.merge_counts(fold_counts[fold], counts)
+    totals = (Counter(), {}, Counter())
+    for counts in fold_counts:
+        model.merge_counts(totals, counts)
+    counted = time.perf_counter()
+
+    models = []
+    for counts in fold_counts:
+        fold_model = model._empty_copy()
+        fold_model._fit_counts(*model.subtract_counts(totals, counts))
+        models.append(fold_model)
+    fitted = time.perf_counter()
+
+    confusions = [Counter() for _ in range(k)]
+    if corpus is not None:
+        tasks = ((corpus.path, lo, hi, doc_folds[lo:hi]) for lo, hi in shards)
+        for shard_confusions in _map_chunks(_score_corpus_folds, tasks, n_jobs, _install_models, (models,)):
+            for fold, confusion in enumerate(shard_confusions):
+                confusions[fold].update(confusion)
+    else:
+        tasks = ((X, y, folds) for X, y, folds in _fold_chunks(path, k, seed, chunk_size))
+        for chunk_confusions in _map_chunks(_score_folds, tasks, n_jobs, _install_models, (models,)):
+            for fold, confusion in chunk_confusions.items():
+                confusions[fold].update(confusion)
+    _install_models(None)
+    scored = time.perf_counter()
+
+    labels = sorted(totals[0])
+    folds = []
+    for i, (confusion, fold_model) in enumerate(zip(confusions, models)):
+        metrics = metrics_from_confusion(confusion, labels)
+        metrics['fold'] = i
+        metrics['train_samples'] = sum(fold_model.class_doc_counts.values())
+        metrics['vocab_size'] = fold_model.vocab_size
+        folds.append(metrics)
+    pooled = metrics_from_confusion(sum(confusions, Counter()), labels)
+    accuracies = [fold['accuracy'] for fold in folds]
+    aggregate = {
+        'accuracy_mean': mean(accuracies),
+        'accuracy_std': pstdev(accuracies),
+        'f1_mean': {label: mean(fold['per_class'][label]['f1'] for fold in folds) for label in labels},
+        'f1_std': {label: pstdev(fold['per_class'][label]['f1'] for fold in folds) for label in labels},
+        'pooled': pooled,
+    }
+    return {
+        'folds': folds,
+        'aggregate': aggregate,
+        'samples': sum(totals[0].values()),
+        'class_counts': dict(totals[0]),
+        'k': k,
+        'seed': seed,
+        'workers': n_jobs,
+        'source': 'corpus_cache' if corpus is not None else 'text',
+        'tokenizer': model.tokenizer_config(),
+        'timing': {
+            'count_seconds': counted - start,
+            'fit_seconds': fitted - counted,
+            'score_seconds': scored - fitted,
+            'total_seconds': scored - start,
+        },
+    }
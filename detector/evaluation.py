@@ -0,0 +1,46 @@
+"""
+Evaluation metrics for the detector, computed from label lists or a
+confusion matrix so they can be stored next to the model and shown without
+touching the corpus again.
+"""
+from collections import Counter
+
+
+def confusion_counts(y_true, y_pred):
+    """Counter of (true_label, predicted_label) pairs."""
+    return Counter(zip(y_true, y_pred))
+
+
+def metrics_from_confusion(confusion, labels):
+    """
+    Accuracy, per-class precision/recall/f1/support and the confusion matrix
+    (rows = true label, columns = predicted label, both ordered like labels).
+    """
+    matrix = [[confusion.get((true, pred), 0) for pred in labels] for true in labels]
+    total = sum(confusion.values())
+    correct = sum(matrix[i][i] for i in range(len(labels)))
+    per_class = {}
+    for i, label in enumerate(labels):
+        tp = matrix[i][i]
+        predicted = sum(row[i] for row in matrix)
+        support = sum(matrix[i])
+        precision = tp / predicted if predicted else 0.0
+        recall = tp / support if support else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        per_class[label] = {
+            'precision': precision,
+            'recall': recall,
+            'f1': f1,
+            'support': support,
+        }
+    return {
+        'accuracy': correct / total if total else 0.0,
+        'labels': list(labels),
+        'per_class': per_class,
+        'confusion_matrix': matrix,
+        'test_samples': total,
+    }
+
+
+def classification_metrics(y_true, y_pred, labels=('ham', 'spam')):
+    return metrics_from_confusion(confusion_counts(y_true, y_pred), list(labels))
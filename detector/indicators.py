@@ -0,0 +1,349 @@
+"""
+Indicators of compromise from verified scam reports.
+
+ScamReport.contact_info holds the phone numbers, email addresses and URLs
+scammers used. The tokenizer drops digits and punctuation, so the model
+never sees them. This module matches them in incoming texts, and the hits
+are reported next to the verdict (result['indicators']).
+
+Indicators are normalized when they are added:
+
+    phone   its last PHONE_DIGITS digits, so +44 7700 900123 and 07700-900123 agree
+    email   lower-cased address
+    domain  host without www. (a bare domain, or a URL without a path)
+    url     host and path, without scheme, www. and a trailing slash
+
+A text is normalized the same way (lower case, separators inside numbers
+removed) and then scanned once by an Aho-Corasick automaton holding every
+indicator. Since most texts contain none, a Bloom filter is checked first.
+It holds each indicator's key: the host for emails, domains and URLs, and
+the digits for phones. The text's hosts (with their parent domains) and the
+suffixes of its long digit runs are looked up, and only a text with a
+possible hit is scanned. A text without hosts or long numbers needs no
+lookup at all.
+
+The matcher is built from the database on first use. Every POLL_INTERVAL
+seconds a background thread adds the reports verified since its watermark
+(a verified_at, plus the highest id of the reports verified without one,
+e.g. through QuerySet.update()); when reports were unverified or deleted
+it is rebuilt. Requests keep using the current matcher meanwhile.
+Configured by settings.SCAM_DETECTOR_INDICATORS.
+"""
+import hashlib
+import logging
+import math
+import re
+import threading
+import time
+
+DEFAULTS = {
+    'ENABLED': True,
+    'POLL_INTERVAL': 60.0,
+    'BLOOM_ERROR_RATE': 0.01,
+}
+PHONE_DIGITS = 9
+MIN_PHONE_DIGITS = 7
+# Bloom filter sizing: never smaller than this, and twice the keys at a rebuild
+BLOOM_MIN_CAPACITY = 10000
+EMAIL_RE = re.compile(r'[a-z0-9._%+-]+@[a-z0-9-]+(?:\.[a-z0-9-]+)+')
+URL_RE = re.compile(r'(?:[a-z][a-z0-9+.-]*://)?(?:www\.)?([a-z0-9-]+(?:\.[a-z0-9-]+)*\.[a-z]{2,})(/[^\s,;]*)?')
+PHONE_RE = re.compile(r'\+?\d[\d\s().-]*\d')
+HOST_RE = re.compile(r'[a-z0-9-]+(?:\.[a-z0-9-]+)+')
+DIGITS_RE = re.compile(r'\d{%d,}' % MIN_PHONE_DIGITS)
+NUMBER_SEPARATOR_RE = re.compile(r'(?<=\d)[\s().-]+(?=\d)')
+HOST_CHARS = set('abcdefghijklmnopqrstuvwxyz0123456789-')
+EMAIL_LOCAL_CHARS = HOST_CHARS | set('._%+')
+
+logger = logging.getLogger(__name__)
+
+
+def get_config():
+    try:
+        from django.conf import settings
+        return {**DEFAULTS, **getattr(settings, 'SCAM_DETECTOR_INDICATORS', {})}
+    except Exception:
+        # Django not configured, e.g. the model used from a plain script
+        return dict(DEFAULTS, ENABLED=False)
+
+
+def normalize_text(text):
+    """Lower case, with spaces, dots, dashes and brackets inside numbers removed"""
+    return NUMBER_SEPARATOR_RE.sub('', text.lower())
+
+
+def parse_contact_info(contact_info):
+    """(kind, value) for every indicator in a report's contact_info"""
+    text = contact_info.lower()
+    indicators = []
+    for email in EMAIL_RE.findall(text):
+        indicators.append(('email', email))
+    text = EMAIL_RE.sub(' ', text)
+    for host, path in URL_RE.findall(text):
+        path = path.rstrip('/')
+        indicators.append(('url', host + path) if path else ('domain', host))
+    text = URL_RE.sub(' ', text)
+    for phone in PHONE_RE.findall(text):
+        digits = re.sub(r'\D', '', phone)
+        if len(digits) >= MIN_PHONE_DIGITS:
+            indicators.append(('phone', digits[-PHONE_DIGITS:]))
+    return indicators
+
+
+def indicator_key(kind, value):
+    """What the Bloom filter holds for an indicator"""
+    if kind == 'phone':
+        return value
+    if kind == 'email':
+        return value.split('@', 1)[1]
+    return value.split('/', 1)[0]
+
+
+def text_keys(normalized):
+    """Keys a normalized text could hit: hosts and their parent domains, and digit-run suffixes"""
+    keys = set()
+    for host in HOST_RE.findall(normalized):
+        labels = host.split('.')
+        keys.update('.'.join(labels[i:]) for i in range(len(labels) - 1))
+    for run in DIGITS_RE.findall(normalized):
+        keys.update(run[-length:] for length in range(MIN_PHONE_DIGITS, min(len(run), PHONE_DIGITS) + 1))
+    return keys
+
+
+class BloomFilter:
+    """Bit array with k hash positions per key (double hashing of one BLAKE2b digest)"""
+
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1)
+        self.n_bits = max(64, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.n_hashes = max(1, int(round(self.n_bits / capacity * math.log(2))))
+        self.capacity = capacity
+        self.bits = bytearray((self.n_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.n_bits for i in range(self.n_hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class AhoCorasick:
+    """
+    Multi-pattern automaton over characters. Patterns can be added at any
+    time; the failure links are rebuilt on the next scan.
+    """
+
+    def __init__(self):
+        self._goto = [{}]
+        self._own = [[]]  # Values of the patterns ending at each state
+        self._fail = [0]
+        self._out = [[]]  # Own values plus those of the failure chain
+        self._dirty = False
+        self.n_patterns = 0
+
+    def add(self, pattern, value):
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto.append({})
+                self._own.append([])
+                self._goto[state][char] = next_state
+            state = next_state
+        self._own[state].append(value)
+        self.n_patterns += 1
+        self._dirty = True
+
+    def _build(self):
+        fail = [0] * len(self._goto)
+        out = [list(values) for values in self._own]
+        # Depth-one states fail to the root; the rest breadth first, as the queue grows
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for char, child in self._goto[state].items():
+                target = fail[state]
+                while target and char not in self._goto[target]:
+                    target = fail[target]
+                fail[child] = self._goto[target].get(char, 0)
+                out[child].extend(out[fail[child]])
+                queue.append(child)
+        self._fail = fail
+        self._out = out
+        self._dirty = False
+
+    def iter_matches(self, text):
+        """Yield (end index, value) for every pattern occurrence, in one pass over text"""
+        if self._dirty:
+            self._build()
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for i, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for value in out[state]:
+                yield i, value
+
+
+def _boundary_ok(kind, value, text, end):
+    """A hit must not be part of a longer number, host or address"""
+    start = end - len(value) + 1
+    before = text[start - 1] if start > 0 else ''
+    after = text[end + 1] if end + 1 < len(text) else ''
+    if kind == 'phone':
+        # Any prefix (country codes, trunk zeros) but not more digits after
+        return not after.isdigit()
+    if kind == 'url':
+        # /pay matches /pay and /pay/now, not /payment
+        return before not in HOST_CHARS and after not in HOST_CHARS
+    if after == '.' and end + 2 < len(text) and text[end + 2] in HOST_CHARS:
+        # evil.com is not evil.com.au; a full stop ending the sentence is fine
+        return False
+    return before not in (EMAIL_LOCAL_CHARS if kind == 'email' else HOST_CHARS) and after not in HOST_CHARS
+
+
+class IndicatorMatcher:
+    """Verified-report indicators, behind a Bloom filter"""
+
+    def __init__(self, capacity=BLOOM_MIN_CAPACITY, error_rate=0.01):
+        self.automaton = AhoCorasick()
+        self.bloom = BloomFilter(capacity, error_rate)
+        self.error_rate = error_rate
+        self.reports = {}  # (kind, value) -> number of verified reports naming it
+        self.report_count = 0
+        self.watermark = None  # verified_at of the newest report added
+        self.undated_watermark = 0  # Highest id added of a report without verified_at
+        self.scanned = 0  # Texts that passed the Bloom filter
+        self.lock = threading.Lock()
+
+    def add_report(self, contact_info):
+        for indicator in set(parse_contact_info(contact_info)):
+            if indicator not in self.reports:
+                self.reports[indicator] = 0
+                self.automaton.add(indicator[1], indicator)
+                self.bloom.add(indicator_key(*indicator))
+            self.reports[indicator] += 1
+        self.report_count += 1
+
+    def match(self, text):
+        """[{'kind', 'value', 'reports'}] for the indicators in text"""
+        if not self.reports:
+            return []
+        normalized = normalize_text(text)
+        bloom = self.bloom
+        if not any(key in bloom for key in text_keys(normalized)):
+            return []
+        hits = {}
+        with self.lock:
+            self.scanned += 1
+            for end, (kind, value) in self.automaton.iter_matches(normalized):
+                if (kind, value) not in hits and _boundary_ok(kind, value, normalized, end):
+                    hits[(kind, value)] = {'kind': kind, 'value': value, 'reports': self.reports[(kind, value)]}
+        return list(hits.values())
+
+
+def build_matcher(error_rate=0.01, capacity=None):
+    """An IndicatorMatcher holding every verified report's contact_info"""
+    from .models import ScamReport
+    reports = ScamReport.objects.filter(is_verified=True).exclude(contact_info='')
+    capacity = capacity or max(BLOOM_MIN_CAPACITY, 2 * 3 * reports.count())
+    matcher = IndicatorMatcher(capacity, error_rate)
+    _add_reports(matcher, reports)
+    return matcher
+
+
+def _add_reports(matcher, reports):
+    rows = reports.order_by('verified_at', 'id').values_list('id', 'contact_info', 'verified_at')
+    for report_id, contact_info, verified_at in rows.iterator(chunk_size=1000):
+        matcher.add_report(contact_info)
+        if verified_at is None:
+            matcher.undated_watermark = max(matcher.undated_watermark, report_id)
+        elif matcher.watermark is None or verified_at > matcher.watermark:
+            matcher.watermark = verified_at
+
+
+_matcher_lock = threading.Lock()
+_served = {'matcher': None, 'next_check': 0.0, 'refreshing': False}
+
+
+def _refresh(matcher, config):
+    """The served matcher brought up to date: extended in place, or rebuilt"""
+    from django.db.models import Q
+    from .models import ScamReport
+    verified = ScamReport.objects.filter(is_verified=True).exclude(contact_info='')
+    since = Q(verified_at__isnull=True, id__gt=matcher.undated_watermark)
+    if matcher.watermark:
+        since |= Q(verified_at__gt=matcher.watermark)
+    new = verified.filter(since)
+    new_count = new.count()
+    if verified.count() != matcher.report_count + new_count or matcher.bloom.count > matcher.bloom.capacity:
+        # Reports were unverified or deleted (or the filter is full): start over
+        return build_matcher(config['BLOOM_ERROR_RATE'])
+    if new_count:
+        with matcher.lock:
+            _add_reports(matcher, new)
+    return matcher
+
+
+def _refresh_served(config):
+    """Thread target: refresh the served matcher, off the request path"""
+    from django.db import DatabaseError, connections
+    try:
+        _served['matcher'] = _refresh(_served['matcher'], config)
+    except DatabaseError as e:
+        logger.warning("Could not refresh scam report indicators: %s", e)
+    finally:
+        # This thread's connection would otherwise stay open
+        connections.close_all()
+        _served['refreshing'] = False
+
+
+def get_indicator_matcher():
+    """
+    The process-wide matcher, built on first use and refreshed in a
+    background thread every POLL_INTERVAL seconds. None when disabled or
+    when the reports cannot be read (e.g. before migrate).
+    """
+    config = get_config()
+    if not config['ENABLED']:
+        return None
+    now = time.monotonic()
+    if now < _served['next_check']:
+        return _served['matcher']
+    with _matcher_lock:
+        if now < _served['next_check']:
+            return _served['matcher']
+        _served['next_check'] = now + (config['POLL_INTERVAL'] or 0)
+        if _served['matcher'] is not None:
+            if not _served['refreshing']:
+                _served['refreshing'] = True
+                threading.Thread(target=_refresh_served, args=(config,), daemon=True).start()
+            return _served['matcher']
+        from django.db import DatabaseError, transaction
+        try:
+            # Savepoint, so a missing table does not poison an outer transaction
+            with transaction.atomic():
+                _served['matcher'] = build_matcher(config['BLOOM_ERROR_RATE'])
+        except DatabaseError as e:
+            logger.warning("Could not load scam report indicators: %s", e)
+    return _served['matcher']
+
+
+def annotate(texts, results):
+    """Add the indicators found in each text to its prediction result"""
+    matcher = get_indicator_matcher()
+    if matcher is None:
+        return results
+    for text, result in zip(texts, results):
+        result['indicators'] = matcher.match(text)
+    return results
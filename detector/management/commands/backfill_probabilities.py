@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from detector.ml_model import ScamDetector, predict_results
+from detector.models import DetectionHistory
+
+
+class Command(BaseCommand):
+    help = 'Store prediction probabilities on detections recorded before they were kept'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of detections to score and update at a time'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        # Scored straight from the model: no prediction cache, campaign or
+        # indicator lookups, and the probabilities the history pages average.
+        detector = ScamDetector()
+        if not detector.is_trained:
+            raise CommandError('Model not trained. Run train_model first.')
+
+        missing = DetectionHistory.objects.filter(probability_spam__isnull=True) | \
+            DetectionHistory.objects.filter(probability_ham__isnull=True)
+        updated = 0
+        last_id = 0
+        while True:
+            batch = list(
+                missing.filter(id__gt=last_id).order_by('id').only('id', 'text')[:options['batch_size']]
+            )
+            if not batch:
+                break
+            results = predict_results(detector.model, [detection.text for detection in batch])
+            for detection, result in zip(batch, results):
+                detection.probability_spam = result['probability_spam']
+                detection.probability_ham = result['probability_ham']
+                detection.model_version = detector.model_version
+            DetectionHistory.objects.bulk_update(batch, ['probability_spam', 'probability_ham', 'model_version'])
+            updated += len(batch)
+            last_id = batch[-1].id
+
+        remaining = missing.count()
+        if remaining:
+            raise CommandError(f'{remaining} detections still have no probabilities')
+        self.stdout.write(self.style.SUCCESS(
+            f'Stored probabilities on {updated} detections with model {str(detector.model_version)[:12]}'
+        ))
+        if updated:
+            self.stdout.write('Run rollup_statistics --rebuild so the dashboards include them.')
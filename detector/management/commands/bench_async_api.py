@@ -0,0 +1,109 @@
+import asyncio
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.test import AsyncRequestFactory, RequestFactory
+
+from detector import async_views, views
+from detector.ml_model import get_scam_detector
+from detector.models import DetectionHistory
+from detector.write_buffer import get_write_buffer
+
+BENCH_MARKER = '[bench-async-api]'
+SAMPLE_TEXTS = [
+    'Congratulations! You have won a free cruise. Call now to claim your prize.',
+    'Hi, are we still meeting for lunch tomorrow at the usual place?',
+    'URGENT: your account has been suspended, verify your details at this link.',
+    'Thanks for the update, I will review the document tonight.',
+]
+
+
+def _summary(latencies, wall):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'wall_seconds': wall,
+        'requests_per_second': len(latencies) / wall if wall else None,
+        'latency_ms': {
+            'mean': statistics.mean(latencies) * 1000,
+            'p50': latencies[len(latencies) // 2] * 1000,
+            'p95': latencies[int(len(latencies) * 0.95) - 1] * 1000,
+            'max': latencies[-1] * 1000,
+        },
+    }
+
+
+class Command(BaseCommand):
+    help = 'Compare api_detect under the sync (WSGI, thread per request) and async (ASGI) views'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per run')
+        parser.add_argument('--concurrency', type=int, default=20, help='Requests in flight at once')
+
+    def _bodies(self, n):
+        return [
+            json.dumps({'text': f'{BENCH_MARKER} {SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)]}'})
+            for i in range(n)
+        ]
+
+    def _run_sync(self, bodies, concurrency):
+        factory = RequestFactory()
+
+        def one(body):
+            request = factory.post('/api/detect/', data=body, content_type='application/json')
+            request.user = AnonymousUser()
+            start = time.perf_counter()
+            response = views.api_detect(request)
+            assert response.status_code == 200, response.content
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            latencies = list(pool.map(one, bodies))
+        return _summary(latencies, time.perf_counter() - start)
+
+    def _run_async(self, bodies, concurrency):
+        factory = AsyncRequestFactory()
+
+        async def main():
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def one(body):
+                async with semaphore:
+                    request = factory.post('/api/detect/', data=body, content_type='application/json')
+                    request.user = AnonymousUser()
+                    start = time.perf_counter()
+                    response = await async_views.api_detect(request)
+                    assert response.status_code == 200, response.content
+                    return time.perf_counter() - start
+
+            start = time.perf_counter()
+            latencies = await asyncio.gather(*(one(body) for body in bodies))
+            return _summary(latencies, time.perf_counter() - start)
+
+        return asyncio.run(main())
+
+    def handle(self, *args, **options):
+        detector = get_scam_detector()
+        if not detector.is_trained:
+            detector.train()
+        # Measure inference, not the prediction cache
+        cache, detector.cache = detector.cache, None
+        bodies = self._bodies(options['requests'])
+        try:
+            report = {
+                'concurrency': options['concurrency'],
+                'wsgi_sync': self._run_sync(bodies, options['concurrency']),
+                'asgi_async': self._run_async(bodies, options['concurrency']),
+            }
+        finally:
+            detector.cache = cache
+            buffer = get_write_buffer()
+            if buffer is not None:
+                buffer.flush()
+            DetectionHistory.objects.filter(text__startswith=BENCH_MARKER).delete()
+        self.stdout.write(json.dumps(report, indent=2))
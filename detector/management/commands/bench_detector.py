@@ -0,0 +1,318 @@
+import csv
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+
+from detector import metrics
+from detector.corpus import iter_chunks, iter_records, split_chunks
+from detector.ml_model import get_scam_detector
+from detector.models import DetectionHistory
+from detector.write_buffer import get_write_buffer
+
+BENCH_MARKER = '[bench-detector]'
+# Bump when fields are renamed or change meaning, so old reports are not compared blindly
+REPORT_VERSION = 1
+
+
+def _percentiles(seconds):
+    """p50/p95/p99/max in milliseconds (nearest rank)"""
+    seconds = sorted(seconds)
+    if not seconds:
+        return {}
+
+    def rank(p):
+        return seconds[min(len(seconds) - 1, max(0, int(round(p / 100 * len(seconds))) - 1))] * 1000
+
+    return {
+        'mean': sum(seconds) / len(seconds) * 1000,
+        'p50': rank(50),
+        'p95': rank(95),
+        'p99': rank(99),
+        'max': seconds[-1] * 1000,
+    }
+
+
+def _peak_rss_mb():
+    """Peak resident set size of this process so far, or None where unsupported"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def synthetic_corpus(source_path, n_messages, out_path, seed=42):
+    """
+    Write n_messages labelled messages to out_path (spam.csv layout). Labels
+    follow the source's class balance; each message takes the length of a
+    random source message of its class and words drawn from that class's
+    words, so the vocabulary and class overlap look like the real corpus.
+    """
+    import numpy as np
+    words, lengths = {}, {}
+    for text, label in iter_records(source_path):
+        tokens = text.split()
+        words.setdefault(label, []).extend(tokens)
+        lengths.setdefault(label, []).append(len(tokens))
+    if not words:
+        raise CommandError(f'No messages in {source_path}')
+    labels = sorted(words)
+    rng = np.random.default_rng(seed)
+    weights = np.array([len(lengths[label]) for label in labels], dtype=np.float64)
+    drawn_labels = rng.choice(len(labels), size=n_messages, p=weights / weights.sum())
+    pools = {label: np.array(words[label], dtype=object) for label in labels}
+    with open(out_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['v1', 'v2'])
+        for i, label in enumerate(labels):
+            count = int((drawn_labels == i).sum())
+            message_lengths = rng.choice(np.maximum(lengths[label], 1), size=count)
+            pool = pools[label]
+            drawn = pool[rng.integers(0, len(pool), size=int(message_lengths.sum()))]
+            start = 0
+            for length in message_lengths:
+                writer.writerow([label, ' '.join(drawn[start:start + length])])
+                start += length
+    return out_path
+
+
+class Command(BaseCommand):
+    help = 'Benchmark fit, load, prediction latency/throughput and api_detect; prints a JSON report'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--csv-path',
+            type=str,
+            default='spam.csv',
+            help='Labelled corpus (CSV or JSONL, optionally gzipped)'
+        )
+        parser.add_argument(
+            '--messages',
+            type=int,
+            help='Benchmark on a synthetic corpus of this many messages generated from --csv-path'
+        )
+        parser.add_argument(
+            '--predict-samples',
+            type=int,
+            default=2000,
+            help='Single-text predictions to time'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Texts per predict() call in the throughput run'
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=200,
+            help='api_detect requests to time (0 skips the request benchmark)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Processes for counting during fit'
+        )
+        parser.add_argument(
+            '--no-cache',
+            action='store_true',
+            help='Fit from the corpus text instead of its pre-tokenized cache'
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            help='Also write the report to this file'
+        )
+
+    def handle(self, *args, **options):
+        from detector.corpus_cache import load_or_build
+        from detector.model_store import load_artifact, save_artifact
+        from detector.naive_bayes_scratch import build_model
+
+        if not os.path.exists(options['csv_path']):
+            raise CommandError(f"{options['csv_path']} not found")
+        tmp_dir = tempfile.mkdtemp(prefix='bench-detector-')
+        try:
+            corpus_path = options['csv_path']
+            report = {'report_version': REPORT_VERSION, 'started_at': datetime.now(timezone.utc).isoformat()}
+            if options['messages']:
+                start = time.perf_counter()
+                corpus_path = synthetic_corpus(
+                    options['csv_path'], options['messages'], os.path.join(tmp_dir, 'synthetic.csv')
+                )
+                report['synthetic_seconds'] = time.perf_counter() - start
+
+            corpus = None
+            if not options['no_cache']:
+                # First use builds the cache; later runs only hash the source and map the arrays
+                start = time.perf_counter()
+                # A synthetic corpus is thrown away afterwards, and so is its cache
+                cache_root = os.path.join(tmp_dir, 'corpus_cache') if options['messages'] else None
+                corpus = load_or_build(corpus_path, root=cache_root)
+                if corpus is not None:
+                    report['corpus_cache'] = {
+                        'load_or_build_seconds': time.perf_counter() - start,
+                        'tokens': corpus.meta['tokens'],
+                        'bytes': sum(
+                            os.path.getsize(os.path.join(corpus.path, name)) for name in os.listdir(corpus.path)
+                        ),
+                    }
+
+            # Fit on the train split, from the corpus cache or the same
+            # streaming path train_model falls back to
+            model = build_model(getattr(settings, 'SCAM_DETECTOR_TOKENIZER', None))
+            start = time.perf_counter()
+            if corpus is not None:
+                corpus.fit(model, ~corpus.split_mask())
+            else:
+                model.fit_chunks(split_chunks(iter_chunks(corpus_path)), n_jobs=options['workers'])
+            fit_seconds = time.perf_counter() - start
+            train_samples = sum(model.class_doc_counts.values())
+            report['fit'] = {
+                'seconds': fit_seconds,
+                'messages_per_second': train_samples / fit_seconds if fit_seconds else None,
+                'source': 'corpus_cache' if corpus is not None else 'text',
+                'workers': options['workers'],
+                'peak_rss_mb': _peak_rss_mb(),
+            }
+
+            X_test, y_test = [], []
+            for texts, labels in split_chunks(iter_chunks(corpus_path), test=True):
+                X_test.extend(texts)
+                y_test.extend(labels)
+            if not X_test:
+                raise CommandError('The test split is empty; use a larger corpus')
+            report['corpus'] = {
+                'path': options['csv_path'],
+                'synthetic_messages': options['messages'],
+                'train_samples': train_samples,
+                'test_samples': len(X_test),
+                'vocab_size': model.vocab_size,
+                'tokenizer': model.tokenizer_config(),
+            }
+
+            # Load the artifact the way a worker does (memory-mapped)
+            artifact_path = os.path.join(tmp_dir, 'model')
+            save_artifact(model, artifact_path)
+            start = time.perf_counter()
+            model, _ = load_artifact(artifact_path)
+            load_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            model.predict(X_test[:1], return_confidence=True)
+            report['load'] = {
+                'ms': load_seconds * 1000,
+                'first_prediction_ms': (time.perf_counter() - start) * 1000,
+                'artifact_bytes': sum(
+                    os.path.getsize(os.path.join(artifact_path, name)) for name in os.listdir(artifact_path)
+                ),
+            }
+
+            # One text per call, as api_detect scores it
+            samples = [X_test[i % len(X_test)] for i in range(options['predict_samples'])]
+            latencies = []
+            for text in samples:
+                start = time.perf_counter()
+                model.predict([text], return_confidence=True)
+                latencies.append(time.perf_counter() - start)
+            report['predict_latency_ms'] = {'samples': len(latencies), **_percentiles(latencies)}
+            report['instrumentation'] = self._instrumentation_overhead(model, samples)
+
+            y_pred = []
+            start = time.perf_counter()
+            for i in range(0, len(X_test), options['batch_size']):
+                y_pred.extend(model.predict(X_test[i:i + options['batch_size']]))
+            batch_seconds = time.perf_counter() - start
+            report['batch'] = {
+                'batch_size': options['batch_size'],
+                'texts': len(X_test),
+                'seconds': batch_seconds,
+                'texts_per_second': len(X_test) / batch_seconds if batch_seconds else None,
+                'accuracy': sum(p == t for p, t in zip(y_pred, y_test)) / len(y_test),
+            }
+
+            if options['requests']:
+                report['api_detect'] = self._bench_api(X_test, options['requests'])
+            report['peak_rss_mb'] = _peak_rss_mb()
+            report['environment'] = {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+            }
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        self.stdout.write(output)
+
+    def _instrumentation_overhead(self, model, samples):
+        """Single-text predict latency with the metrics spans on and off, interleaved"""
+        enabled, disabled = [], []
+        previous = metrics.is_enabled()
+        try:
+            for i, text in enumerate(samples):
+                # Alternate which run goes first, so neither always gets the warm caches
+                runs = ((True, enabled), (False, disabled))
+                for on, latencies in (runs if i % 2 else runs[::-1]):
+                    metrics.set_enabled(on)
+                    start = time.perf_counter()
+                    model.predict([text], return_confidence=True)
+                    latencies.append(time.perf_counter() - start)
+        finally:
+            metrics.set_enabled(previous)
+        enabled_p50 = _percentiles(enabled)['p50']
+        disabled_p50 = _percentiles(disabled)['p50']
+        return {
+            'span_ns': metrics.span_overhead_ns(),
+            'predict_p50_ms_enabled': enabled_p50,
+            'predict_p50_ms_disabled': disabled_p50,
+            'overhead_us': (enabled_p50 - disabled_p50) * 1000,
+            'overhead_percent': (enabled_p50 - disabled_p50) / disabled_p50 * 100 if disabled_p50 else None,
+        }
+
+    def _bench_api(self, texts, n_requests):
+        """Full request cycle (middleware, view, history write) against the served model"""
+        detector = get_scam_detector()
+        if not detector.is_trained:
+            raise CommandError('No trained model is served. Run train_model first.')
+        # Measure inference, not the prediction cache
+        cache, detector.cache = detector.cache, None
+        client = Client()
+        url = reverse('detector:api_detect')
+        latencies = []
+        try:
+            for i in range(n_requests):
+                body = json.dumps({'text': f'{BENCH_MARKER} {texts[i % len(texts)]}'})
+                start = time.perf_counter()
+                response = client.post(url, data=body, content_type='application/json')
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    raise CommandError(f'api_detect returned {response.status_code}: {response.content[:200]}')
+        finally:
+            detector.cache = cache
+            buffer = get_write_buffer()
+            if buffer is not None:
+                buffer.flush()
+            DetectionHistory.objects.filter(text__startswith=BENCH_MARKER).delete()
+        return {
+            'requests': n_requests,
+            'model_version': detector.model_version,
+            'latency_ms': _percentiles(latencies),
+            'requests_per_second': n_requests / sum(latencies),
+        }
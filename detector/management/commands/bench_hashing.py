@@ -0,0 +1,78 @@
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from detector.corpus import iter_chunks, split_chunks
+from detector.naive_bayes_scratch import HashingNaiveBayes, NaiveBayesAlgorithmFromScratch
+
+
+def _serving_bytes(model):
+    """Compiled arrays plus, for the vocabulary model, its token -> column dict."""
+    compiled = model._compiled
+    size = sum(compiled[name].nbytes for name in ('vocab', 'counts', 'log_lik') if compiled.get(name) is not None)
+    index = compiled.get('index')
+    if index is not None:
+        size += sys.getsizeof(index) + sum(sys.getsizeof(key) for key in index)
+    return size
+
+
+def _training_bytes(model):
+    """Approximate size of the state kept for partial_fit (dicts or bucket arrays)."""
+    if isinstance(model, HashingNaiveBayes):
+        return sum(counts.nbytes for counts in model.bucket_counts.values())
+    size = sys.getsizeof(model.vocab) + sum(sys.getsizeof(word) for word in model.vocab)
+    for counts in model.word_counts.values():
+        size += sys.getsizeof(counts) + sum(sys.getsizeof(n) for n in counts.values())
+    return size
+
+
+class Command(BaseCommand):
+    help = 'Compare accuracy, memory and speed of the vocabulary and feature-hashing models'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--csv-path',
+            type=str,
+            default='spam.csv',
+            help='Labelled corpus (CSV or JSONL, optionally gzipped)'
+        )
+        parser.add_argument(
+            '--buckets',
+            type=str,
+            default='1024,4096,16384,65536,262144,1048576',
+            help='Comma-separated bucket counts to try'
+        )
+
+    def _run(self, model, train_chunks, X_test, y_test):
+        start = time.perf_counter()
+        model.fit_chunks(train_chunks)
+        fit_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        accuracy = model.score(X_test, y_test)
+        predict_seconds = time.perf_counter() - start
+        return {
+            'model': type(model).__name__,
+            **model.tokenizer_config(),
+            'features': model.vocab_size,
+            'accuracy': accuracy,
+            'serving_bytes': _serving_bytes(model),
+            'training_bytes': _training_bytes(model),
+            'fit_seconds': fit_seconds,
+            'predict_us_per_text': predict_seconds / len(X_test) * 1e6,
+        }
+
+    def handle(self, *args, **options):
+        train_chunks = list(split_chunks(iter_chunks(options['csv_path'])))
+        X_test, y_test = [], []
+        for texts, labels in split_chunks(iter_chunks(options['csv_path']), test=True):
+            X_test.extend(texts)
+            y_test.extend(labels)
+
+        results = [self._run(NaiveBayesAlgorithmFromScratch(), train_chunks, X_test, y_test)]
+        for n_buckets in [int(value) for value in options['buckets'].split(',')]:
+            for bigrams in (False, True):
+                model = HashingNaiveBayes(n_buckets=n_buckets, bigrams=bigrams)
+                results.append(self._run(model, train_chunks, X_test, y_test))
+        self.stdout.write(json.dumps({'test_samples': len(y_test), 'results': results}, indent=2))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from detector import query_plans
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN the DetectionHistory queries behind the history pages; fails on a full table scan or sort'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verbose-plans',
+            action='store_true',
+            help='Print every query plan, not only the failing ones'
+        )
+
+    def handle(self, *args, **options):
+        if not query_plans.supported():
+            raise CommandError(
+                f'Query plan checks support {", ".join(query_plans.PROBLEMS)}, not {connection.vendor}'
+            )
+
+        failures = []
+        for name, queryset, plan, problems in query_plans.check_plans():
+            if problems:
+                failures.append(name)
+                self.stdout.write(self.style.ERROR(f"{name}: {', '.join(problems)}"))
+            else:
+                self.stdout.write(f'{name}: ok')
+            if problems or options['verbose_plans']:
+                self.stdout.write(f'    {queryset.query}')
+                self.stdout.write('    ' + plan.replace('\n', '\n    '))
+
+        if failures:
+            raise CommandError(f'{len(failures)} of the history queries cannot use an index')
+        self.stdout.write(self.style.SUCCESS('Every history query is served by an index.'))
@@ -0,0 +1,130 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from detector.bulk_classify import CHECKPOINT_SUFFIX, FORMATS, OUTPUT_FORMATS, classify_file, read_checkpoint
+from detector.ml_model import get_scam_detector
+
+
+class Command(BaseCommand):
+    help = 'Classify a large CSV, JSONL or mbox dump with the served model, streaming results to NDJSON or CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'input',
+            type=str,
+            help='Messages to classify (CSV, JSONL or mbox, optionally gzipped)'
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            required=True,
+            help='File the results are written to'
+        )
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            help='Input format (default: from the file extension)'
+        )
+        parser.add_argument(
+            '--output-format',
+            choices=OUTPUT_FORMATS,
+            default='ndjson',
+            help='Output format'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Processes used to score the messages'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Messages per task sent to a worker (and per checkpoint)'
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Continue an interrupted run from its last checkpoint'
+        )
+        parser.add_argument(
+            '--overwrite',
+            action='store_true',
+            help='Replace an existing output file'
+        )
+        parser.add_argument(
+            '--text-column',
+            type=str,
+            default='text',
+            help='CSV column or JSON field holding the message'
+        )
+        parser.add_argument(
+            '--id-column',
+            type=str,
+            default='id',
+            help='CSV column or JSON field copied to the results as id'
+        )
+        parser.add_argument(
+            '--include-text',
+            action='store_true',
+            help='Copy each message into the results'
+        )
+        parser.add_argument(
+            '--progress-interval',
+            type=float,
+            default=10.0,
+            help='Seconds between progress lines'
+        )
+
+    def handle(self, *args, **options):
+        input_path, output_path = options['input'], options['output']
+        if not os.path.exists(input_path):
+            raise CommandError(f'{input_path} not found')
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+        resume = options['resume'] and read_checkpoint(output_path) is not None
+        if options['resume'] and not resume and os.path.exists(output_path):
+            raise CommandError(f'{output_path} has no {CHECKPOINT_SUFFIX} file to resume from; use --overwrite')
+        if not resume and os.path.exists(output_path) and not options['overwrite']:
+            raise CommandError(f'{output_path} already exists; use --resume or --overwrite')
+
+        detector = get_scam_detector()
+        if not detector.is_trained:
+            raise CommandError('Model not trained. Run train_model first.')
+
+        def progress(stats):
+            if stats['finished']:
+                return
+            self.stdout.write(
+                f"{stats['next_offset']} messages done ({stats['classified']} this run, {stats['scams']} scams), "
+                f"{stats['messages_per_second']:.0f} messages/s"
+            )
+
+        try:
+            stats = classify_file(
+                input_path,
+                output_path,
+                detector.model,
+                model_version=detector.model_version,
+                fmt=options['format'],
+                output_format=options['output_format'],
+                n_jobs=options['workers'],
+                chunk_size=options['chunk_size'],
+                resume=resume,
+                text_column=options['text_column'],
+                id_column=options['id_column'],
+                include_text=options['include_text'],
+                progress=progress,
+                progress_interval=options['progress_interval'],
+            )
+        except Exception as e:
+            raise CommandError(f'Classification failed: {e}')
+
+        if resume:
+            self.stdout.write(f"Resumed at message {stats['start_offset']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Classified {stats['classified']} messages ({stats['scams']} scams) in {stats['elapsed_seconds']:.2f}s, "
+            f"{stats['messages_per_second']:.0f} messages/s with {options['workers']} workers -> {output_path}"
+        ))
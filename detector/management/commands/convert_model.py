@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from detector.ml_model import LEGACY_MODEL_PATH, MODEL_PATH
+from detector.model_store import convert_pickle, load_artifact
+
+
+class Command(BaseCommand):
+    help = 'Convert a pickled scam detection model into the memory-mappable artifact format'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--pickle-path',
+            type=str,
+            default=LEGACY_MODEL_PATH,
+            help='Path to the legacy pickled model'
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            default=MODEL_PATH,
+            help='Directory to write the model artifact to'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            meta = convert_pickle(options['pickle_path'], options['output'])
+            # Re-open with hash verification so a bad write is caught here
+            load_artifact(options['output'], verify=True)
+        except Exception as e:
+            self.stdout.write(
+                self.style.ERROR(f'Error converting model: {str(e)}')
+            )
+            return
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Model written to {options['output']}")
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"Vocabulary: {meta['vocab_size']} words, content hash {meta['content_hash'][:12]}")
+        )
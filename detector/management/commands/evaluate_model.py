@@ -0,0 +1,100 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from detector.corpus import DEFAULT_CHUNK_SIZE
+from detector.cross_validation import cross_validate
+
+
+class Command(BaseCommand):
+    help = 'Stratified k-fold cross-validation of the detector, counted and scored in a process pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--csv-path',
+            type=str,
+            default='spam.csv',
+            help='Labelled corpus (CSV or JSONL, optionally gzipped)'
+        )
+        parser.add_argument(
+            '--folds',
+            type=int,
+            default=5,
+            help='Number of folds'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Processes used to count and score the corpus'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Seed for the fold assignment'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help='Records per task sent to a worker'
+        )
+        parser.add_argument(
+            '--no-cache',
+            action='store_true',
+            help='Read the corpus text instead of its pre-tokenized cache'
+        )
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Print the full report as JSON'
+        )
+
+    def handle(self, *args, **options):
+        from detector.corpus_cache import load_or_build
+        from detector.naive_bayes_scratch import build_model
+
+        if not os.path.exists(options['csv_path']):
+            raise CommandError(f"{options['csv_path']} not found")
+        model = build_model(getattr(settings, 'SCAM_DETECTOR_TOKENIZER', None))
+        try:
+            corpus = None if options['no_cache'] else load_or_build(options['csv_path'])
+            report = cross_validate(
+                options['csv_path'],
+                model,
+                k=options['folds'],
+                n_jobs=options['workers'],
+                seed=options['seed'],
+                chunk_size=options['chunk_size'],
+                corpus=corpus,
+            )
+        except Exception as e:
+            raise CommandError(f'Cross-validation failed: {e}')
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        labels = report['aggregate']['pooled']['labels']
+        for fold in report['folds']:
+            f1 = '  '.join(f"{label} f1 {fold['per_class'][label]['f1']:.3f}" for label in labels)
+            self.stdout.write(
+                f"Fold {fold['fold']}: accuracy {fold['accuracy']:.2%}  {f1}  "
+                f"({fold['test_samples']} test / {fold['train_samples']} train, vocab {fold['vocab_size']})"
+            )
+        aggregate = report['aggregate']
+        self.stdout.write(self.style.SUCCESS(
+            f"{report['k']}-fold accuracy: {aggregate['accuracy_mean']:.2%} "
+            f"(std {aggregate['accuracy_std']:.2%}) on {report['samples']} samples"
+        ))
+        for label in labels:
+            self.stdout.write(f"{label} f1: {aggregate['f1_mean'][label]:.3f} (std {aggregate['f1_std'][label]:.3f})")
+        timing = report['timing']
+        self.stdout.write(
+            f"Counted in {timing['count_seconds']:.2f}s, fitted {report['k']} folds in {timing['fit_seconds']:.2f}s, "
+            f"scored in {timing['score_seconds']:.2f}s from {report['source']} with {report['workers']} workers "
+            f"({timing['total_seconds']:.2f}s total)"
+        )
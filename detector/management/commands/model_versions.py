@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from detector.ml_model import get_scam_detector
+from detector.model_registry import activate_version, prune, publish, rollback
+from detector.model_store import ModelArtifactError
+from detector.models import ModelVersion
+
+
+class Command(BaseCommand):
+    help = 'List, publish, activate, roll back or prune versions in the model registry'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'action',
+            choices=['list', 'publish', 'activate', 'rollback', 'prune'],
+            help='list versions; publish the currently loaded model; activate VERSION; '
+                 'rollback to VERSION or the previously active version; prune old inactive versions'
+        )
+        parser.add_argument(
+            'version',
+            nargs='?',
+            help='Version (content hash or unique prefix) for activate, or for rollback'
+        )
+        parser.add_argument(
+            '--keep',
+            type=int,
+            default=5,
+            help='Inactive versions to keep when pruning'
+        )
+
+    def handle(self, *args, **options):
+        action = options['action']
+        try:
+            if action == 'publish':
+                # E.g. a model still loaded from scam_detector_model/ or the legacy pickle
+                detector = get_scam_detector()
+                if not detector.is_trained:
+                    raise CommandError('No trained model loaded. Run train_model first.')
+                detector.save_model(source='publish')
+                self.stdout.write(self.style.SUCCESS(f'Published and activated {detector.model_version[:12]}'))
+            elif action == 'activate':
+                if not options['version']:
+                    raise CommandError('activate needs a VERSION')
+                version = activate_version(options['version'])
+                self.stdout.write(self.style.SUCCESS(f'Activated {version.version[:12]}'))
+            elif action == 'rollback':
+                version = rollback(options['version'])
+                self.stdout.write(self.style.SUCCESS(f'Rolled back to {version.version[:12]}'))
+            elif action == 'prune':
+                removed = prune(options['keep'])
+                self.stdout.write(self.style.SUCCESS(f'Removed {len(removed)} old versions'))
+        except ModelArtifactError as e:
+            raise CommandError(str(e))
+
+        for version in ModelVersion.objects.all():
+            accuracy = f'{version.accuracy:.2%}' if version.accuracy is not None else 'n/a'
+            self.stdout.write(
+                f"{'*' if version.is_active else ' '} {version.version[:12]}  "
+                f"{version.created_at:%Y-%m-%d %H:%M}  accuracy {accuracy}  "
+                f"vocab {version.vocab_size}  {version.source}"
+            )
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from detector.rollups import catch_up, rebuild_all
+
+
+class Command(BaseCommand):
+    help = 'Catch the hourly and daily detection rollups up with detection history (run it from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=10000,
+            help='Number of new detections to roll up per transaction'
+        )
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Drop all rollups and rebuild them from the full history'
+        )
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            rebuild_all()
+            self.stdout.write('Dropped existing rollups')
+
+        total_hours = total_days = 0
+        done = False
+        while not done:
+            hours, days, done = catch_up(batch_size=options['batch_size'])
+            total_hours += hours
+            total_days += days
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt {total_hours} hourly and {total_days} daily rollup buckets')
+        )
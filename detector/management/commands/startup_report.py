@@ -0,0 +1,98 @@
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in a fresh interpreter under -X importtime, so nothing is imported yet.
+# Prints phase timings as JSON on stdout; import timings arrive on stderr.
+CHILD_SCRIPT = r'''
+import json, os, sys, time
+start = time.perf_counter()
+import django
+django.setup()
+setup_done = time.perf_counter()
+from django.urls import get_resolver
+get_resolver().url_patterns
+urls_done = time.perf_counter()
+from detector.ml_model import get_scam_detector
+detector = get_scam_detector()
+load_done = time.perf_counter()
+detector.predict('Congratulations! You have won a free prize, call now to claim.')
+first_done = time.perf_counter()
+detector.predict('Are we still meeting for lunch tomorrow?')
+second_done = time.perf_counter()
+print(json.dumps({
+    'django_setup_ms': (setup_done - start) * 1000,
+    'url_load_ms': (urls_done - setup_done) * 1000,
+    'model_load_ms': (load_done - urls_done) * 1000,
+    'first_prediction_ms': (first_done - load_done) * 1000,
+    'second_prediction_ms': (second_done - first_done) * 1000,
+    'time_to_first_prediction_ms': (first_done - start) * 1000,
+    'model_trained': detector.is_trained,
+    'loaded': {name: name in sys.modules for name in ('numpy', 'pandas', 'sklearn', 'scipy', 'multiprocessing')},
+}))
+'''
+
+
+def parse_importtime(stderr):
+    """[(module, self_us, cumulative_us)] from python -X importtime output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+class Command(BaseCommand):
+    help = 'Measure cold-start import time per module and time to first prediction'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=15,
+            help='Number of slowest modules to list'
+        )
+        parser.add_argument(
+            '--budget-ms',
+            type=float,
+            help='Fail if time to first prediction exceeds this many milliseconds'
+        )
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'scam_detector.settings'))
+        child = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', CHILD_SCRIPT],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        if child.returncode != 0:
+            raise CommandError(f'Startup run failed:\n{child.stderr[-2000:]}')
+        report = json.loads(child.stdout.strip().splitlines()[-1])
+
+        imports = parse_importtime(child.stderr)
+        by_package = defaultdict(int)
+        for name, self_us, _ in imports:
+            by_package[name.split('.')[0]] += self_us
+        report['import_ms_total'] = sum(self_us for _, self_us, _ in imports) / 1000
+        report['import_ms_by_package'] = {
+            name: self_us / 1000
+            for name, self_us in sorted(by_package.items(), key=lambda item: -item[1])[:options['top']]
+        }
+        report['slowest_modules'] = [
+            {'module': name, 'self_ms': self_us / 1000, 'cumulative_ms': cumulative_us / 1000}
+            for name, self_us, cumulative_us in sorted(imports, key=lambda row: -row[1])[:options['top']]
+        ]
+        self.stdout.write(json.dumps(report, indent=2))
+
+        budget = options['budget_ms']
+        if budget is not None and report['time_to_first_prediction_ms'] > budget:
+            raise CommandError(
+                f"Time to first prediction {report['time_to_first_prediction_ms']:.0f} ms "
+                f"exceeds the {budget:.0f} ms budget"
+            )
@@ -17,6 +17,27 @@ class Command(BaseCommand):
             action='store_true',
             help='Save the trained model to disk'
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Number of processes used to count the training corpus'
+        )
+        parser.add_argument(
+            '--min-df',
+            type=int,
+            help='Drop words found in fewer training messages (overrides SCAM_DETECTOR_TOKENIZER)'
+        )
+        parser.add_argument(
+            '--max-features',
+            type=int,
+            help='Keep at most this many words (overrides SCAM_DETECTOR_TOKENIZER)'
+        )
+        parser.add_argument(
+            '--selection',
+            choices=['frequency', 'chi2', 'mutual_info'],
+            help='How --max-features ranks words (overrides SCAM_DETECTOR_TOKENIZER)'
+        )
 
     def handle(self, *args, **options):
         self.stdout.write(
@@ -26,9 +47,20 @@ class Command(BaseCommand):
         try:
             # Get the scam detector instance
             detector = get_scam_detector()
+            overrides = {
+                key: options[option]
+                for key, option in (('MIN_DF', 'min_df'), ('MAX_FEATURES', 'max_features'), ('SELECTION', 'selection'))
+                if options[option] is not None
+            }
+            if overrides:
+                detector.tokenizer = {**(detector.tokenizer or {}), **overrides}
             
-            # Train the model
-            accuracy = detector.train(csv_path=options['csv_path'])
+            # Train the model (always retrain, even if a saved model was loaded)
+            accuracy = detector.train(
+                csv_path=options['csv_path'],
+                force_retrain=True,
+                workers=options['workers'],
+            )
             
             self.stdout.write(
                 self.style.SUCCESS(f'Model training completed successfully!')
@@ -36,10 +68,15 @@ class Command(BaseCommand):
             self.stdout.write(
                 self.style.SUCCESS(f'Accuracy: {accuracy:.2%}')
             )
+            if detector.model.unpruned_vocab_size is not None:
+                self.stdout.write(
+                    f'Vocabulary pruned from {detector.model.unpruned_vocab_size} '
+                    f'to {detector.model.vocab_size} words'
+                )
             
             # Save the model if requested
             if options['save_model']:
-                detector.save_model()
+                detector.save_model(source='train_model')
                 self.stdout.write(
                     self.style.SUCCESS('Model saved to disk successfully!')
                 )
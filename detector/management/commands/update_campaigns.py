@@ -0,0 +1,109 @@
+import time
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from detector import campaigns
+from detector.models import DetectionHistory, ScamReport
+
+
+class Command(BaseCommand):
+    help = 'Fold newly confirmed scams into the near-duplicate campaign index'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of rows to read at a time'
+        )
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Start a new index from all confirmed scams (needed after changing NUM_PERM, BANDS or SHINGLE_SIZE)'
+        )
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=0,
+            help='List the N largest campaigns instead of updating'
+        )
+
+    def handle(self, *args, **options):
+        config = campaigns.get_config()
+        if options['top']:
+            self._list_top(campaigns.load(config=config), options['top'])
+            return
+
+        if options['rebuild']:
+            index = campaigns.CampaignIndex(config)
+        else:
+            index = campaigns.load(config=config, writable=True)
+            hasher = index.hasher
+            if (hasher.num_perm, hasher.bands, hasher.shingle_size) != (
+                    config['NUM_PERM'], config['BANDS'], config['SHINGLE_SIZE']):
+                raise CommandError('The index was built with other MinHash settings; run with --rebuild')
+        watermark = dict(index.watermark)
+        outcomes = {'duplicate': 0, 'entry': 0, 'campaign': 0, None: 0}
+        start = time.perf_counter()
+
+        # Scam verdicts confirmed by the user, and ham verdicts they marked wrong
+        feedback = DetectionHistory.objects.filter(
+            Q(is_scam=True, user_feedback='correct') | Q(is_scam=False, user_feedback='incorrect'),
+            feedback_at__isnull=False,
+        )
+        if watermark.get('feedback_at'):
+            feedback = feedback.filter(feedback_at__gt=parse_datetime(watermark['feedback_at']))
+        rows = feedback.order_by('feedback_at').values_list('id', 'text', 'detected_at', 'feedback_at')
+        for detection_id, text, detected_at, feedback_at in rows.iterator(chunk_size=options['batch_size']):
+            added = index.add(text, detected_at.timestamp(), campaigns.SOURCE_DETECTION, detection_id)
+            outcomes[added and added[1]] += 1
+            watermark['feedback_at'] = feedback_at.isoformat()
+
+        reports = ScamReport.objects.filter(is_verified=True, verified_at__isnull=False)
+        if watermark.get('verified_at'):
+            reports = reports.filter(verified_at__gt=parse_datetime(watermark['verified_at']))
+        rows = reports.order_by('verified_at').values_list('id', 'description', 'reported_at', 'verified_at')
+        for report_id, description, reported_at, verified_at in rows.iterator(chunk_size=options['batch_size']):
+            added = index.add(description, reported_at.timestamp(), campaigns.SOURCE_REPORT, report_id)
+            outcomes[added and added[1]] += 1
+            watermark['verified_at'] = verified_at.isoformat()
+
+        confirmed = sum(outcomes.values())
+        self.stdout.write(
+            f"New confirmed scams: {confirmed} ({outcomes['campaign']} new campaigns, "
+            f"{outcomes['entry']} new variants, {outcomes['duplicate']} near duplicates, "
+            f"{outcomes[None]} without words)"
+        )
+        if not confirmed and not options['rebuild']:
+            self.stdout.write(self.style.SUCCESS('Campaign index is up to date.'))
+            return
+
+        index.watermark = watermark
+        try:
+            path = index.save(config['PATH'])
+        except Exception as e:
+            raise CommandError(f'Error saving the campaign index: {e}')
+        self.stdout.write(self.style.SUCCESS(
+            f"Campaign index now holds {index.n_campaigns} campaigns in {index.n_entries} "
+            f"entries ({path}, {time.perf_counter() - start:.2f}s)"
+        ))
+
+    def _list_top(self, index, n):
+        if not index.n_campaigns:
+            self.stdout.write('The campaign index is empty. Run update_campaigns first.')
+            return
+        for position in index.members.argsort(kind='stable')[::-1][:n].tolist():
+            campaign_id = int(index.campaign_ids[position])
+            campaign = index.campaign(campaign_id)
+            if campaign['source_kind'] == campaigns.SOURCE_REPORT:
+                sample = ScamReport.objects.filter(id=campaign['source_id']).values_list('description', flat=True)
+            else:
+                sample = DetectionHistory.objects.filter(id=campaign['source_id']).values_list('text', flat=True)
+            sample = (sample.first() or '(deleted)').replace('\n', ' ')
+            last_seen = datetime.fromtimestamp(campaign['last_seen'], timezone.utc)
+            self.stdout.write(
+                f"#{campaign_id}: {campaign['members']} messages, last seen {last_seen:%Y-%m-%d %H:%M} - {sample[:80]}"
+            )
@@ -0,0 +1,149 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from detector.ml_model import get_scam_detector
+from detector.models import DetectionHistory, ScamReport
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _feedback_label(is_scam, user_feedback):
+    # A wrong verdict teaches the opposite label
+    return 'spam' if is_scam == (user_feedback == 'correct') else 'ham'
+
+
+def _adopt_untracked_feedback(feedback):
+    """
+    Record the label of feedback the model learned before trained_label
+    existed. Everything up to the watermark was learned with its current
+    label, since changing the feedback moves feedback_at past it.
+    """
+    untracked = feedback.filter(trained_label='')
+    untracked.filter(Q(is_scam=True, user_feedback='correct') | Q(is_scam=False, user_feedback='incorrect')) \
+        .update(trained_label='spam')
+    untracked.filter(Q(is_scam=False, user_feedback='correct') | Q(is_scam=True, user_feedback='incorrect')) \
+        .update(trained_label='ham')
+
+
+class Command(BaseCommand):
+    help = 'Fold user feedback and verified scam reports into the trained model since the last update'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of rows to read and tokenize at a time'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Count the new samples without updating the model'
+        )
+
+    def handle(self, *args, **options):
+        detector = get_scam_detector()
+        if not detector.is_trained:
+            self.stdout.write(
+                self.style.ERROR('No trained model found. Run train_model first.')
+            )
+            return
+
+        watermark = dict(detector.training_watermark)
+        counts = (Counter(), {}, Counter())  # As returned by model.count()
+        doc_counts = counts[0]
+        unlearned = (Counter(), {}, Counter())  # Feedback taught earlier with the other label
+        applied = {'spam': [], 'ham': []}  # Detection ids by the label they now teach
+
+        def absorb(texts, labels, totals=counts):
+            detector.model.merge_counts(totals, detector.model.count(texts, labels))
+
+        # Detections the user marked as correct or incorrect
+        feedback = DetectionHistory.objects.filter(
+            user_feedback__in=['correct', 'incorrect'],
+            feedback_at__isnull=False,
+        )
+        # trained_label describes this model only if it has learned feedback
+        # before; a freshly trained model has not seen any of it.
+        trained_labels_apply = bool(watermark.get('feedback_at'))
+        if trained_labels_apply:
+            last_feedback_at = parse_datetime(watermark['feedback_at'])
+            if not options['dry_run']:
+                _adopt_untracked_feedback(feedback.filter(feedback_at__lte=last_feedback_at))
+            feedback = feedback.filter(feedback_at__gt=last_feedback_at)
+        rows = feedback.order_by('feedback_at').values_list(
+            'id', 'text', 'is_scam', 'user_feedback', 'feedback_at', 'trained_label'
+        )
+        for batch in _batches(rows.iterator(chunk_size=options['batch_size']), options['batch_size']):
+            learn, unlearn = ([], []), ([], [])
+            for detection_id, text, is_scam, user_feedback, _, trained_label in batch:
+                label = _feedback_label(is_scam, user_feedback)
+                previous = trained_label if trained_labels_apply else ''
+                if previous == label:
+                    continue  # Same feedback given again
+                if previous:
+                    unlearn[0].append(text)
+                    unlearn[1].append(previous)
+                learn[0].append(text)
+                learn[1].append(label)
+                applied[label].append(detection_id)
+            absorb(*learn)
+            if unlearn[0]:
+                absorb(*unlearn, totals=unlearned)
+            watermark['feedback_at'] = batch[-1][4].isoformat()
+
+        # Verified scam reports are spam by definition
+        reports = ScamReport.objects.filter(is_verified=True, verified_at__isnull=False)
+        if watermark.get('verified_at'):
+            reports = reports.filter(verified_at__gt=parse_datetime(watermark['verified_at']))
+        rows = reports.order_by('verified_at').values_list('description', 'verified_at')
+        for batch in _batches(rows.iterator(chunk_size=options['batch_size']), options['batch_size']):
+            absorb([text for text, _ in batch], ['spam'] * len(batch))
+            watermark['verified_at'] = batch[-1][1].isoformat()
+
+        new_samples = sum(doc_counts.values())
+        relabelled = sum(unlearned[0].values())
+        self.stdout.write(
+            f"New samples: {new_samples} "
+            f"({doc_counts.get('spam', 0)} spam, {doc_counts.get('ham', 0)} ham, "
+            f"{relabelled} of them relabelled feedback)"
+        )
+        if not new_samples:
+            self.stdout.write(self.style.SUCCESS('Model is up to date.'))
+            return
+        if options['dry_run']:
+            return
+
+        try:
+            if relabelled:
+                # Remove what the old label taught before teaching the new one
+                detector.model.unlearn_counts(*unlearned[:2])
+            detector.model.partial_fit_counts(*counts)
+            detector.training_watermark = watermark
+            detector.save_model(source='update_model')
+            for label, ids in applied.items():
+                for start in range(0, len(ids), options['batch_size']):
+                    DetectionHistory.objects.filter(
+                        id__in=ids[start:start + options['batch_size']]
+                    ).update(trained_label=label)
+        except Exception as e:
+            self.stdout.write(
+                self.style.ERROR(f'Error updating model: {str(e)}')
+            )
+            return
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Model updated; vocabulary is now {detector.model.vocab_size} words.')
+        )
@@ -0,0 +1,240 @@
+"""
+In-process timing histograms and counters, exposed at /metrics in the
+Prometheus text format.
+
+Request handling is split into stages, each timed with a span:
+
+    with span('parse'):
+        data = json.loads(request.body)
+
+Stages: parse (request JSON), preprocess (tokenizing and vocabulary
+lookup), predict_proba (scoring), cache (prediction cache lookup),
+campaign (near-duplicate campaign lookup), indicators (reported contact
+matching), history (handing DetectionHistory rows to the write buffer, or
+inserting them when it is off), statistics (the ScamStatistics update) and
+flush (the write buffer's bulk insert). MetricsMiddleware times whole requests
+per URL name.
+
+A span costs two perf_counter() calls, a bisect over the bucket bounds and
+an uncontended lock; `manage.py bench_detector` reports the overhead.
+Values are per process: with several workers, each one serves its own.
+
+Only the standard library is used, so the model modules can record spans
+without importing Django. Configured by settings.SCAM_DETECTOR_METRICS
+(see DetectorConfig.ready).
+"""
+import threading
+import time
+from bisect import bisect_left
+
+# Seconds; suited to stages from a few microseconds up to slow requests
+DEFAULT_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+)
+
+_enabled = True
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, labels=()):
+        if not _enabled:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    """Fixed-bucket histogram; buckets are stored non-cumulative and summed on render"""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.bounds = tuple(sorted(buckets))
+        self._series = {}  # labels -> [bucket counts..., sum]
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, labels=()):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._new_series(labels)
+        index = bisect_left(self.bounds, seconds)
+        with self._lock:
+            series[index] += 1
+            series[-1] += seconds
+
+    def _new_series(self, labels):
+        with self._lock:
+            return self._series.setdefault(labels, [0] * (len(self.bounds) + 1) + [0.0])
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def snapshot(self, labels=()):
+        """(count, sum) for one series"""
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                return 0, 0.0
+            return sum(series[:-1]), series[-1]
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((labels, list(values)) for labels, values in self._series.items())
+        names = self.labelnames + ('le',)
+        for labels, values in series:
+            cumulative = 0
+            for bound, count in zip(self.bounds + (float('inf'),), values[:-1]):
+                cumulative += count
+                lines.append(
+                    f'{self.name}_bucket{_format_labels(names, labels + (_format_value(bound),))} {cumulative}'
+                )
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f'{self.name}_sum{label_text} {_format_value(values[-1])}')
+            lines.append(f'{self.name}_count{label_text} {cumulative}')
+        return lines
+
+
+class _Span:
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, self.labels)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+STAGE_SECONDS = Histogram(
+    'scam_detector_stage_seconds',
+    'Time spent in each stage of handling a detection.',
+    labelnames=('stage',),
+)
+REQUEST_SECONDS = Histogram(
+    'scam_detector_request_seconds',
+    'Time to handle a request, by URL name.',
+    labelnames=('view', 'method', 'status'),
+)
+PREDICTIONS = Counter(
+    'scam_detector_predictions_total',
+    'Texts scored, by verdict (cache hits included).',
+    labelnames=('verdict',),
+)
+METRICS = (STAGE_SECONDS, REQUEST_SECONDS, PREDICTIONS)
+
+
+def span(stage):
+    """Context manager timing one stage into scam_detector_stage_seconds"""
+    return _Span(STAGE_SECONDS, (stage,)) if _enabled else _NULL_SPAN
+
+
+def count_predictions(results):
+    if not _enabled:
+        return
+    scams = sum(1 for result in results if result['is_scam'])
+    if scams:
+        PREDICTIONS.inc(scams, ('scam',))
+    if len(results) > scams:
+        PREDICTIONS.inc(len(results) - scams, ('legitimate',))
+
+
+def is_enabled():
+    return _enabled
+
+
+def set_enabled(enabled):
+    """Turn recording on or off process-wide; returns the previous setting"""
+    global _enabled
+    previous, _enabled = _enabled, bool(enabled)
+    return previous
+
+
+def configure_buckets(buckets):
+    """Replace the histogram bucket bounds (drops anything recorded so far)"""
+    for histogram in (STAGE_SECONDS, REQUEST_SECONDS):
+        histogram.bounds = tuple(sorted(buckets))
+        histogram.reset()
+
+
+def span_overhead_ns(iterations=100000):
+    """Average cost of one recorded span, measured on a scratch histogram"""
+    histogram = Histogram('scratch', '', labelnames=('stage',))
+    labels = ('scratch',)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        with _Span(histogram, labels):
+            pass
+    return (time.perf_counter() - start) / iterations * 1e9
+
+
+def gauge_lines(name, documentation, samples, kind='gauge'):
+    """Exposition lines for values read at scrape time: [(labels dict, value)]"""
+    lines = [f'# HELP {name} {documentation}', f'# TYPE {name} {kind}']
+    for labels, value in samples:
+        lines.append(f'{name}{_format_labels(tuple(labels), tuple(labels.values()))} {_format_value(value)}')
+    return lines
+
+
+def render(extra_lines=()):
+    """The full exposition text: recorded metrics plus scrape-time lines"""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    lines.extend(extra_lines)
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,43 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from . import metrics
+
+
+class MetricsMiddleware:
+    """
+    Times every request into scam_detector_request_seconds, labelled with
+    the URL name (known only after resolving, so it is read afterwards).
+    Sync and async capable, so the async API views are not pushed through
+    a thread by this middleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        response = self.get_response(request)
+        self._observe(request, response, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        self._observe(request, response, time.perf_counter() - start)
+        return response
+
+    @staticmethod
+    def _observe(request, response, seconds):
+        if not metrics.is_enabled():
+            return
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name if match is not None else None) or 'unmatched'
+        metrics.REQUEST_SECONDS.observe(seconds, (view, request.method, str(response.status_code)))
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:32
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_timestamps(apps, schema_editor):
+    # Feedback and verifications recorded before these fields existed
+    DetectionHistory = apps.get_model('detector', 'DetectionHistory')
+    ScamReport = apps.get_model('detector', 'ScamReport')
+    DetectionHistory.objects.exclude(user_feedback='not_set').update(feedback_at=F('detected_at'))
+    ScamReport.objects.filter(is_verified=True).update(verified_at=F('reported_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detector', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detectionhistory',
+            name='feedback_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='scamreport',
+            name='verified_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_timestamps, migrations.RunPython.noop),
+    ]
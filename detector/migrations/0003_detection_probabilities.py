@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detector', '0002_feedback_timestamps'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detectionhistory',
+            name='model_version',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='detectionhistory',
+            name='probability_ham',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='detectionhistory',
+            name='probability_spam',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:43
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('detector', '0003_detection_probabilities'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_detection_id', models.BigIntegerField(default=0)),
+                ('last_feedback_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='detectionhistory',
+            name='feedback_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='DetectionRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('bucket_start', models.DateTimeField()),
+                ('is_scam', models.BooleanField()),
+                ('detections', models.IntegerField(default=0)),
+                ('feedback_correct', models.IntegerField(default=0)),
+                ('feedback_incorrect', models.IntegerField(default=0)),
+                ('confidence_sum', models.FloatField(default=0)),
+                ('probability_count', models.IntegerField(default=0)),
+                ('probability_spam_sum', models.FloatField(default=0)),
+                ('probability_ham_sum', models.FloatField(default=0)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='detection_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-bucket_start'],
+                'indexes': [models.Index(fields=['granularity', 'user', 'bucket_start'], name='detector_de_granula_ee7ce9_idx'), models.Index(fields=['granularity', 'bucket_start'], name='detector_de_granula_01f4c9_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='detectionrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('user__isnull', False)), fields=('granularity', 'bucket_start', 'user', 'is_scam'), name='detector_rollup_unique_user_bucket'),
+        ),
+        migrations.AddConstraint(
+            model_name='detectionrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('user__isnull', True)), fields=('granularity', 'bucket_start', 'is_scam'), name='detector_rollup_unique_anonymous_bucket'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:54
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detector', '0004_detection_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModelVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.CharField(max_length=64, unique=True)),
+                ('path', models.CharField(max_length=255)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('activated_at', models.DateTimeField(blank=True, null=True)),
+                ('is_active', models.BooleanField(default=False)),
+                ('accuracy', models.FloatField(blank=True, null=True)),
+                ('vocab_size', models.IntegerField(blank=True, null=True)),
+                ('source', models.CharField(blank=True, max_length=50)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='modelversion',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_active', True)), fields=('is_active',), name='detector_single_active_model_version'),
+        ),
+    ]
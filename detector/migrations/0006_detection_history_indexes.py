@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detector', '0005_model_versions'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='detectionhistory',
+            index=models.Index(fields=['user', 'detected_at'], name='detector_de_user_id_67cd82_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='detectionhistory',
+            index=models.Index(fields=['user', 'is_scam', 'detected_at'], name='detector_de_user_id_87db5c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='detectionhistory',
+            index=models.Index(condition=models.Q(('user__isnull', True)), fields=['detected_at'], name='detector_history_anonymous'),
+        ),
+        migrations.AddIndex(
+            model_name='detectionhistory',
+            index=models.Index(condition=models.Q(('user__isnull', True)), fields=['is_scam', 'detected_at'], name='detector_history_anon_scam'),
+        ),
+        migrations.AddIndex(
+            model_name='detectionhistory',
+            index=models.Index(fields=['detected_at'], name='detector_de_detecte_20df4a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='detectionhistory',
+            index=models.Index(fields=['user_feedback', 'feedback_at'], name='detector_de_user_fe_a1f1aa_idx'),
+        ),
+    ]
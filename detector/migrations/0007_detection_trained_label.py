@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detector', '0006_detection_history_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detectionhistory',
+            name='trained_label',
+            field=models.CharField(blank=True, max_length=10),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:35
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detector', '0007_detection_trained_label'),
+    ]
+
+    operations = [
+        # Added without the default: AddField evaluates a callable default
+        # once, which would give every existing row the same UUID. The
+        # default only matters in Python, so it is added to the state alone
+        # (an AlterField would rebuild the table on SQLite).
+        migrations.AddField(
+            model_name='detectionhistory',
+            name='reference',
+            field=models.UUIDField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='detectionhistory',
+                    name='reference',
+                    field=models.UUIDField(blank=True, db_index=True, default=uuid.uuid4, editable=False, null=True),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+import uuid
+
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+
+def backfill_references(apps, schema_editor):
+    """Give rows created before 0008 a reference, so feedback can name them"""
+    DetectionHistory = apps.get_model('detector', 'DetectionHistory')
+    while True:
+        rows = list(DetectionHistory.objects.filter(reference__isnull=True).order_by().only('id')[:BATCH_SIZE])
+        if not rows:
+            break
+        for row in rows:
+            row.reference = uuid.uuid4()
+        DetectionHistory.objects.bulk_update(rows, ['reference'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detector', '0008_detection_reference'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_references, migrations.RunPython.noop),
+    ]
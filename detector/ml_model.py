@@ -1,16 +1,43 @@
-import pandas as pd
-import numpy as np
-import re
-import pickle
+import gc
+import logging
 import os
-from detector.naive_bayes_scratch import NaiveBayesAlgorithmFromScratch
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from detector.corpus import DEFAULT_CHUNK_SIZE, iter_chunks, split_chunks
+from detector.evaluation import classification_metrics
+from detector.metrics import count_predictions, span
+from detector.prediction_cache import build_cache, cache_key
+
+# The model modules (and NumPy with them) are imported where they are used,
+# so loading the URLconf - and with it every manage.py command - stays cheap.
+# pandas is not used at all and sklearn only by evaluate(). See
+# `manage.py startup_report`.
+
+logger = logging.getLogger(__name__)
+
+MODEL_PATH = 'scam_detector_model'
+LEGACY_MODEL_PATH = 'scam_detector_model.pkl'
+# Longest wait, in seconds, before retrying an active version that failed to load
+RELOAD_BACKOFF_MAX = 3600.0
+WARMUP_TEXTS = [
+    'Congratulations! You have won a free prize, call now to claim.',
+    'Are we still meeting for lunch tomorrow?',
+]
 
 class ScamDetector:
     """Naive Bayes from scratch for detecting scam offers"""
-    def __init__(self):
-        self.model = NaiveBayesAlgorithmFromScratch()
+    def __init__(self, cache=None, tokenizer=None):
+        from detector.naive_bayes_scratch import build_model
+        self.tokenizer = tokenizer  # settings.SCAM_DETECTOR_TOKENIZER, used by train()
+        self.model = build_model(tokenizer)
         self.is_trained = False
         self.classification_report_str = None
+        self.metrics = None  # Evaluation results from the last train(), see save_metrics
+        self.model_version = None
+        self.training_watermark = {}  # How far feedback has been folded in, see update_model
+        self.cache = cache  # Optional PredictionCache, keyed by tokens + model_version
         self.load_model()
 
     def preprocess_text(self, text):
@@ -19,27 +46,19 @@ class ScamDetector:
 
     def load_and_prepare_data(self, csv_path='spam.csv'):
         """Load and prepare the spam dataset"""
-        try:
-            encodings = ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1']
-            df = None
-            for encoding in encodings:
-                try:
-                    df = pd.read_csv(csv_path, encoding=encoding)
-                    break
-                except Exception:
-                    continue
-            if df is None:
-                raise Exception("Could not load CSV file with any encoding")
-            # Rename columns for clarity
-            df.columns = ['label', 'text'] + [f'col_{i}' for i in range(len(df.columns) - 2)]
-            df = df.dropna(subset=['text'])
-            # No need to map labels to 0/1, use 'ham'/'spam' as strings
-            X = df['text'].tolist()
-            y = df['label'].tolist()
-            return X, y
-        except Exception as e:
-            print(f"Error loading data: {e}")
-            return self._create_dummy_data()
+        X, y = [], []
+        for texts, labels in self.iter_data_chunks(csv_path):
+            X.extend(texts)
+            y.extend(labels)
+        return X, y
+
+    def iter_data_chunks(self, csv_path='spam.csv', chunk_size=DEFAULT_CHUNK_SIZE):
+        """Stream the dataset as (texts, labels) chunks (CSV, JSONL, optionally gzipped)"""
+        if not os.path.exists(csv_path):
+            logger.warning("%s not found, using built-in sample data", csv_path)
+            yield self._create_dummy_data()
+            return
+        yield from iter_chunks(csv_path, chunk_size)
 
     def _create_dummy_data(self):
         legitimate_texts = [
@@ -70,63 +89,288 @@ class ScamDetector:
         y = ["ham"] * len(legitimate_texts) + ["spam"] * len(scam_texts)
         return X, y
 
-    def train(self, csv_path='spam.csv', force_retrain=False):
+    def train(self, csv_path='spam.csv', force_retrain=False, workers=1):
+        """Train on csv_path with an 80/20 streaming split; returns test accuracy"""
         if self.is_trained and not force_retrain:
             return getattr(self, '_last_accuracy', 0.0)
-        X, y = self.load_and_prepare_data(csv_path)
-        from sklearn.model_selection import train_test_split
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-        self.model.fit(X_train, y_train)
-        accuracy = self.model.score(X_test, y_test)
-        self._last_accuracy = accuracy
+        from detector.corpus_cache import load_or_build
+        from detector.naive_bayes_scratch import build_model
+        self.model = build_model(self.tokenizer)
+        corpus = load_or_build(csv_path)
+        if corpus is not None:
+            # Token ids from the corpus cache; no text is parsed or tokenized
+            corpus.fit(self.model, ~corpus.split_mask(), n_jobs=workers)
+        else:
+            # Two streaming passes: fit on the train split, then evaluate() the
+            # test split chunk by chunk, so the corpus is never held in memory.
+            self.model.fit_chunks(split_chunks(self.iter_data_chunks(csv_path)), n_jobs=workers)
+        self.training_watermark = {}
         self.is_trained = True
-        self.save_model()
+        y_test, y_pred = self.evaluate(csv_path, corpus=corpus)
+        self.metrics = self._build_metrics(y_test, y_pred)
+        accuracy = self.metrics['accuracy']
+        self._last_accuracy = accuracy
+        self.save_model(source='train')
+        return accuracy
+
+    def _build_metrics(self, y_test, y_pred):
+        """Metrics stored next to the model so model_performance never re-reads the corpus"""
+        metrics = classification_metrics(y_test, y_pred)
+        train_counts = Counter(self.model.class_doc_counts)
+        test_counts = Counter(y_test)
+        class_counts = train_counts + test_counts
+        metrics['dataset'] = {
+            'total_samples': sum(class_counts.values()),
+            'train_samples': sum(train_counts.values()),
+            'test_samples': len(y_test),
+            'class_counts': dict(class_counts),
+        }
+        metrics['vocab_size'] = self.model.vocab_size
+        # Set when train() pruned the vocabulary (see SCAM_DETECTOR_TOKENIZER)
+        metrics['unpruned_vocab_size'] = getattr(self.model, 'unpruned_vocab_size', None)
+        metrics['tokenizer'] = self.model.tokenizer_config()
+        metrics['classification_report'] = self.classification_report_str
+        metrics['trained_at'] = datetime.now(timezone.utc).isoformat()
+        return metrics
+
+    def evaluate(self, csv_path='spam.csv', corpus=None):
+        """
+        Score the held-out split of csv_path (from its corpus cache when one
+        is given, otherwise chunk by chunk) and rebuild the classification
+        report. Returns (y_test, y_pred) label lists.
+        """
+        if corpus is not None:
+            y_test, y_pred = corpus.predict(self.model, corpus.split_mask())
+        else:
+            y_test, y_pred = [], []
+            for X_test, labels in split_chunks(self.iter_data_chunks(csv_path), test=True):
+                y_pred.extend(self.model.predict(X_test))
+                y_test.extend(labels)
         from sklearn.metrics import classification_report
-        y_pred = self.model.predict(X_test)
-        print('DEBUG: First 10 true labels:', y_test[:10])
-        print('DEBUG: First 10 predicted labels:', y_pred[:10])
         self.classification_report_str = classification_report(y_test, y_pred, target_names=['ham', 'spam'])
-        return accuracy
+        return y_test, y_pred
 
     def get_classification_report(self):
+        if getattr(self, 'classification_report_str', None) is None and self.metrics:
+            return self.metrics.get('classification_report')
         return getattr(self, 'classification_report_str', None)
 
     def predict(self, text):
+        return self.predict_batch([text])[0]
+
+    def predict_batch(self, texts):
+        """predict() for a list of texts, scored in one vectorized call"""
         if not self.is_trained:
             self.train()
-        # The model expects a list of texts
-        pred, confidence, proba = self.model.predict([text], return_confidence=True)[0]
+        if self.cache is None or self.model_version is None:
+            results = self._predict_uncached(texts)
+            count_predictions(results)
+            return _annotate(texts, results)
+        with span('cache'):
+            keys = [cache_key(self.model.preprocess(text), self.model_version) for text in texts]
+            cached = self.cache.get_many(list(set(keys)))
+        missing = [i for i, key in enumerate(keys) if key not in cached]
+        if missing:
+            computed = self._predict_uncached([texts[i] for i in missing])
+            new_entries = {keys[i]: result for i, result in zip(missing, computed)}
+            self.cache.set_many(new_entries)
+            cached.update(new_entries)
+        # Copies, so callers can annotate their result without touching the cache
+        results = [dict(cached[key]) for key in keys]
+        count_predictions(results)
+        return _annotate(texts, results)
+
+    def _predict_uncached(self, texts):
+        return predict_results(self.model, texts)
+
+    def save_model(self, filepath=None, source=''):
+        """
+        Publish the model as the new active version in the model registry,
+        or write the artifact straight to filepath when one is given.
+        """
+        from detector.model_store import save_artifact, save_metrics
+        extra = {
+            'last_accuracy': float(getattr(self, '_last_accuracy', 0.0)),
+            'training_watermark': self.training_watermark,
+        }
+        if filepath is None:
+            # Errors propagate: writing MODEL_PATH in place instead would not
+            # be atomic, and the new model would not be served anyway.
+            from detector.model_registry import publish
+            version = publish(self.model, metrics=self.metrics, source=source, **extra)
+            self.model_version = version.version
+            return
+        meta = save_artifact(self.model, filepath, **extra)
+        self.model_version = meta['content_hash']
+        if self.metrics is not None:
+            save_metrics(filepath, self.metrics)
+
+    def load_model(self, filepath=None):
+        """Load the registry's active version, or the artifact/pickle at filepath"""
+        from detector.model_store import load_artifact, load_metrics
+        if filepath is None:
+            active = _active_registry_version()
+            filepath = active.path if active is not None and os.path.isdir(active.path) else MODEL_PATH
+        if os.path.isdir(filepath):
+            try:
+                self.model, meta = load_artifact(filepath)
+                self._last_accuracy = meta.get('last_accuracy', 0.0)
+                self.training_watermark = meta.get('training_watermark') or {}
+                self.metrics = load_metrics(filepath)
+                self.model_version = meta['content_hash']
+                self.is_trained = True
+            except Exception:
+                self.is_trained = False
+        elif filepath == MODEL_PATH and os.path.exists(LEGACY_MODEL_PATH):
+            # Not converted yet (see `manage.py convert_model`)
+            self._load_legacy_model(LEGACY_MODEL_PATH)
+        elif os.path.isfile(filepath):
+            self._load_legacy_model(filepath)
+
+    def _load_legacy_model(self, filepath):
+        from detector.model_store import load_pickle, model_hash
+        try:
+            self.model, self._last_accuracy = load_pickle(filepath)
+            self.model.compile()
+            self.model_version = model_hash(self.model, last_accuracy=float(self._last_accuracy))
+            self.is_trained = True
+        except Exception:
+            self.is_trained = False
+
+
+def _annotate(texts, results):
+    """
+    Attach the known scam campaign each text is a near duplicate of, and the
+    reported scammer contacts it mentions. Done after the prediction cache,
+    since both change on their own schedule.
+    """
+    from detector import campaigns, indicators
+    with span('campaign'):
+        campaigns.annotate(texts, results)
+    with span('indicators'):
+        indicators.annotate(texts, results)
+    return results
+
+
+def predict_results(model, texts):
+    """The result dicts predict() returns, straight from a fitted model"""
+    results = []
+    for pred, confidence, proba in model.predict(texts, return_confidence=True):
         # proba is a dict: {label: probability}
         is_scam = (pred == 'spam')
-        return {
+        results.append({
             'is_scam': is_scam,
             'confidence': confidence * 100,  # Convert to percentage
             'label': pred,
             'probability_ham': proba.get('ham', 0.0) * 100,  # Convert to percentage
             'probability_spam': proba.get('spam', 0.0) * 100  # Convert to percentage
-        }
+        })
+    return results
 
-    def save_model(self, filepath='scam_detector_model.pkl'):
-        # Save the model and last accuracy
-        with open(filepath, 'wb') as f:
-            pickle.dump({'model': self.model, '_last_accuracy': getattr(self, '_last_accuracy', 0.0)}, f)
 
-    def load_model(self, filepath='scam_detector_model.pkl'):
-        if os.path.exists(filepath):
-            try:
-                with open(filepath, 'rb') as f:
-                    data = pickle.load(f)
-                    if isinstance(data, dict):
-                        self.model = data.get('model', NaiveBayesAlgorithmFromScratch())
-                        self._last_accuracy = data.get('_last_accuracy', 0.0)
-                    else:
-                        self.model = data
-                        self._last_accuracy = 0.0
-                self.is_trained = True
-            except Exception:
-                self.is_trained = False
+_detector_lock = threading.Lock()
+
+
+def _active_registry_version():
+    try:
+        from detector.model_registry import active_version
+        return active_version()
+    except Exception:
+        # Django not configured, e.g. the model used from a plain script
+        return None
+
 
 def get_scam_detector():
+    """
+    The process-wide detector. Every POLL_INTERVAL seconds it checks the
+    registry's active version and, when that changed, loads and warms the
+    new model and swaps it in; requests already holding the old detector
+    finish with it.
+    """
     if not hasattr(get_scam_detector, '_instance'):
-        get_scam_detector._instance = ScamDetector()
-    return get_scam_detector._instance 
\ No newline at end of file
+        with _detector_lock:
+            if not hasattr(get_scam_detector, '_instance'):
+                from django.conf import settings
+                from detector.model_registry import get_config
+                cache = build_cache(getattr(settings, 'SCAM_DETECTOR_CACHE', None))
+                get_scam_detector._poll_interval = get_config()['POLL_INTERVAL']
+                get_scam_detector._next_check = time.monotonic() + (get_scam_detector._poll_interval or 0)
+                get_scam_detector._instance = ScamDetector(
+                    cache=cache,
+                    tokenizer=getattr(settings, 'SCAM_DETECTOR_TOKENIZER', None),
+                )
+    else:
+        _reload_if_changed()
+    return get_scam_detector._instance
+
+
+def _reload_if_changed():
+    interval = get_scam_detector._poll_interval
+    now = time.monotonic()
+    if interval is None or now < get_scam_detector._next_check:
+        return
+    get_scam_detector._next_check = now + interval
+    active = _active_registry_version()
+    current = get_scam_detector._instance
+    if active is None or active.version == current.model_version:
+        return
+    # (version, failed attempts, retry at) of a version that could not be loaded
+    failed = getattr(get_scam_detector, '_failed_reload', None)
+    if failed is not None and failed[0] == active.version and now < failed[2]:
+        return
+    with _detector_lock:
+        if get_scam_detector._instance is not current:
+            return  # Another thread already swapped
+        detector = None
+        if os.path.isdir(active.path):
+            detector = ScamDetector(cache=current.cache, tokenizer=current.tokenizer)
+        if detector is None or not detector.is_trained or detector.model_version != active.version:
+            # A missing or unreadable artifact makes ScamDetector fall back to
+            # another model; keep serving the current one and retry less often.
+            attempts = failed[1] + 1 if failed is not None and failed[0] == active.version else 1
+            delay = min(max(interval, 1.0) * 2 ** attempts, RELOAD_BACKOFF_MAX)
+            get_scam_detector._failed_reload = (active.version, attempts, now + delay)
+            if attempts == 1:
+                logger.error(
+                    'Could not load model version %s from %s, keeping %s; retrying with backoff',
+                    active.version[:12], active.path, current.model_version,
+                )
+            return
+        detector._predict_uncached(WARMUP_TEXTS)
+        get_scam_detector._instance = detector
+        get_scam_detector._failed_reload = None
+    logger.info('Swapped in model version %s', detector.model_version[:12])
+
+
+def preload_detector():
+    """
+    Load the shared detector, run a warm-up prediction and move everything
+    allocated so far into the GC's permanent generation. Called before the
+    server forks (see DetectorConfig.ready), so workers inherit the loaded
+    model and the collector never writes to those pages, keeping them
+    shared copy-on-write. An untrained detector is left for the first
+    request to train and does not count as ready.
+    """
+    start = time.perf_counter()
+    detector = get_scam_detector()
+    if detector.is_trained:
+        # Uncached, so the warm-up does not show up in the cache statistics
+        detector._predict_uncached(WARMUP_TEXTS)
+        get_scam_detector._ready = True
+    # Forked workers must not share the connection used to find the active version
+    from django.db import connections
+    connections.close_all()
+    gc.collect()
+    gc.freeze()
+    logger.info('Preloaded scam detector (ready=%s) in %.0f ms', detector_ready(), (time.perf_counter() - start) * 1000)
+    return detector
+
+
+def current_detector():
+    """The process-wide detector if one was created, without loading one"""
+    return getattr(get_scam_detector, '_instance', None)
+
+
+def detector_ready():
+    """True once preload_detector() has loaded and warmed a trained model"""
+    return getattr(get_scam_detector, '_ready', False)
@@ -0,0 +1,132 @@
+"""
+Registry of model versions.
+
+Every saved model becomes an immutable artifact directory named after its
+content hash, under settings.SCAM_DETECTOR_MODEL_REGISTRY['PATH']. The
+ModelVersion row with is_active=True decides which one is served.
+
+Artifacts are written to a temporary directory and renamed into place, so
+no reader ever sees a half-written model. Activating a version (or rolling
+back) is a single-row update. Workers notice it within POLL_INTERVAL seconds
+and swap the model in (see detector.ml_model.get_scam_detector).
+"""
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+
+from .model_store import ModelArtifactError, save_artifact, save_metrics
+from .models import ModelVersion
+
+DEFAULTS = {
+    'PATH': 'scam_detector_models',
+    'POLL_INTERVAL': 5.0,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'SCAM_DETECTOR_MODEL_REGISTRY', {})}
+
+
+def publish(model, metrics=None, activate=True, source='', **extra):
+    """
+    Write a fitted model as a new version and register it (and by default
+    make it the active one). Extra keyword arguments go into the artifact
+    header like save_artifact's. Returns the ModelVersion.
+    """
+    root = get_config()['PATH']
+    os.makedirs(root, exist_ok=True)
+    tmp_path = tempfile.mkdtemp(prefix='.tmp-', dir=root)
+    try:
+        os.chmod(tmp_path, 0o755)
+        meta = save_artifact(model, tmp_path, **extra)
+        if metrics is not None:
+            save_metrics(tmp_path, metrics)
+        path = os.path.join(root, meta['content_hash'])
+        if os.path.isdir(path):
+            # Identical content was published before; its files are immutable
+            shutil.rmtree(tmp_path)
+        else:
+            os.rename(tmp_path, path)
+    except Exception:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    version, _ = ModelVersion.objects.get_or_create(
+        version=meta['content_hash'],
+        defaults={
+            'path': path,
+            'accuracy': extra.get('last_accuracy'),
+            'vocab_size': meta['vocab_size'],
+            'source': source,
+        }
+    )
+    if activate:
+        version = activate_version(version.version)
+    return version
+
+
+def resolve(version):
+    """The ModelVersion whose version starts with the given (possibly short) hash"""
+    matches = list(ModelVersion.objects.filter(version__startswith=version)[:2])
+    if not matches:
+        raise ModelArtifactError(f"No model version {version!r}")
+    if len(matches) > 1:
+        raise ModelArtifactError(f"Model version {version!r} is ambiguous")
+    return matches[0]
+
+
+def activate_version(version):
+    """Make a registered version the one every worker serves"""
+    with transaction.atomic():
+        target = ModelVersion.objects.select_for_update().get(pk=resolve(version).pk)
+        if not os.path.isdir(target.path):
+            raise ModelArtifactError(f"Artifact for {target.version[:12]} is missing at {target.path}")
+        ModelVersion.objects.filter(is_active=True).exclude(pk=target.pk).update(is_active=False)
+        target.is_active = True
+        target.activated_at = timezone.now()
+        target.save()
+    return target
+
+
+def rollback(version=None):
+    """
+    Re-activate a version that was active before: the given one (hash or
+    unique prefix), or by default the one activated before the current one.
+    """
+    current = ModelVersion.objects.filter(is_active=True).first()
+    if version is not None:
+        target = resolve(version)
+        if current is not None and target.pk == current.pk:
+            raise ModelArtifactError(f"Model version {target.version[:12]} is already active")
+        if target.activated_at is None:
+            raise ModelArtifactError(f"Model version {target.version[:12]} was never active; use activate")
+        return activate_version(target.version)
+    previous = ModelVersion.objects.filter(activated_at__isnull=False)
+    if current is not None:
+        previous = previous.exclude(pk=current.pk)
+    previous = previous.order_by('-activated_at').first()
+    if previous is None:
+        raise ModelArtifactError("No previously active model version to roll back to")
+    return activate_version(previous.version)
+
+
+def active_version():
+    """The active ModelVersion, or None (also before the registry is migrated)"""
+    try:
+        # Savepoint, so a missing table does not poison an outer transaction
+        with transaction.atomic():
+            return ModelVersion.objects.filter(is_active=True).first()
+    except DatabaseError:
+        return None
+
+
+def prune(keep):
+    """Delete inactive versions beyond the newest `keep`; returns the deleted rows"""
+    stale = list(ModelVersion.objects.filter(is_active=False).order_by('-created_at')[keep:])
+    for version in stale:
+        shutil.rmtree(version.path, ignore_errors=True)
+        version.delete()
+    return stale
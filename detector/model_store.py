@@ -0,0 +1,180 @@
+"""
+On-disk model artifact for the Naive Bayes detector.
+
+An artifact is a directory holding plain .npy arrays and a JSON header:
+
+    meta.json     format name, version, tokenizer, classes, priors, totals, content hash
+    vocab.npy     sorted vocabulary (bytes); absent for hashing models
+    counts.npy    per-class word counts, shape (V, n_classes)
+    log_lik.npy   per-class log-likelihoods plus unseen/prior rows, shape (V+2, n_classes)
+    metrics.json  optional evaluation results written at train time
+
+Hashing models (tokenizer mode 'hashing') store one row per bucket instead
+of one per word, and a single prior row.
+
+The arrays are opened with np.load(mmap_mode='r'), so every worker process
+shares one page-cache copy instead of unpickling a private heap of dicts.
+"""
+import hashlib
+import json
+import os
+import pickle
+
+import numpy as np
+
+from detector.naive_bayes_scratch import HashingNaiveBayes, NaiveBayesAlgorithmFromScratch
+
+ARTIFACT_FORMAT = 'scam-detector-naive-bayes'
+ARTIFACT_VERSION = 1
+META_FILE = 'meta.json'
+METRICS_FILE = 'metrics.json'
+ARRAY_NAMES = ('vocab', 'counts', 'log_lik')
+
+
+class ModelArtifactError(Exception):
+    """Raised when an artifact is missing, corrupt or of an unknown version."""
+
+
+def _model_arrays(model):
+    if getattr(model, '_compiled', None) is None:
+        model.compile()
+    return {name: model._compiled[name] for name in ARRAY_NAMES if name in model._compiled}
+
+
+def _model_meta(model, **extra):
+    classes = model._compiled['classes']
+    doc_counts = getattr(model, 'class_doc_counts', None)
+    meta = {
+        'format': ARTIFACT_FORMAT,
+        'version': ARTIFACT_VERSION,
+        'tokenizer': model.tokenizer_config(),
+        'classes': classes,
+        'class_priors': {label: float(model.class_priors[label]) for label in classes},
+        'class_word_totals': {label: int(model.class_word_totals[label]) for label in classes},
+        # Needed by partial_fit(); unknown for models pickled before it existed
+        'class_doc_counts': {label: int(doc_counts[label]) for label in classes} if doc_counts else None,
+        'vocab_size': int(model.vocab_size),
+    }
+    meta.update(extra)
+    return meta
+
+
+def content_hash(meta, arrays):
+    """SHA-256 over the header (minus the hash itself) and the raw array bytes."""
+    digest = hashlib.sha256()
+    header = {key: value for key, value in meta.items() if key != 'content_hash'}
+    digest.update(json.dumps(header, sort_keys=True).encode('utf-8'))
+    for name in ARRAY_NAMES:
+        if name not in arrays:
+            continue
+        array = np.ascontiguousarray(arrays[name])
+        digest.update(name.encode('ascii'))
+        digest.update(array.dtype.str.encode('ascii'))
+        digest.update(repr(array.shape).encode('ascii'))
+        digest.update(memoryview(array).cast('B'))
+    return digest.hexdigest()
+
+
+def model_hash(model, **extra):
+    """Content hash of an in-memory model, as save_artifact would record it."""
+    return content_hash(_model_meta(model, **extra), _model_arrays(model))
+
+
+def save_artifact(model, path, **extra):
+    """
+    Write a fitted model to the artifact directory at path. Extra keyword
+    arguments (e.g. last_accuracy) are stored in the header. Returns the header.
+    """
+    arrays = _model_arrays(model)
+    meta = _model_meta(model, **extra)
+    meta['content_hash'] = content_hash(meta, arrays)
+    os.makedirs(path, exist_ok=True)
+    for name in ARRAY_NAMES:
+        array_path = os.path.join(path, name + '.npy')
+        if name in arrays:
+            np.save(array_path, np.ascontiguousarray(arrays[name]))
+        elif os.path.exists(array_path):
+            # Left over from a model of the other tokenizer mode
+            os.remove(array_path)
+    # Header last: a directory without meta.json is not a complete artifact.
+    with open(os.path.join(path, META_FILE), 'w') as f:
+        json.dump(meta, f, indent=2, sort_keys=True)
+    return meta
+
+
+def read_meta(path):
+    meta_path = os.path.join(path, META_FILE)
+    if not os.path.exists(meta_path):
+        raise ModelArtifactError(f"No model artifact at {path}")
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if meta.get('format') != ARTIFACT_FORMAT:
+        raise ModelArtifactError(f"Unknown artifact format: {meta.get('format')!r}")
+    if meta.get('version') != ARTIFACT_VERSION:
+        raise ModelArtifactError(f"Unsupported artifact version: {meta.get('version')!r}")
+    return meta
+
+
+def load_artifact(path, mmap=True, verify=False):
+    """
+    Open an artifact and return (model, meta). With mmap the arrays stay on
+    disk and are paged in on demand; verify re-hashes every byte, which
+    defeats lazy paging and is meant for deploy-time checks.
+    """
+    meta = read_meta(path)
+    # Artifacts written before hashing models existed have no tokenizer entry
+    tokenizer = dict(meta.get('tokenizer') or {'mode': 'vocabulary'})
+    mode = tokenizer.pop('mode')
+    if mode == 'hashing':
+        model_class = HashingNaiveBayes
+    elif mode == 'vocabulary':
+        model_class = NaiveBayesAlgorithmFromScratch
+    else:
+        raise ModelArtifactError(f"Unknown tokenizer mode: {mode!r}")
+    arrays = {
+        name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r' if mmap else None)
+        for name in ARRAY_NAMES
+        if name != 'vocab' or mode == 'vocabulary'
+    }
+    if verify and content_hash(meta, arrays) != meta.get('content_hash'):
+        raise ModelArtifactError(f"Content hash mismatch for {path}")
+    model = model_class.from_arrays(
+        meta['classes'], meta['class_priors'], meta['class_word_totals'],
+        arrays.get('vocab'), arrays['counts'], arrays['log_lik'],
+        class_doc_counts=meta.get('class_doc_counts'),
+        **tokenizer
+    )
+    return model, meta
+
+
+def save_metrics(path, metrics):
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, METRICS_FILE), 'w') as f:
+        json.dump(metrics, f, indent=2, sort_keys=True)
+
+
+def load_metrics(path):
+    """Evaluation metrics stored with the artifact at path, or None."""
+    metrics_path = os.path.join(path, METRICS_FILE)
+    if not os.path.exists(metrics_path):
+        return None
+    with open(metrics_path) as f:
+        return json.load(f)
+
+
+def load_pickle(filepath):
+    """Load a legacy pickled model. Returns (model, last_accuracy)."""
+    with open(filepath, 'rb') as f:
+        data = pickle.load(f)
+    if isinstance(data, dict):
+        return data.get('model', NaiveBayesAlgorithmFromScratch()), data.get('_last_accuracy', 0.0)
+    return data, 0.0
+
+
+def convert_pickle(pickle_path, artifact_path):
+    """One-time conversion of a legacy scam_detector_model.pkl into an artifact."""
+    model, last_accuracy = load_pickle(pickle_path)
+    if not model.fitted:
+        raise ModelArtifactError(f"Pickled model in {pickle_path} is not trained")
+    model.compile()
+    return save_artifact(model, artifact_path, last_accuracy=float(last_accuracy))
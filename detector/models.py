@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 from django.utils import timezone
 from django.contrib.auth.models import User
@@ -9,18 +11,49 @@ class DetectionHistory(models.Model):
     text = models.TextField()
     is_scam = models.BooleanField()
     confidence_score = models.FloatField()
+    # Full prediction output at detection time, in percent
+    probability_spam = models.FloatField(null=True, blank=True)
+    probability_ham = models.FloatField(null=True, blank=True)
+    model_version = models.CharField(max_length=64, blank=True)
     detected_at = models.DateTimeField(default=timezone.now)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
+    # Set when the object is built, so a detection still in the write buffer
+    # can be named; feedback requests name detections only by this reference
+    reference = models.UUIDField(default=uuid.uuid4, null=True, blank=True, editable=False, db_index=True)
     USER_FEEDBACK_CHOICES = [
         ('not_set', 'Not Set'),
         ('correct', 'Correct'),
         ('incorrect', 'Incorrect'),
     ]
     user_feedback = models.CharField(max_length=10, choices=USER_FEEDBACK_CHOICES, default='not_set')
+    feedback_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    # Label update_model last taught the model from this feedback ('' = none yet)
+    trained_label = models.CharField(max_length=10, blank=True)
     
     class Meta:
         verbose_name_plural = "Detection History"
         ordering = ['-detected_at']
+        # Access paths checked by detector.query_plans (tests and `manage.py check_query_plans`)
+        indexes = [
+            # A user's history, newest first, optionally only scams or only legitimate
+            models.Index(fields=['user', 'detected_at']),
+            models.Index(fields=['user', 'is_scam', 'detected_at']),
+            # The same for anonymous visitors (user IS NULL), without the user rows
+            models.Index(
+                fields=['detected_at'],
+                condition=models.Q(user__isnull=True),
+                name='detector_history_anonymous',
+            ),
+            models.Index(
+                fields=['is_scam', 'detected_at'],
+                condition=models.Q(user__isnull=True),
+                name='detector_history_anon_scam',
+            ),
+            # Rollups read detections by time range
+            models.Index(fields=['detected_at']),
+            # update_model and update_campaigns read feedback given since a watermark
+            models.Index(fields=['user_feedback', 'feedback_at']),
+        ]
     
     def __str__(self):
         return f"{'SCAM' if self.is_scam else 'LEGIT'} - {self.text[:50]}..."
@@ -43,6 +76,7 @@ class ScamReport(models.Model):
     reported_at = models.DateTimeField(default=timezone.now)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
     is_verified = models.BooleanField(default=False)
+    verified_at = models.DateTimeField(null=True, blank=True)
     
     class Meta:
         ordering = ['-reported_at']
@@ -50,6 +84,12 @@ class ScamReport(models.Model):
     def __str__(self):
         return f"{self.get_report_type_display()} - {self.description[:50]}..."
 
+    def save(self, *args, **kwargs):
+        # Record when a report was first verified so training can pick it up
+        if self.is_verified and self.verified_at is None:
+            self.verified_at = timezone.now()
+        super().save(*args, **kwargs)
+
 
 class ScamStatistics(models.Model):
     """Model to store scam detection statistics"""
@@ -69,4 +109,83 @@ class ScamStatistics(models.Model):
     def scam_percentage(self):
         if self.total_detections == 0:
             return 0
-        return (self.scam_detections / self.total_detections) * 100 
\ No newline at end of file
+        return (self.scam_detections / self.total_detections) * 100 
+
+
+class DetectionRollup(models.Model):
+    """Hourly and daily detection aggregates per user (None = anonymous) and verdict"""
+    GRANULARITY_CHOICES = [
+        ('hour', 'Hour'),
+        ('day', 'Day'),
+    ]
+
+    granularity = models.CharField(max_length=4, choices=GRANULARITY_CHOICES)
+    bucket_start = models.DateTimeField()
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.CASCADE, related_name='detection_rollups')
+    is_scam = models.BooleanField()
+    detections = models.IntegerField(default=0)
+    feedback_correct = models.IntegerField(default=0)
+    feedback_incorrect = models.IntegerField(default=0)
+    confidence_sum = models.FloatField(default=0)
+    # Detections with stored probabilities, and the sums of those probabilities
+    probability_count = models.IntegerField(default=0)
+    probability_spam_sum = models.FloatField(default=0)
+    probability_ham_sum = models.FloatField(default=0)
+
+    class Meta:
+        ordering = ['-bucket_start']
+        indexes = [
+            models.Index(fields=['granularity', 'user', 'bucket_start']),
+            models.Index(fields=['granularity', 'bucket_start']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['granularity', 'bucket_start', 'user', 'is_scam'],
+                condition=models.Q(user__isnull=False),
+                name='detector_rollup_unique_user_bucket',
+            ),
+            models.UniqueConstraint(
+                fields=['granularity', 'bucket_start', 'is_scam'],
+                condition=models.Q(user__isnull=True),
+                name='detector_rollup_unique_anonymous_bucket',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.granularity} {self.bucket_start} - {'SCAM' if self.is_scam else 'LEGIT'}: {self.detections}"
+
+
+class RollupWatermark(models.Model):
+    """How far DetectionRollup has been caught up with DetectionHistory"""
+    name = models.CharField(max_length=50, unique=True)
+    last_detection_id = models.BigIntegerField(default=0)
+    last_feedback_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} - detection {self.last_detection_id}"
+
+
+class ModelVersion(models.Model):
+    """A model artifact in the registry; at most one is active at a time"""
+    version = models.CharField(max_length=64, unique=True)  # Artifact content hash
+    path = models.CharField(max_length=255)
+    created_at = models.DateTimeField(default=timezone.now)
+    activated_at = models.DateTimeField(null=True, blank=True)
+    is_active = models.BooleanField(default=False)
+    accuracy = models.FloatField(null=True, blank=True)
+    vocab_size = models.IntegerField(null=True, blank=True)
+    source = models.CharField(max_length=50, blank=True)  # e.g. train_model, update_model
+
+    class Meta:
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['is_active'],
+                condition=models.Q(is_active=True),
+                name='detector_single_active_model_version',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.version[:12]}{' (active)' if self.is_active else ''}"
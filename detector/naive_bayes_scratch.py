@@ -1,41 +1,456 @@
 import numpy as np
 import re
-from collections import defaultdict, Counter
+from collections import defaultdict, deque, Counter
+
+from detector.metrics import span
+
+# Runs of letters left after lowercasing; same tokens as replacing every
+# non-letter with a space and splitting.
+TOKEN_RE = re.compile(r'[a-z]+')
+
+# Byte table for the compiled path: keeps a-z and the document separator,
+# turns everything else into a space.
+_DOC_SEP = '\x00'
+_BYTE_TABLE = bytes(c if (97 <= c <= 122 or c == 0) else 32 for c in range(256))
+
+# Odd multiplier (FNV-64 prime) for HashingNaiveBayes' polynomial token hash;
+# odd numbers are invertible mod 2**64, which lets every token be hashed from
+# one prefix sum over the batch.
+_HASH_MULT = 0x100000001b3
+_HASH_MULT_INVERSE = pow(_HASH_MULT, -1, 1 << 64)
+_BIGRAM_MULT = np.uint64(0x9e3779b97f4a7c15)
+_HASH_POWERS = (np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.uint64))
+
+FEATURE_SELECTIONS = ('frequency', 'chi2', 'mutual_info')
+
 
 class NaiveBayesAlgorithmFromScratch:
-    def __init__(self):
+    def __init__(self, min_df=1, max_features=None, selection='frequency'):
+        """
+        min_df, max_features and selection prune the vocabulary in fit():
+        words found in fewer than min_df documents are dropped, then the
+        max_features best words by selection ('frequency', 'chi2' or
+        'mutual_info') are kept.
+        """
+        if selection not in FEATURE_SELECTIONS:
+            raise Exception(f"Unknown feature selection {selection!r}; use one of {FEATURE_SELECTIONS}.")
+        self.min_df = int(min_df)
+        self.max_features = int(max_features) if max_features else None
+        self.selection = selection
         self.class_priors = {}         # P(class)
         self.word_counts = {}          # {class: {word: count}}
         self.class_word_totals = {}    # {class: total_words_in_class}
         self.vocab = set()             # All unique words
+        self.class_doc_counts = {}     # {class: number_of_documents}
+        self.unpruned_vocab_size = None  # Vocabulary size before pruning, if fit() pruned
         self.fitted = False
+        self._compiled = None          # Frozen arrays used by predict_proba
 
     def preprocess(self, text):
         # Lowercase, remove non-letters, split into words
-        text = text.lower()
-        text = re.sub(r'[^a-z\s]', ' ', text)
-        words = text.split()
-        return words
+        return TOKEN_RE.findall(text.lower())
 
-    def fit(self, X, y):
+    def fit(self, X, y, n_jobs=1):
         """
         X: list of text samples
         y: list of class labels (e.g., 'spam' or 'ham')
+        n_jobs: number of worker processes used to count the corpus
+        """
+        if n_jobs > 1:
+            counts = self.parallel_count(X, y, n_jobs)
+        else:
+            counts = self.count(X, y)
+        self._fit_counts(*counts)
+
+    def fit_chunks(self, chunks, n_jobs=1):
         """
-        label_counts = Counter(y)
-        total_samples = len(y)
-        self.class_priors = {label: count / total_samples for label, count in label_counts.items()}
-        self.word_counts = {label: defaultdict(int) for label in label_counts}
-        self.class_word_totals = {label: 0 for label in label_counts}
+        fit() over an iterable of (X, y) chunks, e.g. from
+        detector.corpus.iter_chunks, holding only a few chunks at a time.
+        """
+        self._fit_counts(*self.count_chunks(chunks, n_jobs))
+
+    def _reset(self):
+        self.class_priors = {}
+        self.class_doc_counts = {}
+        self.word_counts = {}
+        self.class_word_totals = {}
         self.vocab = set()
+        self.unpruned_vocab_size = None
+
+    def _fit_counts(self, doc_counts, word_counts, doc_freqs=None):
+        self._reset()
+        self._add_counts(doc_counts, word_counts)
+        if self.prunes_vocab:
+            self._prune(doc_freqs or Counter())
+        self.fitted = True
+        self.compile()
+
+    @property
+    def prunes_vocab(self):
+        return getattr(self, 'min_df', 1) > 1 or getattr(self, 'max_features', None) is not None
+
+    def _prune(self, doc_freqs):
+        """
+        Keep only the selected words. Class totals are recomputed over the
+        kept words, so each class's word distribution still sums to one over
+        the pruned vocabulary.
+        """
+        words = sorted(self.vocab)
+        self.unpruned_vocab_size = len(words)
+        if self.min_df > 1:
+            words = [word for word in words if doc_freqs[word] >= self.min_df]
+        if self.max_features is not None and len(words) > self.max_features:
+            scores = feature_scores(
+                np.array([[self.word_counts[label].get(word, 0) for label in self.class_priors] for word in words],
+                         dtype=np.float64).reshape(len(words), len(self.class_priors)),
+                self.selection,
+            )
+            # Highest score first; ties keep alphabetical order
+            best = np.argsort(-scores, kind='stable')[:self.max_features]
+            words = [words[i] for i in sorted(best)]
+        keep = set(words)
+        for label in self.class_priors:
+            self.word_counts[label] = defaultdict(
+                int, ((word, n) for word, n in self.word_counts[label].items() if word in keep)
+            )
+            self.class_word_totals[label] = sum(self.word_counts[label].values())
+        self.vocab = keep
+
+    def partial_fit(self, X, y):
+        """
+        Add more labelled samples to an already fitted model. Only the new
+        samples are tokenized; counts, priors and vocab are updated in place
+        and the compiled matrix is rebuilt (O(vocab), not O(corpus)).
+        Labels not seen before become new classes.
+        """
+        self.partial_fit_counts(*self.count(X, y))
+
+    def partial_fit_counts(self, doc_counts, word_counts, doc_freqs=None):
+        """
+        partial_fit() for counts already produced by count(). Pruning only
+        happens in fit(): words first seen here join the vocabulary.
+        """
+        if not self.fitted:
+            self._reset()
+        elif getattr(self, 'class_doc_counts', None) is None:
+            raise Exception("Model has no document counts; retrain with fit() before calling partial_fit().")
+        self._thaw()
+        self._add_counts(doc_counts, word_counts)
+        self.fitted = True
+        self.compile()
 
+    def unlearn_counts(self, doc_counts, word_counts):
+        """
+        Take samples that partial_fit_counts() added back out of the model,
+        e.g. feedback whose label was later flipped. Words and classes left
+        without counts are dropped, as if the samples had never been seen.
+        """
+        if not self.fitted:
+            raise Exception("Model not trained. Call fit() first.")
+        self._thaw()
+        remaining_docs, remaining_words, _ = self.subtract_counts(
+            self._model_counts(), (doc_counts, word_counts, Counter())
+        )
+        unpruned_vocab_size = self.unpruned_vocab_size
+        self._reset()
+        self._add_counts(remaining_docs, remaining_words)
+        self.unpruned_vocab_size = unpruned_vocab_size
+        self.compile()
+
+    def _model_counts(self):
+        """The model's own counts, shaped like count()'s result"""
+        return (
+            Counter(self.class_doc_counts),
+            {label: Counter(self.word_counts[label]) for label in self.class_doc_counts},
+            Counter(),
+        )
+
+    def count(self, X, y):
+        """
+        Tokenize and count a batch of labelled samples without touching the
+        model. Returns (doc_counts, word_counts, doc_freqs): documents per
+        class, {class: Counter of words} and the number of documents each
+        word appears in (only collected when min_df > 1, otherwise empty).
+        """
+        doc_counts = Counter()
+        word_counts = {}
+        doc_freqs = Counter()
+        collect_doc_freqs = getattr(self, 'min_df', 1) > 1
         for text, label in zip(X, y):
+            doc_counts[label] += 1
+            if label not in word_counts:
+                word_counts[label] = Counter()
             words = self.preprocess(text)
-            for word in words:
-                self.word_counts[label][word] += 1
-                self.class_word_totals[label] += 1
-                self.vocab.add(word)
-        self.fitted = True
+            word_counts[label].update(words)
+            if collect_doc_freqs:
+                doc_freqs.update(set(words))
+        return doc_counts, word_counts, doc_freqs
+
+    def count_token_ids(self, words, ids, doc_ids, doc_labels):
+        """
+        count() for documents that are already tokenized (see
+        detector.corpus_cache): ids index into the words list, doc_ids give
+        the document (0..n-1, in order) of every token and doc_labels the
+        label of every document. Returns the same counts as count() on the
+        original texts.
+        """
+        classes = list(dict.fromkeys(doc_labels))
+        label_ids = np.array([classes.index(label) for label in doc_labels], dtype=np.intp)
+        token_labels = label_ids[doc_ids]
+        words = np.asarray(words, dtype=object)
+        word_counts = {}
+        for i, label in enumerate(classes):
+            column = np.bincount(ids[token_labels == i], minlength=len(words))
+            present = np.flatnonzero(column)
+            word_counts[label] = Counter(dict(zip(words[present].tolist(), column[present].tolist())))
+        doc_freqs = Counter()
+        if getattr(self, 'min_df', 1) > 1:
+            # Distinct (document, word) pairs
+            pairs = np.unique(np.asarray(doc_ids, dtype=np.int64) * len(words) + ids)
+            column = np.bincount(pairs % len(words), minlength=len(words))
+            present = np.flatnonzero(column)
+            doc_freqs = Counter(dict(zip(words[present].tolist(), column[present].tolist())))
+        return Counter(doc_labels), word_counts, doc_freqs
+
+    def fit_token_ids(self, words, ids, doc_ids, doc_labels):
+        """fit() on pre-tokenized documents, see count_token_ids"""
+        self._fit_counts(*self.count_token_ids(words, ids, doc_ids, doc_labels))
+
+    def merge_counts(self, totals, counts):
+        """Add counts from count() into totals, a tuple of the same shape, in place."""
+        doc_counts, word_counts, doc_freqs = totals
+        chunk_docs, chunk_words, chunk_doc_freqs = counts
+        doc_counts.update(chunk_docs)
+        for label, label_counts in chunk_words.items():
+            if label not in word_counts:
+                word_counts[label] = Counter()
+            word_counts[label].update(label_counts)
+        doc_freqs.update(chunk_doc_freqs)
+
+    def subtract_counts(self, totals, counts):
+        """
+        totals minus counts (both shaped like count()'s result) as a new
+        tuple, e.g. the counts of every cross-validation fold but one. Words
+        and classes whose count drops to zero disappear, so fitting on the
+        result matches fitting on the remaining documents.
+        """
+        doc_counts, word_counts, doc_freqs = totals
+        part_docs, part_words, part_doc_freqs = counts
+        remaining_docs = doc_counts - part_docs
+        remaining_words = {
+            label: label_counts - part_words.get(label, Counter())
+            for label, label_counts in word_counts.items() if label in remaining_docs
+        }
+        return remaining_docs, remaining_words, doc_freqs - part_doc_freqs
+
+    def parallel_count(self, X, y, n_jobs):
+        """
+        count() as map-reduce: the corpus is split into contiguous shards,
+        each shard is counted in a worker process and the per-shard Counters
+        are merged in shard order, so the result matches count().
+        """
+        X = list(X)
+        y = list(y)
+        n_shards = max(1, min(len(y), n_jobs * 4))
+        bounds = [len(y) * i // n_shards for i in range(n_shards + 1)]
+        return self.count_chunks(((X[lo:hi], y[lo:hi]) for lo, hi in zip(bounds, bounds[1:])), n_jobs)
+
+    def count_chunks(self, chunks, n_jobs=1):
+        """
+        count() over an iterable of (X, y) chunks, merging in chunk order.
+        With n_jobs > 1 chunks are counted in a process pool with at most
+        2 * n_jobs chunks in flight, so memory stays bounded for streams.
+        """
+        totals = (Counter(), {}, Counter())
+
+        def merge(counts):
+            self.merge_counts(totals, counts)
+
+        if n_jobs <= 1:
+            for X, y in chunks:
+                merge(self.count(X, y))
+            return totals
+
+        # Training only; keeps multiprocessing out of the serving imports
+        from concurrent.futures import ProcessPoolExecutor
+        pending = deque()
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            for X, y in chunks:
+                pending.append(pool.submit(_count_shard, (self._empty_copy(), X, y)))
+                if len(pending) >= 2 * n_jobs:
+                    merge(pending.popleft().result())
+            while pending:
+                merge(pending.popleft().result())
+        return totals
+
+    def _empty_copy(self):
+        """Unfitted model with the same tokenizer settings, e.g. for worker processes."""
+        return type(self)(**self.tokenizer_params())
+
+    def tokenizer_params(self):
+        """Constructor arguments that define how texts become features."""
+        return {
+            'min_df': getattr(self, 'min_df', 1),
+            'max_features': getattr(self, 'max_features', None),
+            'selection': getattr(self, 'selection', 'frequency'),
+        }
+
+    def tokenizer_config(self):
+        """Tokenizer description stored in the model artifact."""
+        return {'mode': 'vocabulary', **self.tokenizer_params()}
+
+    def _add_counts(self, doc_counts, word_counts):
+        """Merge counts produced by count() into the model and refresh priors."""
+        for label, n_docs in doc_counts.items():
+            if label not in self.class_doc_counts:
+                self.class_doc_counts[label] = 0
+                self.word_counts[label] = defaultdict(int)
+                self.class_word_totals[label] = 0
+            self.class_doc_counts[label] += n_docs
+        for label, counts in word_counts.items():
+            label_counts = self.word_counts[label]
+            for word, n in counts.items():
+                label_counts[word] += n
+            self.class_word_totals[label] += sum(counts.values())
+            self.vocab.update(counts)
+        total_samples = sum(self.class_doc_counts.values())
+        self.class_priors = {label: count / total_samples for label, count in self.class_doc_counts.items()}
+
+    def _thaw(self):
+        """
+        Rebuild the word_counts/vocab training dicts from the compiled arrays
+        of a model loaded with from_arrays().
+        """
+        compiled = getattr(self, '_compiled', None)
+        if compiled is None or self.vocab or not len(compiled['vocab']):
+            return
+        words = [word.decode('ascii') for word in compiled['vocab'].tolist()]
+        counts = np.asarray(compiled['counts'])
+        for j, label in enumerate(compiled['classes']):
+            column = counts[:, j].tolist()
+            self.word_counts[label] = defaultdict(int, ((w, n) for w, n in zip(words, column) if n))
+        self.vocab = set(words)
+
+    def compile(self):
+        """
+        Freeze the fitted counts into a sorted vocabulary array and a dense
+        matrix of per-class log-likelihoods.
+
+        Rows 0..V-1 hold log((count+1)/(total+V)) for each vocabulary word,
+        row V holds the same value for an unseen word and row V+1 holds the
+        log prior, so scoring a text is a sum of rows.
+
+        A pruned model only describes the words it kept, so words outside
+        its vocabulary are skipped (row V is zero) rather than scored as
+        unseen; otherwise every pruned hapax would count against the class
+        with the larger vocabulary.
+        """
+        if not self.fitted:
+            raise Exception("Model not trained. Call fit() first.")
+        classes = list(self.class_priors)
+        words = sorted(self.vocab)
+        vocab_size = len(words)
+        counts = np.zeros((vocab_size + 1, len(classes)), dtype=np.int64)
+        for j, label in enumerate(classes):
+            label_counts = self.word_counts[label]
+            counts[:vocab_size, j] = [label_counts.get(word, 0) for word in words]
+        totals = np.array([self.class_word_totals[label] for label in classes], dtype=np.int64)
+        log_lik = np.empty((vocab_size + 2, len(classes)), dtype=np.float64)
+        log_lik[:vocab_size + 1] = np.log((counts + 1) / (totals + vocab_size))
+        if self.prunes_vocab:
+            log_lik[vocab_size] = 0.0
+        log_lik[vocab_size + 1] = np.log([self.class_priors[label] for label in classes])
+        # Tokens are ASCII, so the vocabulary is stored as bytes.
+        vocab = np.array([word.encode('ascii') for word in words], dtype=np.bytes_)
+        return self._set_compiled(classes, vocab, counts[:vocab_size], log_lik)
+
+    def _set_compiled(self, classes, vocab, counts, log_lik):
+        """
+        Install compiled arrays. Tokens are looked up by binary search of the
+        sorted vocabulary (see _columns), so a memory-mapped vocabulary is
+        shared between worker processes instead of copied into a dict each.
+        """
+        vocab_size = len(vocab)
+        self._compiled = {
+            'classes': list(classes),
+            'vocab': vocab,
+            'counts': counts,
+            'log_lik': log_lik,
+            'unseen': vocab_size,
+            'prior': vocab_size + 1,
+        }
+        return self._compiled
+
+    @classmethod
+    def from_arrays(cls, classes, class_priors, class_word_totals, vocab, counts, log_lik,
+                    class_doc_counts=None, **params):
+        """
+        Build a fitted model straight from compiled arrays (e.g. a memory-mapped
+        artifact). Only the compiled prediction path is available until
+        partial_fit() rebuilds the word_counts/vocab training dicts.
+        params are the tokenizer_params() the model was trained with.
+        """
+        model = cls(**params)
+        model.class_priors = {label: class_priors[label] for label in classes}
+        model.class_word_totals = {label: class_word_totals[label] for label in classes}
+        model.class_doc_counts = (
+            {label: class_doc_counts[label] for label in classes} if class_doc_counts else None
+        )
+        model.fitted = True
+        model._set_compiled(classes, vocab, counts, log_lik)
+        return model
+
+    @property
+    def vocab_size(self):
+        if getattr(self, '_compiled', None) is not None:
+            return len(self._compiled['vocab'])
+        return len(self.vocab)
+
+    def _columns(self, tokens):
+        """
+        Column ids of a list of byte-string tokens, the unseen row for
+        words outside the vocabulary, and the tokens as a NumPy array (in
+        which separator tokens read as b'', since NumPy drops trailing NULs).
+        """
+        compiled = self._compiled
+        vocab, unseen = compiled['vocab'], compiled['unseen']
+        keys = np.array(tokens, dtype=np.bytes_)
+        if not len(vocab) or not len(keys):
+            return np.full(len(keys), unseen, dtype=np.intp), keys
+        too_long = None
+        if keys.dtype.itemsize > vocab.dtype.itemsize:
+            # Longer than every vocabulary word, so they must not match once
+            # truncated to the vocabulary's width
+            too_long = np.char.str_len(keys) > vocab.dtype.itemsize
+        # Same width as the vocabulary, or searchsorted casts on every call
+        keys = keys.astype(vocab.dtype, copy=False)
+        columns = np.searchsorted(vocab, keys)
+        missing = vocab.take(columns, mode='clip') != keys
+        if too_long is not None:
+            missing |= too_long
+        columns[missing] = unseen
+        return columns, keys
+
+    def _token_ids(self, X):
+        """
+        Map a batch of texts to flat column ids and matching document ids,
+        i.e. the non-zero entries of a sparse document x token count matrix.
+
+        The batch is tokenized in one pass: texts are joined with a separator
+        token that maps to the prior row, so every document starts with its
+        prior and document ids fall out of a cumulative sum.
+        """
+        compiled = self._compiled
+        sep = ' ' + _DOC_SEP + ' '
+        joined = sep + sep.join([text.replace(_DOC_SEP, ' ') for text in X])
+        # Same tokens as preprocess(): non-ASCII characters become '?' and
+        # then spaces, leaving only runs of a-z.
+        tokens = joined.lower().encode('ascii', 'replace').translate(_BYTE_TABLE).split()
+        ids, keys = self._columns(tokens)
+        is_sep = keys == b''
+        ids[is_sep] = compiled['prior']
+        doc_ids = np.cumsum(is_sep) - 1
+        return ids, doc_ids
 
     def predict(self, X, return_confidence=False):
         """
@@ -55,7 +470,129 @@ class NaiveBayesAlgorithmFromScratch:
             return list(zip(predictions, confidences, proba))
         return predictions
 
+    def predict_log_proba_matrix(self, X):
+        """
+        Unnormalised per-class log-probabilities for a batch of texts as an
+        (n_texts, n_classes) array, columns ordered like self.class_priors.
+        """
+        log_lik = self._compiled_model()['log_lik']
+        if len(X) == 0:
+            return np.empty((0, log_lik.shape[1]), dtype=np.float64)
+        if len(X) == 1:
+            return np.array([self._score_text(X[0])], dtype=np.float64)
+        with span('preprocess'):
+            ids, doc_ids = self._token_ids(X)
+        return self._score_ids(ids, doc_ids, len(X))
+
+    def _compiled_model(self):
+        if not self.fitted:
+            raise Exception("Model not trained. Call fit() first.")
+        if getattr(self, '_compiled', None) is None:
+            self.compile()
+        return self._compiled
+
+    def _score_text(self, text):
+        """
+        Log-probabilities of a single text as a list (the /api/detect/ case).
+        Skips the join, the cumsum over document ids and the bincounts that
+        only pay off for a batch; the rows are still summed in token order
+        from the prior, so the result equals _score_ids.
+        """
+        compiled = self._compiled
+        with span('preprocess'):
+            tokens = text.replace(_DOC_SEP, ' ').lower().encode('ascii', 'replace').translate(_BYTE_TABLE).split()
+            ids = np.empty(len(tokens) + 1, dtype=np.intp)
+            ids[0] = compiled['prior']
+            ids[1:] = self._columns(tokens)[0]
+        with span('predict_proba'):
+            # cumsum adds the rows one after another, like bincount
+            return np.cumsum(compiled['log_lik'].take(ids, axis=0), axis=0)[-1].tolist()
+
+    def _score_ids(self, ids, doc_ids, n_docs):
+        """Log-probabilities from row ids of log_lik and the document of each"""
+        log_lik = self._compiled['log_lik']
+        with span('predict_proba'):
+            rows = log_lik[ids]
+            # Sparse count-matrix x log-prob-matrix product. bincount adds the
+            # rows of each document in token order, which keeps the sums
+            # identical to the word-by-word loop.
+            log_probs = np.empty((n_docs, log_lik.shape[1]), dtype=np.float64)
+            for j in range(log_lik.shape[1]):
+                log_probs[:, j] = np.bincount(doc_ids, weights=rows[:, j], minlength=n_docs)
+        return log_probs
+
+    def predict_proba_matrix(self, X):
+        """Class probabilities for a batch of texts as an (n_texts, n_classes) array."""
+        return self._normalize(self.predict_log_proba_matrix(X))
+
+    @staticmethod
+    def _normalize(proba):
+        """Turn a log-probability matrix into probabilities, in place"""
+        proba -= proba.max(axis=1, keepdims=True)
+        np.exp(proba, out=proba)
+        total = proba[:, 0].copy()
+        for j in range(1, proba.shape[1]):
+            total += proba[:, j]
+        proba /= total[:, None]
+        return proba
+
     def predict_proba(self, X):
+        if len(X) == 1:
+            # One text: normalize the plain floats rather than a 1-row matrix,
+            # with np.exp like _normalize (math.exp can differ in the last bit)
+            compiled = self._compiled_model()
+            log_probs = self._score_text(X[0])
+            top = max(log_probs)
+            probs = [np.exp(log_prob - top) for log_prob in log_probs]
+            total = sum(probs)
+            return [{label: float(prob / total) for label, prob in zip(compiled['classes'], probs)}]
+        proba = self.predict_proba_matrix(X)
+        classes = self._compiled['classes']
+        return [dict(zip(classes, row)) for row in proba.tolist()]
+
+    def predict_token_ids(self, words, ids, doc_ids, n_docs):
+        """
+        predict() for pre-tokenized documents (see count_token_ids); gives
+        the same labels as predict() on the original texts.
+        """
+        if not self.fitted:
+            raise Exception("Model not trained. Call fit() first.")
+        if getattr(self, '_compiled', None) is None:
+            self.compile()
+        if n_docs == 0:
+            return []
+        with span('preprocess'):
+            feature_ids, feature_docs = self._token_ids_from_words(words, ids, doc_ids, n_docs)
+        proba = self._normalize(self._score_ids(feature_ids, feature_docs, n_docs))
+        classes = self._compiled['classes']
+        return [classes[i] for i in proba.argmax(axis=1).tolist()]
+
+    def _token_ids_from_words(self, words, ids, doc_ids, n_docs):
+        """
+        _token_ids() for pre-tokenized documents: each document's prior row
+        followed by its tokens' rows, in the same order as _token_ids.
+        """
+        compiled = self._compiled
+        columns, _ = self._columns([word.encode('ascii') for word in words])
+        lengths = np.bincount(doc_ids, minlength=n_docs)
+        starts = np.zeros(n_docs, dtype=np.intp)
+        np.cumsum(lengths[:-1] + 1, out=starts[1:])
+        out_ids = np.empty(len(ids) + n_docs, dtype=np.intp)
+        out_docs = np.empty(len(ids) + n_docs, dtype=np.intp)
+        is_prior = np.zeros(len(out_ids), dtype=bool)
+        is_prior[starts] = True
+        out_ids[is_prior] = compiled['prior']
+        out_ids[~is_prior] = columns[ids]
+        out_docs[is_prior] = np.arange(n_docs)
+        out_docs[~is_prior] = doc_ids
+        return out_ids, out_docs
+
+    def _predict_proba_loop(self, X):
+        """
+        Reference word-by-word implementation of predict_proba. Only for
+        unpruned models: it scores words dropped by min_df/max_features as
+        unseen, while the compiled model ignores them.
+        """
         if not self.fitted:
             raise Exception("Model not trained. Call fit() first.")
         results = []
@@ -83,4 +620,293 @@ class NaiveBayesAlgorithmFromScratch:
         """
         preds = self.predict(X)
         correct = sum(p == t for p, t in zip(preds, y))
-        return correct / len(y) 
\ No newline at end of file
+        return correct / len(y) 
+
+
+
+class HashingNaiveBayes(NaiveBayesAlgorithmFromScratch):
+    """
+    Naive Bayes over hashed features: every token (and, with bigrams, every
+    pair of adjacent tokens) is hashed into one of n_buckets columns of a
+    fixed-size NumPy count array. Memory does not grow with the corpus and
+    inference needs no vocabulary lookups; colliding tokens share counts.
+
+    Hashes are computed for the whole batch at once with NumPy (a polynomial
+    hash over the token bytes plus a 64-bit mixer), so they are stable across
+    processes, unlike hash().
+    """
+
+    def __init__(self, n_buckets=2 ** 18, bigrams=False):
+        super().__init__()  # No vocabulary, so nothing to prune
+        self.n_buckets = int(n_buckets)
+        self.bigrams = bool(bigrams)
+        self.bucket_counts = {}        # {class: int64 array of n_buckets counts}
+
+    def tokenizer_params(self):
+        return {'n_buckets': self.n_buckets, 'bigrams': self.bigrams}
+
+    def tokenizer_config(self):
+        return {'mode': 'hashing', **self.tokenizer_params()}
+
+    def _reset(self):
+        super()._reset()
+        self.bucket_counts = {}
+
+    def _token_hashes(self, X):
+        """
+        64-bit hash of every token in a batch of texts, in order, and the
+        index of the text each one came from.
+        """
+        sep = ' ' + _DOC_SEP + ' '
+        joined = sep + sep.join([text.replace(_DOC_SEP, ' ') for text in X]) + ' '
+        # Same tokens as preprocess(), as bytes in a-z plus the separator
+        data = np.frombuffer(
+            joined.lower().encode('ascii', 'replace').translate(_BYTE_TABLE), dtype=np.uint8
+        )
+        in_token = data != 32
+        edges = np.flatnonzero(np.diff(in_token.view(np.int8)))
+        starts, ends = edges[0::2] + 1, edges[1::2] + 1
+        is_sep = data[starts] == 0
+        token_docs = np.cumsum(is_sep) - 1
+
+        # sum(byte * P**i) over each token, from prefix sums of byte * P**k
+        # shifted back by P**-start; uint64 arithmetic wraps mod 2**64.
+        powers, inverse_powers = _hash_powers(len(data))
+        prefix = np.zeros(len(data) + 1, dtype=np.uint64)
+        np.cumsum(data * powers, out=prefix[1:])
+        hashes = _mix64((prefix[ends] - prefix[starts]) * inverse_powers[starts])
+        keep = ~is_sep
+        return hashes[keep], token_docs[keep]
+
+    def _features(self, X):
+        """
+        Bucket ids of every feature in a batch of texts and the index of the
+        text each one came from.
+        """
+        return self._features_from_hashes(*self._token_hashes(X))
+
+    def _features_from_hashes(self, hashes, docs):
+        """Unigram (and bigram) bucket ids from token hashes in document order"""
+        features = [hashes]
+        feature_docs = [docs]
+        if self.bigrams:
+            # Adjacent tokens of the same text
+            pairs = docs[:-1] == docs[1:]
+            features.append(_mix64(hashes[:-1][pairs] * _BIGRAM_MULT + hashes[1:][pairs]))
+            feature_docs.append(docs[:-1][pairs])
+        ids = (np.concatenate(features) % np.uint64(self.n_buckets)).astype(np.intp)
+        return ids, np.concatenate(feature_docs)
+
+    def _word_features(self, words, ids, doc_ids):
+        """_features() for pre-tokenized documents: hash each distinct word once"""
+        word_hashes, _ = self._token_hashes(list(words)) if len(words) else (np.empty(0, dtype=np.uint64), None)
+        return self._features_from_hashes(word_hashes[ids], np.asarray(doc_ids, dtype=np.intp))
+
+    def _token_ids(self, X):
+        # Feature rows plus one prior row per text, for predict_log_proba_matrix
+        return self._with_priors(*self._features(X), len(X))
+
+    def _token_ids_from_words(self, words, ids, doc_ids, n_docs):
+        return self._with_priors(*self._word_features(words, ids, doc_ids), n_docs)
+
+    def _score_text(self, text):
+        # Hashing is vectorized over the byte string already
+        with span('preprocess'):
+            ids, doc_ids = self._token_ids([text])
+        return self._score_ids(ids, doc_ids, 1)[0].tolist()
+
+    def _with_priors(self, ids, doc_ids, n_docs):
+        return (
+            np.concatenate([ids, np.full(n_docs, self._compiled['prior'], dtype=np.intp)]),
+            np.concatenate([doc_ids, np.arange(n_docs)]),
+        )
+
+    def count(self, X, y):
+        """
+        Returns (doc_counts, word_counts, doc_freqs) like the base class, but
+        word_counts maps each class to an int64 array of n_buckets feature
+        counts and doc_freqs is always empty (no pruning).
+        """
+        y = list(y)
+        labels = list(dict.fromkeys(y))
+        label_ids = {label: i for i, label in enumerate(labels)}
+        doc_labels = np.array([label_ids[label] for label in y], dtype=np.intp)
+        ids, doc_ids = self._features(X)
+        feature_labels = doc_labels[doc_ids]
+        word_counts = {
+            label: np.bincount(ids[feature_labels == i], minlength=self.n_buckets).astype(np.int64)
+            for i, label in enumerate(labels)
+        }
+        return Counter(y), word_counts, Counter()
+
+    def count_token_ids(self, words, ids, doc_ids, doc_labels):
+        classes = list(dict.fromkeys(doc_labels))
+        label_ids = np.array([classes.index(label) for label in doc_labels], dtype=np.intp)
+        features, feature_docs = self._word_features(words, ids, doc_ids)
+        feature_labels = label_ids[feature_docs]
+        word_counts = {
+            label: np.bincount(features[feature_labels == i], minlength=self.n_buckets).astype(np.int64)
+            for i, label in enumerate(classes)
+        }
+        return Counter(doc_labels), word_counts, Counter()
+
+    def merge_counts(self, totals, counts):
+        doc_counts, word_counts, _ = totals
+        chunk_docs, chunk_words, _ = counts
+        doc_counts.update(chunk_docs)
+        for label, label_counts in chunk_words.items():
+            if label in word_counts:
+                word_counts[label] += label_counts
+            else:
+                word_counts[label] = np.array(label_counts, dtype=np.int64)
+
+    def subtract_counts(self, totals, counts):
+        doc_counts, word_counts, _ = totals
+        part_docs, part_words, _ = counts
+        remaining_docs = doc_counts - part_docs
+        remaining_words = {
+            label: label_counts - part_words[label] if label in part_words else label_counts.copy()
+            for label, label_counts in word_counts.items() if label in remaining_docs
+        }
+        return remaining_docs, remaining_words, Counter()
+
+    def _model_counts(self):
+        return (
+            Counter(self.class_doc_counts),
+            {label: self.bucket_counts[label] for label in self.class_doc_counts},
+            Counter(),
+        )
+
+    def _add_counts(self, doc_counts, word_counts):
+        for label, n_docs in doc_counts.items():
+            if label not in self.class_doc_counts:
+                self.class_doc_counts[label] = 0
+                self.bucket_counts[label] = np.zeros(self.n_buckets, dtype=np.int64)
+                self.class_word_totals[label] = 0
+            self.class_doc_counts[label] += n_docs
+        for label, counts in word_counts.items():
+            self.bucket_counts[label] += counts
+            self.class_word_totals[label] += int(counts.sum())
+        total_samples = sum(self.class_doc_counts.values())
+        self.class_priors = {label: count / total_samples for label, count in self.class_doc_counts.items()}
+
+    def _thaw(self):
+        compiled = getattr(self, '_compiled', None)
+        if compiled is None or self.bucket_counts:
+            return
+        # Copies: loaded arrays may be read-only memory maps
+        counts = np.array(compiled['counts'], dtype=np.int64)
+        for j, label in enumerate(compiled['classes']):
+            self.bucket_counts[label] = counts[:, j].copy()
+
+    def compile(self):
+        """
+        Rows 0..n_buckets-1 hold log((count+1)/(total+F)) per bucket and row
+        n_buckets holds the log prior. F is the number of occupied buckets,
+        the hashed equivalent of the vocabulary size, so with no collisions
+        the model matches the vocabulary one.
+        """
+        if not self.fitted:
+            raise Exception("Model not trained. Call fit() first.")
+        classes = list(self.class_priors)
+        counts = np.column_stack([self.bucket_counts[label] for label in classes])
+        n_features = int(np.count_nonzero(counts.any(axis=1)))
+        totals = np.array([self.class_word_totals[label] for label in classes], dtype=np.int64)
+        log_lik = np.empty((self.n_buckets + 1, len(classes)), dtype=np.float64)
+        log_lik[:self.n_buckets] = np.log((counts + 1) / (totals + n_features))
+        log_lik[self.n_buckets] = np.log([self.class_priors[label] for label in classes])
+        return self._set_compiled(classes, None, counts, log_lik)
+
+    def _set_compiled(self, classes, vocab, counts, log_lik):
+        self._compiled = {
+            'classes': list(classes),
+            'counts': counts,
+            'log_lik': log_lik,
+            'n_features': int(np.count_nonzero(np.asarray(counts).any(axis=1))),
+            'prior': self.n_buckets,
+        }
+        return self._compiled
+
+    @property
+    def vocab_size(self):
+        """Occupied buckets, i.e. distinct features after hashing."""
+        if getattr(self, '_compiled', None) is not None:
+            return self._compiled['n_features']
+        return int(np.count_nonzero(sum(self.bucket_counts.values()))) if self.bucket_counts else 0
+
+    def _predict_proba_loop(self, X):
+        raise Exception("HashingNaiveBayes has no word-by-word reference implementation.")
+
+
+def build_model(config=None):
+    """
+    Build an unfitted model from a settings dict such as
+    settings.SCAM_DETECTOR_TOKENIZER:
+    {'MODE': 'vocabulary' | 'hashing', 'N_BUCKETS': ..., 'BIGRAMS': ...,
+     'MIN_DF': ..., 'MAX_FEATURES': ..., 'SELECTION': ...}
+    """
+    config = config or {}
+    if config.get('MODE') == 'hashing':
+        return HashingNaiveBayes(n_buckets=config.get('N_BUCKETS', 2 ** 18), bigrams=config.get('BIGRAMS', False))
+    return NaiveBayesAlgorithmFromScratch(
+        min_df=config.get('MIN_DF', 1),
+        max_features=config.get('MAX_FEATURES'),
+        selection=config.get('SELECTION', 'frequency'),
+    )
+
+
+def feature_scores(counts, selection):
+    """
+    Per-word scores for a (words, classes) matrix of word counts, higher is
+    better. 'frequency' is the total count; 'chi2' and 'mutual_info' treat
+    every token as one observation of (word, class), as the multinomial
+    model does.
+    """
+    word_totals = counts.sum(axis=1)
+    if selection == 'frequency':
+        return word_totals
+    class_totals = counts.sum(axis=0)
+    n = class_totals.sum()
+    if selection == 'chi2':
+        expected = word_totals[:, None] * (class_totals / n)[None, :]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.nansum((counts - expected) ** 2 / expected, axis=1)
+    if selection == 'mutual_info':
+        # I(word present; class) over the 2 x n_classes table of each word
+        score = np.zeros(len(counts))
+        for joint, marginal in ((counts, word_totals), (class_totals[None, :] - counts, n - word_totals)):
+            with np.errstate(divide='ignore', invalid='ignore'):
+                terms = joint / n * np.log(joint * n / (marginal[:, None] * class_totals[None, :]))
+            score += np.nansum(np.where(joint > 0, terms, 0.0), axis=1)
+        return score
+    raise Exception(f"Unknown feature selection {selection!r}; use one of {FEATURE_SELECTIONS}.")
+
+
+def _mix64(x):
+    """splitmix64 finalizer, so the low bits used for bucketing are well mixed."""
+    x = x ^ (x >> np.uint64(30))
+    x *= np.uint64(0xbf58476d1ce4e5b9)
+    x ^= x >> np.uint64(27)
+    x *= np.uint64(0x94d049bb133111eb)
+    x ^= x >> np.uint64(31)
+    return x
+
+
+def _hash_powers(n):
+    """P**k and P**-k mod 2**64 for k < n, grown and cached across calls."""
+    global _HASH_POWERS
+    powers, inverse_powers = _HASH_POWERS
+    if len(powers) < n:
+        size = max(n, 2 * len(powers), 1 << 16)
+        powers = np.cumprod(np.full(size, _HASH_MULT, dtype=np.uint64))
+        inverse_powers = np.cumprod(np.full(size, _HASH_MULT_INVERSE, dtype=np.uint64))
+        powers[1:] = powers[:-1].copy()
+        inverse_powers[1:] = inverse_powers[:-1].copy()
+        powers[0] = inverse_powers[0] = 1
+        _HASH_POWERS = (powers, inverse_powers)
+    return powers[:n], inverse_powers[:n]
+
+def _count_shard(shard):
+    """Worker for parallel_count(); module level so it can be pickled."""
+    model, X, y = shard
+    return model.count(X, y)
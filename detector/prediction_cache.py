@@ -0,0 +1,128 @@
+"""
+Cache of prediction results in front of ScamDetector.
+
+Keys are a hash of the token sequence produced by preprocess() plus the
+model's content hash: texts that differ only in case, digits or punctuation
+share an entry, and loading a different model invalidates everything
+without an explicit flush.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+def cache_key(tokens, model_version):
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(model_version.encode('ascii'))
+    digest.update(b'\x00')
+    digest.update(' '.join(tokens).encode('ascii', 'replace'))
+    return 'scam-detector:prediction:' + digest.hexdigest()
+
+
+class PredictionCache:
+    """Base class: hit/miss counters around get_many/set_many."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def get_many(self, keys):
+        found = self._get_many(keys)
+        with self._stats_lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def set_many(self, items):
+        self._set_many(items)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'size': self.size(),
+        }
+
+    def size(self):
+        return None
+
+
+class LocalPredictionCache(PredictionCache):
+    """In-process LRU with an optional TTL (seconds)."""
+
+    def __init__(self, max_size=10000, ttl=None):
+        super().__init__()
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def _get_many(self, keys):
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                if entry[0] is not None and entry[0] <= now:
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = entry[1]
+        return found
+
+    def _set_many(self, items):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            for key, value in items.items():
+                self._entries[key] = (expires_at, value)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def size(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class DjangoPredictionCache(PredictionCache):
+    """
+    Uses a Django cache backend, so workers share entries when that backend
+    is shared (Redis, Memcached, database). Eviction is the backend's.
+    """
+
+    def __init__(self, alias='default', ttl=None):
+        super().__init__()
+        from django.core.cache import caches
+        self.cache = caches[alias]
+        self.ttl = ttl
+
+    def _get_many(self, keys):
+        return self.cache.get_many(keys)
+
+    def _set_many(self, items):
+        self.cache.set_many(items, timeout=self.ttl)
+
+    def clear(self):
+        self.cache.clear()
+
+
+def build_cache(config):
+    """
+    Build a cache from a settings dict such as settings.SCAM_DETECTOR_CACHE:
+    {'BACKEND': 'local' | 'django' | None, 'MAX_SIZE': ..., 'TTL': ..., 'ALIAS': ...}
+    """
+    backend = (config or {}).get('BACKEND')
+    if backend == 'local':
+        return LocalPredictionCache(max_size=config.get('MAX_SIZE', 10000), ttl=config.get('TTL'))
+    if backend == 'django':
+        return DjangoPredictionCache(alias=config.get('ALIAS', 'default'), ttl=config.get('TTL'))
+    return None
@@ -0,0 +1,67 @@
+"""
+EXPLAIN checks for the DetectionHistory queries behind the history pages.
+
+Each query must be served by an index: a plan that scans the whole table,
+or sorts the rows after reading them, is reported as a problem. Run by the
+test suite (detector.tests.QueryPlanTests) and by
+`manage.py check_query_plans` against a real database.
+"""
+import re
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.utils import timezone
+
+from detector.models import DetectionHistory
+from detector.views import analysis_queryset, history_queryset, recent_detections_queryset
+
+TABLE = DetectionHistory._meta.db_table
+# Plan lines that mean every row is read, or the rows are sorted after reading them
+PROBLEMS = {
+    'sqlite': [
+        (re.compile(rf'\bSCAN {TABLE}\b(?! USING (COVERING )?INDEX)'), 'full table scan'),
+        (re.compile(r'USE TEMP B-TREE FOR (RIGHT PART OF )?ORDER BY'), 'sort'),
+    ],
+    'postgresql': [
+        (re.compile(rf'Seq Scan on {TABLE}\b'), 'full table scan'),
+        (re.compile(r'(?<!Incremental )\bSort\b'), 'sort'),
+    ],
+}
+
+
+def view_querysets():
+    """(name, queryset) for every DetectionHistory query the history and analysis pages run"""
+    today = timezone.now().date()
+    querysets = []
+    for owner, user in (('user', User(pk=1)), ('anonymous', None)):
+        querysets += [
+            (f'detection_history ({owner})', history_queryset(user)),
+            (f'detection_history ({owner}, scams)', history_queryset(user, 'scam')),
+            (f'detection_history ({owner}, legitimate)', history_queryset(user, 'legitimate')),
+            (f'results_analysis ({owner})', analysis_queryset(user, today - timedelta(days=7), today)),
+        ]
+    querysets.append(('profile (recent detections)', recent_detections_queryset(User(pk=1))))
+    return querysets
+
+
+def supported():
+    return connection.vendor in PROBLEMS
+
+
+def check_plans():
+    """
+    [(name, queryset, plan, problems)] for view_querysets(), problems being
+    the labels of the PROBLEMS patterns found in the plan
+    """
+    patterns = PROBLEMS[connection.vendor]
+    results = []
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                # A small or empty table is cheapest to scan; ask whether an index could serve the query
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        for name, queryset in view_querysets():
+            plan = queryset.explain()
+            results.append((name, queryset, plan, [label for pattern, label in patterns if pattern.search(plan)]))
+    return results
@@ -0,0 +1,231 @@
+"""
+Hourly and daily rollups of DetectionHistory, so dashboards read one row per
+day instead of counting raw detections.
+
+catch_up() finds the hours touched since the watermark (detections with a
+higher id, and feedback given since the last run), recomputes those hour
+buckets from the raw rows and rebuilds the affected day buckets from their
+hours. Buckets are recomputed rather than incremented, so a repeated or
+interrupted run never double counts and feedback that changes later is
+picked up. It runs from `manage.py rollup_statistics` on a schedule. With
+CATCH_UP_ON_READ (the default) a dashboard read that finds detections or
+feedback past the watermark also rolls up to READ_BATCH_SIZE of them first,
+so the dashboards work without the schedule; when the rollups are current a
+read only costs two indexed EXISTS queries.
+
+Ids are handed out when a row is inserted but become visible when its
+transaction commits, so a row can appear below the watermark after a run
+has passed it. Each run therefore also looks at the last ID_OVERLAP ids
+before the watermark.
+
+Configured by settings.SCAM_DETECTOR_ROLLUPS.
+"""
+import logging
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Q, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from .models import DetectionHistory, DetectionRollup, RollupWatermark
+
+DEFAULTS = {
+    'CATCH_UP_ON_READ': True,
+    'READ_BATCH_SIZE': 5000,
+}
+WATERMARK_NAME = 'detection_rollups'
+HOUR = timedelta(hours=1)
+DAY = timedelta(days=1)
+# Feedback saved just before a run can commit just after it, so look back a little
+FEEDBACK_OVERLAP = timedelta(minutes=1)
+# Likewise detections: ids below the watermark re-scanned on every run
+ID_OVERLAP = 1000
+logger = logging.getLogger(__name__)
+
+SUM_FIELDS = (
+    'detections',
+    'feedback_correct',
+    'feedback_incorrect',
+    'confidence_sum',
+    'probability_count',
+    'probability_spam_sum',
+    'probability_ham_sum',
+)
+
+
+def _hour_aggregates(start):
+    return DetectionHistory.objects.filter(
+        detected_at__gte=start,
+        detected_at__lt=start + HOUR
+    ).order_by().values('user_id', 'is_scam').annotate(
+        detections=Count('id'),
+        feedback_correct=Count('id', filter=Q(user_feedback='correct')),
+        feedback_incorrect=Count('id', filter=Q(user_feedback='incorrect')),
+        confidence_sum=Sum('confidence_score'),
+        probability_count=Count('probability_spam'),
+        probability_spam_sum=Sum('probability_spam'),
+        probability_ham_sum=Sum('probability_ham'),
+    )
+
+
+def _day_aggregates(start):
+    return DetectionRollup.objects.filter(
+        granularity='hour',
+        bucket_start__gte=start,
+        bucket_start__lt=start + DAY
+    ).order_by().values('user_id', 'is_scam').annotate(**{field: Sum(field) for field in SUM_FIELDS})
+
+
+def _replace_bucket(granularity, start, rows):
+    DetectionRollup.objects.filter(granularity=granularity, bucket_start=start).delete()
+    DetectionRollup.objects.bulk_create([
+        DetectionRollup(
+            granularity=granularity,
+            bucket_start=start,
+            user_id=row['user_id'],
+            is_scam=row['is_scam'],
+            **{field: row[field] or 0 for field in SUM_FIELDS}
+        )
+        for row in rows
+    ])
+
+
+def rebuild_buckets(hours):
+    """Recompute the given hour buckets and the day buckets containing them"""
+    days = set()
+    for hour in sorted(hours):
+        _replace_bucket('hour', hour, _hour_aggregates(hour))
+        days.add(timezone.localtime(hour).replace(hour=0, minute=0, second=0, microsecond=0))
+    for day in sorted(days):
+        _replace_bucket('day', day, _day_aggregates(day))
+    return len(days)
+
+
+def catch_up(batch_size=None):
+    """
+    Roll up detections after the watermark (at most batch_size of them) and
+    feedback given since the last run. Returns (hours, days, done) where done
+    is False if more detections are waiting.
+    """
+    with transaction.atomic():
+        RollupWatermark.objects.get_or_create(name=WATERMARK_NAME)
+        # Serializes concurrent runs on databases with row locks
+        watermark = RollupWatermark.objects.select_for_update().get(name=WATERMARK_NAME)
+        now = timezone.now()
+
+        max_id = DetectionHistory.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+        last_id = max_id
+        if batch_size:
+            last_id = min(max_id, watermark.last_detection_id + batch_size)
+        hours = set(DetectionHistory.objects.filter(
+            id__gt=max(0, watermark.last_detection_id - ID_OVERLAP),
+            id__lte=last_id
+        ).annotate(hour=TruncHour('detected_at')).order_by().values_list('hour', flat=True).distinct())
+
+        if watermark.last_feedback_at is not None:
+            hours.update(DetectionHistory.objects.filter(
+                feedback_at__gt=watermark.last_feedback_at - FEEDBACK_OVERLAP,
+                feedback_at__lte=now
+            ).annotate(hour=TruncHour('detected_at')).order_by().values_list('hour', flat=True).distinct())
+
+        days = rebuild_buckets(hours)
+        watermark.last_detection_id = max(watermark.last_detection_id, last_id)
+        watermark.last_feedback_at = now
+        watermark.save()
+    return len(hours), days, last_id >= max_id
+
+
+def rebuild_all():
+    """Drop every rollup and reset the watermark; the next catch_up starts over"""
+    with transaction.atomic():
+        DetectionRollup.objects.all().delete()
+        RollupWatermark.objects.filter(name=WATERMARK_NAME).delete()
+
+
+def is_behind():
+    """True when detections or feedback past the watermark are waiting; takes no lock"""
+    watermark = RollupWatermark.objects.filter(name=WATERMARK_NAME).first()
+    if watermark is None:
+        return DetectionHistory.objects.exists()
+    if DetectionHistory.objects.filter(id__gt=watermark.last_detection_id).exists():
+        return True
+    return watermark.last_feedback_at is not None and DetectionHistory.objects.filter(
+        feedback_at__gt=watermark.last_feedback_at
+    ).exists()
+
+
+def catch_up_on_read():
+    """Catch-up before a dashboard read, bounded by READ_BATCH_SIZE; nothing is written when current"""
+    config = {**DEFAULTS, **getattr(settings, 'SCAM_DETECTOR_ROLLUPS', {})}
+    if not config['CATCH_UP_ON_READ']:
+        return
+    try:
+        if is_behind():
+            catch_up(batch_size=config['READ_BATCH_SIZE'])
+    except Exception as e:
+        # A stale dashboard is better than a failed page
+        logger.warning("Rollup catch-up failed: %s", e)
+
+
+def _day_range(start_date, end_date):
+    """[start, end) datetimes covering an inclusive date range in the current time zone"""
+    return (
+        timezone.make_aware(datetime.combine(start_date, time.min)),
+        timezone.make_aware(datetime.combine(end_date + DAY, time.min)),
+    )
+
+
+def summarize(user, start_date=None, end_date=None):
+    """
+    Totals for one user (None = anonymous) from the day rollups, optionally
+    limited to an inclusive date range. Average probabilities are in percent.
+    """
+    rollups = DetectionRollup.objects.filter(granularity='day', user=user)
+    if start_date is not None and end_date is not None:
+        start, end = _day_range(start_date, end_date)
+        rollups = rollups.filter(bucket_start__gte=start, bucket_start__lt=end)
+    totals = {True: dict.fromkeys(SUM_FIELDS, 0), False: dict.fromkeys(SUM_FIELDS, 0)}
+    for row in rollups.order_by().values('is_scam').annotate(**{field: Sum(field) for field in SUM_FIELDS}):
+        totals[row['is_scam']] = row
+    scam, legit = totals[True], totals[False]
+    return {
+        'total': scam['detections'] + legit['detections'],
+        'scam': scam['detections'],
+        'legitimate': legit['detections'],
+        'feedback_correct': scam['feedback_correct'] + legit['feedback_correct'],
+        'feedback_incorrect': scam['feedback_incorrect'] + legit['feedback_incorrect'],
+        'avg_scam_probability': (
+            scam['probability_spam_sum'] / scam['probability_count'] if scam['probability_count'] else None
+        ),
+        'avg_legit_probability': (
+            legit['probability_ham_sum'] / legit['probability_count'] if legit['probability_count'] else None
+        ),
+    }
+
+
+def daily_totals(start_date, end_date, **filters):
+    """
+    Per-day detection counts over an inclusive date range, shaped like
+    ScamStatistics rows. Pass user=... to restrict to one user.
+    """
+    start, end = _day_range(start_date, end_date)
+    rows = DetectionRollup.objects.filter(
+        granularity='day',
+        bucket_start__gte=start,
+        bucket_start__lt=end,
+        **filters
+    ).order_by().values('bucket_start').annotate(
+        total=Sum('detections'),
+        scams=Sum('detections', filter=Q(is_scam=True)),
+    ).order_by('bucket_start')
+    return [
+        {
+            'date': timezone.localtime(row['bucket_start']).date(),
+            'total_detections': row['total'],
+            'scam_detections': row['scams'] or 0,
+            'legitimate_detections': row['total'] - (row['scams'] or 0),
+        }
+        for row in rows
+    ]
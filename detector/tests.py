@@ -0,0 +1,584 @@
+import csv
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import uuid
+from datetime import timedelta
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.db import OperationalError
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import async_views, campaigns, indicators, ml_model, model_registry, query_plans, rollups
+from .bulk_classify import classify_file, iter_messages, read_checkpoint
+from .corpus_cache import build
+from .cross_validation import cross_validate
+from .models import DetectionHistory, ModelVersion, ScamReport, ScamStatistics
+from .naive_bayes_scratch import HashingNaiveBayes, NaiveBayesAlgorithmFromScratch
+from .write_buffer import DetectionWriteBuffer
+
+TRAIN_TEXTS = [
+    'WINNER!! You have won a free prize, call now to claim',
+    'URGENT: your account is suspended, verify your bank details at once',
+    'Free entry to win cash, text WIN to claim your reward',
+    'Congratulations, you won a lottery prize of 1000 pounds',
+    'Are we still meeting for lunch tomorrow?',
+    'Can you pick up some milk on the way home',
+    'Thanks for the lift yesterday, see you at work',
+    'Running late, the bus is stuck in traffic',
+]
+TRAIN_LABELS = ['spam'] * 4 + ['ham'] * 4
+
+SCORE_TEXTS = [
+    'Call now to claim your free prize',
+    'see you at lunch',
+    '',
+    '   ',
+    '1234 5678 !!!',
+    'zyzzyva quixotic flibbertigibbet',  # Only unseen words
+    'Félicitations, vous avez gagné un prix gratuit',
+    'Gewinner! Ihr Konto wurde gesperrt — jetzt bestätigen',
+    '恭喜您中奖了 call now',
+    'Free 🎁 prize 🎉 claim now',
+    'tab\tseparated\nnew line\r\nwin',
+    'null\x00byte win prize',
+    'MiXeD CaSe WiN PrIzE',
+    'milk' * 50,
+    ' '.join(TRAIN_TEXTS),
+]
+
+
+class CompiledScorerTests(SimpleTestCase):
+    """
+    The compiled scorer must give bit-identical probabilities to the
+    word-by-word reference loop. Unpruned model only: pruning (min_df,
+    max_features) makes the compiled model ignore dropped words, which the
+    loop does not know about.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.model = NaiveBayesAlgorithmFromScratch()
+        cls.model.fit(TRAIN_TEXTS, TRAIN_LABELS)
+
+    def assertSameProba(self, actual, expected):
+        self.assertEqual(len(actual), len(expected))
+        for text, got, want in zip(SCORE_TEXTS, actual, expected):
+            with self.subTest(text=text):
+                self.assertEqual(list(got.items()), list(want.items()))
+
+    def test_batch_matches_loop(self):
+        self.assertSameProba(self.model.predict_proba(SCORE_TEXTS), self.model._predict_proba_loop(SCORE_TEXTS))
+
+    def test_single_text_matches_loop(self):
+        single = [self.model.predict_proba([text])[0] for text in SCORE_TEXTS]
+        self.assertSameProba(single, self.model._predict_proba_loop(SCORE_TEXTS))
+
+    def test_single_text_matches_batch(self):
+        batch = self.model.predict_log_proba_matrix(SCORE_TEXTS)
+        for i, text in enumerate(SCORE_TEXTS):
+            with self.subTest(text=text):
+                self.assertEqual(self.model.predict_log_proba_matrix([text])[0].tolist(), batch[i].tolist())
+
+    def test_word_longer_than_vocabulary(self):
+        # Cut to the width of the longest vocabulary word this reads "congratulations"
+        texts = ['congratulations' + 'x' * 20 + ' prize', 'a congratulations prize']
+        expected = self.model._predict_proba_loop(texts)
+        self.assertEqual(self.model.predict_proba(texts), expected)
+        self.assertEqual(self.model.predict_proba(texts[:1]), expected[:1])
+
+    def test_empty_batch(self):
+        self.assertEqual(self.model.predict_proba([]), [])
+
+
+class UnlearnCountsTests(SimpleTestCase):
+    """Relabelled feedback: unlearning a sample must undo partial_fit exactly"""
+
+    def check_round_trip(self, model):
+        model.fit(TRAIN_TEXTS, TRAIN_LABELS)
+        expected = model.predict_log_proba_matrix(SCORE_TEXTS).tolist()
+        texts, labels = ['zyzzyva claim your prize', 'lunch at noon'], ['spam', 'ham']
+        model.partial_fit(texts, labels)
+        model.unlearn_counts(*model.count(texts, labels)[:2])
+        self.assertEqual(model.predict_log_proba_matrix(SCORE_TEXTS).tolist(), expected)
+        return model
+
+    def test_vocabulary_model(self):
+        model = self.check_round_trip(NaiveBayesAlgorithmFromScratch())
+        self.assertNotIn('zyzzyva', model.vocab)
+
+    def test_hashing_model(self):
+        self.check_round_trip(HashingNaiveBayes(n_buckets=1024, bigrams=True))
+
+
+class CorpusCacheWorkersTests(SimpleTestCase):
+    """Counting the corpus cache in a process pool must give the serial result"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tmp = tempfile.mkdtemp()
+        source = os.path.join(cls.tmp, 'corpus.csv')
+        with open(source, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['v1', 'v2'])
+            for i in range(20):
+                writer.writerows(zip(TRAIN_LABELS, TRAIN_TEXTS[i % 4:] + TRAIN_TEXTS[:i % 4]))
+        cls.source = source
+        cls.corpus = build(source, os.path.join(cls.tmp, 'cache'))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+        super().tearDownClass()
+
+    def test_count_matches_serial(self):
+        model = NaiveBayesAlgorithmFromScratch()
+        mask = ~self.corpus.split_mask()
+        self.assertEqual(self.corpus.count(model, mask, n_jobs=2), self.corpus.count(model, mask))
+
+    def test_shards_cover_corpus(self):
+        shards = self.corpus.shards(7)
+        self.assertEqual(shards[0][0], 0)
+        self.assertEqual(shards[-1][1], len(self.corpus))
+        self.assertTrue(all(stop == start for (_, stop), (start, _) in zip(shards, shards[1:])))
+
+    def test_cross_validate_reports_workers(self):
+        serial = cross_validate(self.source, NaiveBayesAlgorithmFromScratch(), k=3, corpus=self.corpus)
+        pooled = cross_validate(self.source, NaiveBayesAlgorithmFromScratch(), k=3, n_jobs=2, corpus=self.corpus)
+        self.assertEqual(pooled['workers'], 2)
+        self.assertEqual(pooled['source'], 'corpus_cache')
+        self.assertEqual(pooled['aggregate']['pooled'], serial['aggregate']['pooled'])
+
+
+class BulkClassifyResumeTests(SimpleTestCase):
+    """A resumed classify_file run seeks to the checkpointed byte position"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tmp = tempfile.mkdtemp()
+        cls.model = NaiveBayesAlgorithmFromScratch()
+        cls.model.fit(TRAIN_TEXTS, TRAIN_LABELS)
+        cls.inputs = {}
+        path = os.path.join(cls.tmp, 'messages.csv')
+        with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.writer(f)
+            writer.writerow(['id', 'text'])
+            # A quoted newline makes one record span two lines
+            writer.writerows([(i, f'{text}\nline two' if i % 3 else text) for i, text in enumerate(SCORE_TEXTS)])
+        cls.inputs['csv'] = path
+        path = os.path.join(cls.tmp, 'messages.jsonl.gz')
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            for i, text in enumerate(SCORE_TEXTS):
+                f.write(json.dumps({'id': i, 'text': text}) + '\n\n')
+        cls.inputs['jsonl'] = path
+        path = os.path.join(cls.tmp, 'messages.mbox')
+        with open(path, 'w', encoding='utf-8') as f:
+            for i, text in enumerate(SCORE_TEXTS):
+                f.write(f'From sender@example.com Mon Jan  1 00:00:00 2024\nMessage-ID: <{i}@example.com>\n'
+                        f'Subject: message {i}\n\n{text}\n>From the body\n\n')
+        cls.inputs['mbox'] = path
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+        super().tearDownClass()
+
+    def test_position_resumes_after_record(self):
+        for fmt, path in self.inputs.items():
+            with self.subTest(fmt=fmt):
+                records = list(iter_messages(path))
+                self.assertEqual(len(records), len(SCORE_TEXTS))
+                for i, (_, _, end) in enumerate(records):
+                    self.assertEqual(list(iter_messages(path, position=end)), records[i + 1:])
+
+    def test_interrupted_run_resumes_to_same_output(self):
+        for fmt, path in self.inputs.items():
+            with self.subTest(fmt=fmt):
+                complete = os.path.join(self.tmp, f'complete-{fmt}.csv')
+                classify_file(path, complete, self.model, output_format='csv', chunk_size=2)
+                resumed = os.path.join(self.tmp, f'resumed-{fmt}.csv')
+
+                def interrupt(stats):
+                    raise KeyboardInterrupt
+
+                with self.assertRaises(KeyboardInterrupt):
+                    classify_file(path, resumed, self.model, output_format='csv', chunk_size=2,
+                                  progress=interrupt, progress_interval=0)
+                self.assertEqual(read_checkpoint(resumed)['next_offset'], 2)
+                stats = classify_file(path, resumed, self.model, chunk_size=2, resume=True)
+                self.assertEqual(stats['classified'], len(SCORE_TEXTS) - 2)
+                with open(complete) as a, open(resumed) as b:
+                    self.assertEqual(a.read(), b.read())
+
+
+class CampaignIndexTests(SimpleTestCase):
+    """Eviction keeps the campaign index bounded without renumbering campaigns"""
+
+    SCAMS = [
+        'Your parcel is held at customs, pay the release fee at this link today',
+        'We detected unusual activity on your bank account, confirm your password now',
+        'You have been selected for a government grant, reply with your details',
+    ]
+
+    def make_index(self, **config):
+        return campaigns.CampaignIndex({**campaigns.DEFAULTS, **config})
+
+    def test_evicts_least_recently_seen_campaigns(self):
+        index = self.make_index(MAX_CAMPAIGNS=2)
+        ids = [
+            index.add(text, seen_at, campaigns.SOURCE_REPORT, i)[0]
+            for i, (text, seen_at) in enumerate(zip(self.SCAMS, (3.0, 1.0, 2.0)))
+        ]
+        index._merge_pending()
+        index._evict()
+        self.assertEqual(index.campaign_ids.tolist(), [ids[0], ids[2]])
+        self.assertEqual(len(index.signatures), 2)
+        self.assertEqual(len(index.keys), 2 * index.hasher.bands)
+        self.assertIsNone(index.match(self.SCAMS[1]))
+        self.assertEqual(index.match(self.SCAMS[2])[0], ids[2])
+        self.assertEqual(index.campaign(ids[2])['source_id'], 2)
+        # A new campaign never reuses an evicted id
+        self.assertEqual(index.add(self.SCAMS[1], 4.0, campaigns.SOURCE_REPORT, 3), (3, 'campaign'))
+
+    def test_drops_campaigns_without_entries(self):
+        index = self.make_index(MAX_ENTRIES=1)
+        for i, text in enumerate(self.SCAMS):
+            index.add(text, float(i), campaigns.SOURCE_REPORT, i)
+        index._merge_pending()
+        index._evict()
+        self.assertEqual(index.campaign_ids.tolist(), [2])
+        self.assertEqual(index.entry_campaigns.tolist(), [2])
+
+    @override_settings(SCAM_DETECTOR_CAMPAIGNS={'ENABLED': False})
+    def test_annotate_when_disabled(self):
+        results = campaigns.annotate(['any text'], [{}])
+        self.assertEqual(results, [{'campaign_id': None, 'campaign_similarity': None}])
+
+
+class IndicatorBoundaryTests(SimpleTestCase):
+    """A domain or address must not match inside a longer one"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.matcher = indicators.IndicatorMatcher()
+        cls.matcher.add_report('evil.com, billing@scam-bank.com')
+
+    def values(self, text):
+        return [hit['value'] for hit in self.matcher.match(text)]
+
+    def test_longer_domain(self):
+        self.assertEqual(self.values('log in at evil.com.au today'), [])
+        self.assertEqual(self.values('write to billing@scam-bank.com.au'), [])
+
+    def test_sentence_end(self):
+        self.assertEqual(self.values('Log in at evil.com.'), ['evil.com'])
+        self.assertEqual(self.values('write to billing@scam-bank.com. thanks'), ['billing@scam-bank.com'])
+
+
+class IndicatorRefreshTests(TestCase):
+    """Reports verified without verified_at must not force a rebuild on every poll"""
+
+    def report(self, contact_info, **fields):
+        return ScamReport.objects.create(report_type='sms', description='scam', contact_info=contact_info, **fields)
+
+    def test_undated_reports_extend_the_matcher(self):
+        self.report('evil.com', is_verified=True)
+        config = indicators.get_config()
+        matcher = indicators.build_matcher()
+        pending = self.report('+44 7700 900123')
+        ScamReport.objects.filter(id=pending.id).update(is_verified=True)
+        self.assertIsNone(ScamReport.objects.get(id=pending.id).verified_at)
+
+        self.assertIs(indicators._refresh(matcher, config), matcher)
+        self.assertEqual(matcher.report_count, 2)
+        self.assertEqual([hit['kind'] for hit in matcher.match('call 07700 900123')], ['phone'])
+        self.assertIs(indicators._refresh(matcher, config), matcher)
+        self.assertEqual(matcher.report_count, 2)
+
+    def test_unverified_report_rebuilds(self):
+        report = self.report('evil.com', is_verified=True)
+        config = indicators.get_config()
+        matcher = indicators.build_matcher()
+        ScamReport.objects.filter(id=report.id).update(is_verified=False)
+        rebuilt = indicators._refresh(matcher, config)
+        self.assertIsNot(rebuilt, matcher)
+        self.assertEqual(rebuilt.match('evil.com'), [])
+
+
+class QueryPlanTests(TestCase):
+    """Every history page query must be served by an index (see detector.query_plans)"""
+
+    def test_history_queries_use_an_index(self):
+        if not query_plans.supported():
+            self.skipTest('no query plan patterns for this database')
+        for name, queryset, plan, problems in query_plans.check_plans():
+            with self.subTest(query=name):
+                self.assertEqual(problems, [], f'{queryset.query}\n{plan}')
+
+
+class WriteBufferTests(TestCase):
+    """Flushing, bad rows and backpressure of the detection write buffer"""
+
+    def make_buffer(self, **options):
+        buffer = DetectionWriteBuffer(**options)
+        # No flusher thread; the tests flush
+        buffer._ensure_thread = lambda: None
+        return buffer
+
+    def detection(self, text, confidence_score=90.0):
+        return DetectionHistory(text=text, is_scam=True, confidence_score=confidence_score)
+
+    def test_flush_writes_detections_and_statistics(self):
+        buffer = self.make_buffer()
+        buffer.add_detections([self.detection('one'), self.detection('two')])
+        buffer.add_statistics({timezone.now().date(): [2, 2, 0]})
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(buffer.pending(), 0)
+        self.assertEqual(DetectionHistory.objects.count(), 2)
+        self.assertEqual(ScamStatistics.objects.get().scam_detections, 2)
+
+    def test_bad_row_does_not_block_the_others(self):
+        buffer = self.make_buffer(max_attempts=2)
+        # NULL confidence_score violates NOT NULL
+        buffer.add_detections([self.detection('first'), self.detection('bad', None), self.detection('last')])
+        buffer.add_statistics({timezone.now().date(): [3, 3, 0]})
+        with self.assertLogs('detector.write_buffer', 'WARNING'):
+            self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(buffer.pending(), 1)
+        self.assertEqual(ScamStatistics.objects.get().total_detections, 3)
+
+        buffer.add_detections([self.detection('next')])
+        with self.assertLogs('detector.write_buffer', 'ERROR') as logs:
+            self.assertEqual(buffer.flush(), 1)
+        self.assertIn('after 2 failed writes', logs.output[-1])
+        self.assertEqual(buffer.pending(), 0)
+        self.assertEqual(buffer.rejected, 1)
+        self.assertEqual(
+            sorted(DetectionHistory.objects.values_list('text', flat=True)), ['first', 'last', 'next']
+        )
+
+    def test_database_error_requeues_the_batch(self):
+        buffer = self.make_buffer(max_attempts=1)
+        buffer.add_detections([self.detection('one'), self.detection('two')])
+        with mock.patch.object(DetectionHistory.objects, 'bulk_create', side_effect=OperationalError('gone away')):
+            with self.assertLogs('detector.write_buffer', 'ERROR'):
+                self.assertEqual(buffer.flush(), 0)
+        self.assertEqual((buffer.pending(), buffer.failed_flushes, buffer.rejected), (2, 1, 0))
+        self.assertEqual(buffer.flush(), 2)
+
+    def test_try_add_does_not_wait_when_full(self):
+        buffer = self.make_buffer(max_pending=2)
+        self.assertTrue(buffer.try_add_detections([self.detection('one'), self.detection('two')]))
+        self.assertFalse(buffer.try_add_detections([self.detection('three')]))
+        self.assertEqual(buffer.pending(), 2)
+
+
+@mock.patch('detector.ml_model.get_scam_detector._instance', None, create=True)
+class StatisticsApiTests(TestCase):
+    """api_statistics reads counters; it must never load (or train) a model"""
+
+    EMPTY_CACHE = {'hits': 0, 'misses': 0, 'hit_rate': 0.0, 'size': 0}
+
+    @mock.patch('detector.views.get_scam_detector', side_effect=AssertionError('model loaded'))
+    def test_does_not_load_a_model(self, get_scam_detector):
+        response = self.client.get(reverse('detector:api_statistics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['prediction_cache'], self.EMPTY_CACHE)
+
+    @mock.patch('detector.async_views.get_scam_detector', side_effect=AssertionError('model loaded'))
+    def test_async_view_does_not_load_a_model(self, get_scam_detector):
+        response = async_to_sync(async_views.api_statistics)(RequestFactory().get('/api/statistics/'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['prediction_cache'], self.EMPTY_CACHE)
+
+
+class BatchDetectApiTests(TestCase):
+    """Invalid items in /api/detect/batch/ get their own error; the rest are scored together"""
+
+    def setUp(self):
+        model = NaiveBayesAlgorithmFromScratch()
+        model.fit(TRAIN_TEXTS, TRAIN_LABELS)
+        self.detector = mock.Mock(model_version='test')
+        self.detector.predict_batch.side_effect = lambda texts: ml_model.predict_results(model, texts)
+        patcher = mock.patch('detector.views.get_scam_detector', return_value=self.detector)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, texts):
+        return self.client.post(
+            reverse('detector:api_detect_batch'), json.dumps({'texts': texts}), content_type='application/json'
+        )
+
+    def test_per_item_errors(self):
+        texts = ['Call now to claim your free prize', '', 42, None, 'see you at lunch']
+        with mock.patch('detector.views.record_detections') as record_detections:
+            response = self.post(texts)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['count'], len(texts))
+        results = data['results']
+        self.assertEqual(results[1], {'success': False, 'index': 1, 'error': 'Text is required'})
+        for i in (2, 3):
+            self.assertEqual(results[i], {'success': False, 'index': i, 'error': 'Text must be a non-empty string'})
+        self.assertEqual([item['text'] for item in (results[0], results[4])], [texts[0], texts[4]])
+        self.assertTrue(results[0]['success'] and results[0]['result']['is_scam'])
+        self.assertFalse(results[4]['result']['is_scam'])
+        self.detector.predict_batch.assert_called_once_with([texts[0], texts[4]])
+        self.assertEqual([d.text for d in record_detections.call_args.args[0]], [texts[0], texts[4]])
+
+    def test_all_items_invalid(self):
+        with mock.patch('detector.views.record_detections') as record_detections:
+            response = self.post(['', 7])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['success'] for item in response.json()['results']], [False, False])
+        record_detections.assert_called_once_with([])
+
+    def test_rejects_non_list(self):
+        for body in ({'texts': 'one text'}, {'texts': []}, ['text']):
+            with self.subTest(body=body):
+                response = self.client.post(
+                    reverse('detector:api_detect_batch'), json.dumps(body), content_type='application/json'
+                )
+                self.assertEqual(response.status_code, 400)
+
+
+class RollupTests(TestCase):
+    """Dashboard rollups must agree with the raw detection rows"""
+
+    def detect(self, is_scam=True, **fields):
+        return DetectionHistory.objects.create(text='text', is_scam=is_scam, confidence_score=80.0, **fields)
+
+    def test_detection_shows_up_in_api_statistics(self):
+        self.detect()
+        stats = self.client.get(reverse('detector:api_statistics')).json()['stats']
+        self.assertEqual([(row['total_detections'], row['scam_detections']) for row in stats], [(1, 1)])
+        self.assertFalse(rollups.is_behind())
+
+    def test_summary_matches_raw_rows(self):
+        now = timezone.now()
+        self.detect(detected_at=now - timedelta(hours=3), probability_spam=90.0, probability_ham=10.0)
+        self.detect(detected_at=now - timedelta(days=1), user_feedback='correct', feedback_at=now)
+        self.detect(is_scam=False, probability_spam=20.0, probability_ham=80.0)
+        rollups.catch_up()
+        summary = rollups.summarize(None)
+        self.assertEqual((summary['total'], summary['scam'], summary['legitimate']), (3, 2, 1))
+        self.assertEqual(summary['feedback_correct'], 1)
+        self.assertEqual((summary['avg_scam_probability'], summary['avg_legit_probability']), (90.0, 80.0))
+        self.assertEqual(sum(row['total_detections'] for row in rollups.daily_totals(
+            (now - timedelta(days=1)).date(), now.date()
+        )), 3)
+
+    def test_later_feedback_and_late_rows_are_picked_up(self):
+        detection = self.detect(id=100)
+        rollups.catch_up()
+        DetectionHistory.objects.filter(id=detection.id).update(
+            user_feedback='incorrect', feedback_at=timezone.now()
+        )
+        # Committed after the run that moved the watermark past it
+        self.detect(id=50)
+        self.assertTrue(rollups.is_behind())
+        rollups.catch_up()
+        summary = rollups.summarize(None)
+        self.assertEqual((summary['total'], summary['feedback_incorrect']), (2, 1))
+        # Recomputed, not incremented: another run changes nothing
+        rollups.catch_up()
+        self.assertEqual(rollups.summarize(None), summary)
+
+
+class FeedbackApiTests(TestCase):
+    """Feedback names a detection by its reference only"""
+
+    def post(self, detection_id, feedback='correct'):
+        return self.client.post(
+            reverse('detector:mark_detection_feedback'),
+            json.dumps({'detection_id': detection_id, 'feedback': feedback}),
+            content_type='application/json',
+        )
+
+    def test_malformed_ids_are_rejected(self):
+        detection = DetectionHistory.objects.create(text='text', is_scam=True, confidence_score=80.0)
+        for detection_id in ('abc', detection.id, str(detection.id), None, {'id': 1}):
+            with self.subTest(detection_id=detection_id):
+                response = self.post(detection_id)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['error'], 'Invalid detection id.')
+
+    def test_unknown_reference(self):
+        self.assertEqual(self.post(str(uuid.uuid4())).status_code, 404)
+
+    def test_feedback_on_a_buffered_detection(self):
+        buffer = DetectionWriteBuffer()
+        buffer._ensure_thread = lambda: None
+        detection = DetectionHistory(text='text', is_scam=True, confidence_score=80.0)
+        buffer.add_detections([detection])
+        with mock.patch('detector.views.get_write_buffer', return_value=buffer):
+            response = self.post(str(detection.reference), 'incorrect')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(DetectionHistory.objects.get(reference=detection.reference).user_feedback, 'incorrect')
+
+
+class HotSwapTests(TestCase):
+    """Workers swap in the registry's active version, and only that version"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        registry = override_settings(SCAM_DETECTOR_MODEL_REGISTRY={'PATH': self.tmp, 'POLL_INTERVAL': 5.0})
+        registry.enable()
+        self.addCleanup(registry.disable)
+        self.current = mock.Mock(model_version='old', cache=None, tokenizer=None)
+        serving = mock.patch.multiple(
+            ml_model.get_scam_detector, create=True,
+            _instance=self.current, _poll_interval=5.0, _next_check=0.0, _failed_reload=None,
+        )
+        serving.start()
+        self.addCleanup(serving.stop)
+
+    def publish(self):
+        model = NaiveBayesAlgorithmFromScratch()
+        model.fit(TRAIN_TEXTS, TRAIN_LABELS)
+        return model_registry.publish(model, last_accuracy=1.0)
+
+    def poll(self):
+        ml_model.get_scam_detector._next_check = 0.0
+        ml_model._reload_if_changed()
+        return ml_model.current_detector()
+
+    def test_swaps_in_the_active_version(self):
+        version = self.publish()
+        with self.assertLogs('detector.ml_model', 'INFO'):
+            detector = self.poll()
+        self.assertEqual(detector.model_version, version.version)
+        self.assertTrue(detector.predict('Call now to claim your free prize')['is_scam'])
+
+    def test_missing_artifact_keeps_the_current_model(self):
+        ModelVersion.objects.create(version='f' * 64, path=os.path.join(self.tmp, 'missing'), is_active=True)
+        with self.assertLogs('detector.ml_model', 'ERROR'):
+            self.assertIs(self.poll(), self.current)
+        with mock.patch.object(ml_model, 'ScamDetector') as scam_detector, self.assertNoLogs('detector.ml_model'):
+            self.assertIs(self.poll(), self.current)
+        scam_detector.assert_not_called()
+
+    def test_fallback_model_is_not_swapped_in(self):
+        # The path holds another version's artifact, as after a copy between hosts
+        other = self.publish()
+        other.is_active = False
+        other.save()
+        ModelVersion.objects.create(version='f' * 64, path=other.path, is_active=True)
+        with self.assertLogs('detector.ml_model', 'ERROR'):
+            self.assertIs(self.poll(), self.current)
+        # Backing off: the next poll does not load the artifact again
+        with mock.patch.object(ml_model, 'ScamDetector') as scam_detector:
+            self.assertIs(self.poll(), self.current)
+        scam_detector.assert_not_called()
+        version, attempts, _ = ml_model.get_scam_detector._failed_reload
+        self.assertEqual((version, attempts), ('f' * 64, 1))
@@ -1,7 +1,14 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 from django.contrib.auth.views import LoginView, LogoutView
 
+# Under ASGI the JSON API can be served by the async views instead
+if getattr(settings, 'SCAM_DETECTOR_ASYNC_API', False):
+    from . import async_views as api_views
+else:
+    api_views = views
+
 app_name = 'detector'
 
 urlpatterns = [
@@ -18,8 +25,11 @@ urlpatterns = [
     path('register/', views.register, name='register'),
     
     # API endpoints
-    path('api/detect/', views.api_detect, name='api_detect'),
-    path('api/statistics/', views.api_statistics, name='api_statistics'),
-    path('api/mark_feedback/', views.mark_detection_feedback, name='mark_detection_feedback'),
+    path('api/detect/', api_views.api_detect, name='api_detect'),
+    path('api/detect/batch/', views.api_detect_batch, name='api_detect_batch'),
+    path('api/statistics/', api_views.api_statistics, name='api_statistics'),
+    path('api/ready/', views.api_ready, name='api_ready'),
+    path('metrics', views.prometheus_metrics, name='metrics'),
+    path('api/mark_feedback/', api_views.mark_detection_feedback, name='mark_detection_feedback'),
     path('clear_history/', views.clear_history, name='clear_history'),
 ] 
\ No newline at end of file
@@ -1,11 +1,14 @@
 from django.shortcuts import render, redirect
-from django.http import JsonResponse
+from django.http import Http404, HttpResponse, JsonResponse
+from django.conf import settings
 from django.contrib import messages
 from django.core.paginator import Paginator
 from django.db.models import Count
 from django.utils import timezone
-from datetime import timedelta
+from datetime import datetime, time, timedelta
 import json
+import logging
+import uuid
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.forms import UserCreationForm
@@ -13,8 +16,14 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login
 
 from .forms import TextDetectionForm, ScamReportForm, UserRegistrationForm
-from .models import DetectionHistory, ScamReport, ScamStatistics
-from .ml_model import get_scam_detector
+from .models import DetectionHistory, DetectionRollup, ScamReport, ScamStatistics
+from . import metrics as detector_metrics
+from .metrics import span
+from .ml_model import current_detector, detector_ready, get_scam_detector
+from .rollups import catch_up_on_read, daily_totals, summarize
+from .write_buffer import get_write_buffer, record_detections, record_statistics
+
+logger = logging.getLogger(__name__)
 
 
 def get_client_ip(request):
@@ -27,6 +36,61 @@ def get_client_ip(request):
     return ip
 
 
+def history_queryset(user, scam_filter=None):
+    """Detections on the history page: the user's (None = anonymous), newest first"""
+    detections = DetectionHistory.objects.filter(user=user).order_by('-detected_at')
+    if scam_filter == 'scam':
+        detections = detections.filter(is_scam=True)
+    elif scam_filter == 'legitimate':
+        detections = detections.filter(is_scam=False)
+    return detections
+
+
+def analysis_queryset(user, start_date, end_date):
+    """
+    The user's detections on the dates start_date to end_date (inclusive),
+    newest first. Filtered on a detected_at range rather than
+    detected_at__date, which the database cannot look up in an index.
+    """
+    start = timezone.make_aware(datetime.combine(start_date, time.min))
+    end = timezone.make_aware(datetime.combine(end_date + timedelta(days=1), time.min))
+    return DetectionHistory.objects.filter(
+        user=user,
+        detected_at__gte=start,
+        detected_at__lt=end
+    ).order_by('-detected_at')
+
+
+def recent_detections_queryset(user, limit=5):
+    return DetectionHistory.objects.filter(user=user).order_by('-detected_at')[:limit]
+
+
+def parse_reference(detection_id):
+    """The UUID a feedback request names, or None if it is not one"""
+    if not isinstance(detection_id, str):
+        return None
+    try:
+        return uuid.UUID(detection_id)
+    except ValueError:
+        return None
+
+
+def find_detection(reference):
+    """
+    The detection with this reference (see parse_reference). The home page
+    hands it out before the write buffer has saved the detection, so a miss
+    flushes the buffer and looks again.
+    """
+    try:
+        return DetectionHistory.objects.get(reference=reference)
+    except DetectionHistory.DoesNotExist:
+        buffer = get_write_buffer()
+        if buffer is None or not buffer.pending():
+            raise
+        buffer.flush()
+        return DetectionHistory.objects.get(reference=reference)
+
+
 def home(request):
     """Home page view"""
     if request.method == 'POST':
@@ -38,27 +102,25 @@ def home(request):
             detector = get_scam_detector()
             result = detector.predict(text)
             
-            # Save to detection history
-            detection = DetectionHistory.objects.create(
+            # Save to detection history (write-behind)
+            detection = DetectionHistory(
                 user=request.user if request.user.is_authenticated else None,
                 text=text,
                 is_scam=result['is_scam'],
                 confidence_score=result['confidence'],
+                probability_spam=result['probability_spam'],
+                probability_ham=result['probability_ham'],
+                model_version=detector.model_version or '',
                 ip_address=get_client_ip(request)
             )
+            record_detections([detection])
             
-            # Update statistics
-            today = timezone.now().date()
-            stats, created = ScamStatistics.objects.get_or_create(date=today)
-            stats.total_detections += 1
-            if result['is_scam']:
-                stats.scam_detections += 1
-            else:
-                stats.legitimate_detections += 1
-            stats.save()
+            # Update statistics (atomic increments, applied by the write buffer)
+            record_statistics(result['is_scam'])
             
-            # Add detection_id and user_feedback to result for template
-            result['detection_id'] = detection.id
+            # Add detection_id and user_feedback to result for template. The
+            # row may not be saved yet, so feedback names it by its reference.
+            result['detection_id'] = str(detection.reference)
             result['user_feedback'] = detection.user_feedback
             
             return render(request, 'detector/home.html', {
@@ -92,38 +154,23 @@ def results_analysis(request):
     end_date = timezone.now().date()
     start_date = end_date - timedelta(days=days)
     # User-specific statistics and detections
-    if request.user.is_authenticated:
-        detections = DetectionHistory.objects.filter(
-            user=request.user,
-            detected_at__date__range=[start_date, end_date]
-        ).order_by('-detected_at')
-    else:
-        detections = DetectionHistory.objects.filter(
-            user=None,
-            detected_at__date__range=[start_date, end_date]
-        ).order_by('-detected_at')
+    user = request.user if request.user.is_authenticated else None
+    detections = analysis_queryset(user, start_date, end_date)
     # Paginate detections
     paginator = Paginator(detections, 20)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
-    # Calculate summary statistics
-    total_detections = detections.count()
-    total_scams = detections.filter(is_scam=True).count()
-    total_legitimate = detections.filter(is_scam=False).count()
+    # Summary statistics and the daily chart come from the rollups
+    catch_up_on_read()
+    summary = summarize(user, start_date, end_date)
+    total_detections = summary['total']
+    total_scams = summary['scam']
+    total_legitimate = summary['legitimate']
     scam_percentage = (total_scams / total_detections * 100) if total_detections > 0 else 0
 
-    # Calculate average confidence for scam and legitimate
-    scam_confidences = []
-    legitimate_confidences = []
-    for d in detections:
-        # Use the stored prediction output if available, otherwise recompute
-        result = get_scam_detector().predict(d.text)
-        if d.is_scam:
-            scam_confidences.append(result['probability_spam'])
-        else:
-            legitimate_confidences.append(result['probability_ham'])
-    avg_scam_conf = round(sum(scam_confidences)/len(scam_confidences), 3) if scam_confidences else None
-    avg_legit_conf = round(sum(legitimate_confidences)/len(legitimate_confidences), 3) if legitimate_confidences else None
+    # Average confidence for scam and legitimate, from the stored prediction output
+    avg_scam_conf = round(summary['avg_scam_probability'], 3) if summary['avg_scam_probability'] is not None else None
+    avg_legit_conf = round(summary['avg_legit_probability'], 3) if summary['avg_legit_probability'] is not None else None
 
     context = {
         'page_obj': page_obj,
@@ -135,22 +182,17 @@ def results_analysis(request):
         'date_range': f"Last {days} days",
         'avg_scam_conf': avg_scam_conf,
         'avg_legit_conf': avg_legit_conf,
+        'stats': daily_totals(start_date, end_date, user=user),
     }
     return render(request, 'detector/results_analysis.html', context)
 
 
 def detection_history(request):
     """Detection history page"""
-    if request.user.is_authenticated:
-        detections = DetectionHistory.objects.filter(user=request.user).order_by('-detected_at')
-    else:
-        detections = DetectionHistory.objects.filter(user=None).order_by('-detected_at')
+    user = request.user if request.user.is_authenticated else None
     # Filter by scam type
     scam_filter = request.GET.get('filter')
-    if scam_filter == 'scam':
-        detections = detections.filter(is_scam=True)
-    elif scam_filter == 'legitimate':
-        detections = detections.filter(is_scam=False)
+    detections = history_queryset(user, scam_filter)
     # Paginate results
     paginator = Paginator(detections, 25)
     page_number = request.GET.get('page')
@@ -189,40 +231,20 @@ def report_scam(request):
 def model_performance(request):
     """Model performance and classification report page"""
     detector = get_scam_detector()
-    # Only retrain if not already trained
-    if not detector.is_trained:
-        accuracy = detector.train()
-    else:
-        accuracy = getattr(detector, '_last_accuracy', 0.0)
-        # Ensure classification report is available
-        if detector.get_classification_report() is None:
-            # Regenerate classification report
-            texts, labels = detector.load_and_prepare_data()
-            from sklearn.model_selection import train_test_split
-            X_train, X_test, y_train, y_test = train_test_split(texts, labels, test_size=0.2, random_state=42)
-            y_pred = detector.model.predict(X_test)
-            from sklearn.metrics import classification_report, recall_score
-            detector.classification_report_str = classification_report(y_test, y_pred, target_names=['ham', 'spam'])
+    # Everything shown here comes from the metrics written at train time;
+    # the page never reads or re-scores the corpus.
+    metrics = detector.metrics or {}
+    accuracy = metrics.get('accuracy', getattr(detector, '_last_accuracy', 0.0))
     print('DEBUG: detector._last_accuracy =', getattr(detector, '_last_accuracy', 'MISSING'))
     print('DEBUG: accuracy used for display =', accuracy)
     try:
-        from sklearn.metrics import classification_report
-        y_pred = None
-        try:
-            texts, labels = detector.load_and_prepare_data()
-            total_samples = len(texts)
-            legitimate_count = sum(1 for label in labels if label == 'ham')
-            spam_count = sum(1 for label in labels if label == 'spam')
-            legitimate_percentage = (legitimate_count / total_samples) * 100 if total_samples else 0
-            spam_percentage = (spam_count / total_samples) * 100 if total_samples else 0
-            classification_report_str = detector.get_classification_report()
-        except Exception as e:
-            total_samples = 0
-            legitimate_count = 0
-            spam_count = 0
-            legitimate_percentage = 0
-            spam_percentage = 0
-            classification_report_str = None
+        class_counts = metrics.get('dataset', {}).get('class_counts', {})
+        total_samples = metrics.get('dataset', {}).get('total_samples', 0)
+        legitimate_count = class_counts.get('ham', 0)
+        spam_count = class_counts.get('spam', 0)
+        legitimate_percentage = (legitimate_count / total_samples) * 100 if total_samples else 0
+        spam_percentage = (spam_count / total_samples) * 100 if total_samples else 0
+        classification_report_str = detector.get_classification_report()
         performance_data = {
             'accuracy': accuracy * 100,
             'accuracy_value': round(accuracy * 100, 1),
@@ -232,11 +254,19 @@ def model_performance(request):
             'spam_count': spam_count,
             'legitimate_percentage': legitimate_percentage,
             'spam_percentage': spam_percentage,
-            'feature_count': len(detector.model.vocab),
+            'feature_count': detector.model.vocab_size,
             'model_type': 'Multinomial Naive Bayes',
             'vectorizer_type': 'TF-IDF',
             'is_trained': detector.is_trained,
-            'classification_report': classification_report_str
+            'classification_report': classification_report_str,
+            'per_class': metrics.get('per_class'),
+            'confusion_matrix': metrics.get('confusion_matrix'),
+            'trained_at': metrics.get('trained_at'),
+            'unpruned_feature_count': metrics.get('unpruned_vocab_size'),
+            'vocab_reduction': (
+                (1 - detector.model.vocab_size / metrics['unpruned_vocab_size']) * 100
+                if metrics.get('unpruned_vocab_size') else None
+            ),
         }
     except Exception as e:
         performance_data = {
@@ -276,21 +306,25 @@ def api_detect(request):
     """API endpoint for text detection"""
     if request.method == 'POST':
         try:
-            data = json.loads(request.body)
+            with span('parse'):
+                data = json.loads(request.body)
             text = data.get('text', '')
             if not text:
                 return JsonResponse({'error': 'Text is required'}, status=400)
             # Get scam detector and make prediction
             detector = get_scam_detector()
             result = detector.predict(text)
-            # Save to detection history
-            DetectionHistory.objects.create(
+            # Save to detection history (write-behind)
+            record_detections([DetectionHistory(
                 user=request.user if request.user.is_authenticated else None,
                 text=text,
                 is_scam=result['is_scam'],
                 confidence_score=result['confidence'],
+                probability_spam=result['probability_spam'],
+                probability_ham=result['probability_ham'],
+                model_version=detector.model_version or '',
                 ip_address=get_client_ip(request)
-            )
+            )])
             return JsonResponse({
                 'success': True,
                 'result': result,
@@ -305,6 +339,58 @@ def api_detect(request):
     return JsonResponse({'error': 'POST method required'}, status=405)
 
 
+def api_detect_batch(request):
+    """API endpoint for scoring several texts in one request"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST method required'}, status=405)
+    try:
+        with span('parse'):
+            data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    texts = data.get('texts') if isinstance(data, dict) else None
+    if not isinstance(texts, list) or not texts:
+        return JsonResponse({'error': 'texts must be a non-empty list'}, status=400)
+    max_texts = getattr(settings, 'SCAM_DETECTOR_BATCH_MAX_TEXTS', 100)
+    if len(texts) > max_texts:
+        return JsonResponse({'error': f'At most {max_texts} texts per request'}, status=400)
+    try:
+        # Invalid items get their own error; the rest are scored together
+        valid = [i for i, text in enumerate(texts) if isinstance(text, str) and text]
+        detector = get_scam_detector()
+        results = detector.predict_batch([texts[i] for i in valid])
+        user = request.user if request.user.is_authenticated else None
+        ip_address = get_client_ip(request)
+        record_detections([
+            DetectionHistory(
+                user=user,
+                text=texts[i],
+                is_scam=result['is_scam'],
+                confidence_score=result['confidence'],
+                probability_spam=result['probability_spam'],
+                probability_ham=result['probability_ham'],
+                model_version=detector.model_version or '',
+                ip_address=ip_address
+            )
+            for i, result in zip(valid, results)
+        ])
+        items = []
+        for i, text in enumerate(texts):
+            if not isinstance(text, str):
+                items.append({'success': False, 'index': i, 'error': 'Text must be a non-empty string'})
+            else:
+                items.append({'success': False, 'index': i, 'error': 'Text is required'})
+        for i, result in zip(valid, results):
+            items[i] = {'success': True, 'result': result, 'text': texts[i]}
+        return JsonResponse({
+            'success': True,
+            'count': len(items),
+            'results': items
+        })
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
 def api_statistics(request):
     """API endpoint for statistics"""
     days = request.GET.get('days', 7)
@@ -316,35 +402,72 @@ def api_statistics(request):
     end_date = timezone.now().date()
     start_date = end_date - timedelta(days=days)
     
-    stats = ScamStatistics.objects.filter(
-        date__range=[start_date, end_date]
-    ).values('date', 'total_detections', 'scam_detections', 'legitimate_detections')
+    catch_up_on_read()
+    stats = daily_totals(start_date, end_date)
     
     return JsonResponse({
         'success': True,
         'stats': list(stats),
-        'days': days
+        'days': days,
+        'prediction_cache': prediction_cache_stats()
     })
 
 
+def prediction_cache_stats():
+    """
+    Counters of the loaded detector's prediction cache (None when caching is
+    off). Never loads a model: before one is loaded the counters are empty.
+    """
+    detector = current_detector()
+    if detector is None:
+        return {'hits': 0, 'misses': 0, 'hit_rate': 0.0, 'size': 0}
+    return detector.cache.stats() if detector.cache is not None else None
+
+
+def api_ready(request):
+    """
+    Readiness probe. With SCAM_DETECTOR_PRELOAD it returns 503 until the model
+    is loaded and warmed; without it the model loads on the first request, so
+    there is nothing to wait for.
+    """
+    preload = getattr(settings, 'SCAM_DETECTOR_PRELOAD', False)
+    model_ready = detector_ready()
+    ready = model_ready or not preload
+    return JsonResponse({
+        'ready': ready,
+        'model_ready': model_ready,
+        'preload': preload,
+    }, status=200 if ready else 503)
+
+
 @require_POST
 @csrf_exempt
 def mark_detection_feedback(request):
     """AJAX endpoint to mark a detection as correct/incorrect"""
     try:
         data = json.loads(request.body)
-        detection_id = data.get('detection_id')
-        feedback = data.get('feedback')
-        if feedback not in ['correct', 'incorrect']:
-            return JsonResponse({'success': False, 'error': 'Invalid feedback value.'}, status=400)
-        detection = DetectionHistory.objects.get(id=detection_id)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Invalid JSON.'}, status=400)
+    if not isinstance(data, dict):
+        return JsonResponse({'success': False, 'error': 'Invalid JSON.'}, status=400)
+    feedback = data.get('feedback')
+    if feedback not in ['correct', 'incorrect']:
+        return JsonResponse({'success': False, 'error': 'Invalid feedback value.'}, status=400)
+    reference = parse_reference(data.get('detection_id'))
+    if reference is None:
+        return JsonResponse({'success': False, 'error': 'Invalid detection id.'}, status=400)
+    try:
+        detection = find_detection(reference)
         detection.user_feedback = feedback
-        detection.save()
+        detection.feedback_at = timezone.now()
+        # Only these two, so a concurrent update_model keeps its trained_label
+        detection.save(update_fields=['user_feedback', 'feedback_at'])
         return JsonResponse({'success': True, 'feedback': feedback})
     except DetectionHistory.DoesNotExist:
         return JsonResponse({'success': False, 'error': 'Detection not found.'}, status=404)
-    except Exception as e:
-        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+    except Exception:
+        logger.exception('Could not save feedback for detection %s', reference)
+        return JsonResponse({'success': False, 'error': 'Could not save feedback.'}, status=500)
 
 
 def register(request):
@@ -367,20 +490,16 @@ def register(request):
 def profile(request):
     user = request.user
     # User detection stats
-    detections = DetectionHistory.objects.filter(user=user)
-    total_detections = detections.count()
-    scam_count = detections.filter(is_scam=True).count()
-    legitimate_count = detections.filter(is_scam=False).count()
-    feedback_correct = detections.filter(user_feedback='correct').count()
-    feedback_incorrect = detections.filter(user_feedback='incorrect').count()
-    recent_detections = detections.order_by('-detected_at')[:5]
+    catch_up_on_read()
+    summary = summarize(user)
+    recent_detections = recent_detections_queryset(user)
     return render(request, 'detector/profile.html', {
         'user': user,
-        'total_detections': total_detections,
-        'scam_count': scam_count,
-        'legitimate_count': legitimate_count,
-        'feedback_correct': feedback_correct,
-        'feedback_incorrect': feedback_incorrect,
+        'total_detections': summary['total'],
+        'scam_count': summary['scam'],
+        'legitimate_count': summary['legitimate'],
+        'feedback_correct': summary['feedback_correct'],
+        'feedback_incorrect': summary['feedback_incorrect'],
         'recent_detections': recent_detections,
     })
 
@@ -389,5 +508,82 @@ def profile(request):
 @require_POST
 def clear_history(request):
     DetectionHistory.objects.filter(user=request.user).delete()
+    DetectionRollup.objects.filter(user=request.user).delete()
     messages.success(request, 'Your detection history has been cleared.')
-    return redirect('detector:detection_history') 
\ No newline at end of file
+    return redirect('detector:detection_history') 
+
+
+def _scrape_time_metrics():
+    """Gauges and cumulative counters read from live objects at scrape time"""
+    from .campaigns import get_campaign_index
+    from .indicators import get_indicator_matcher
+    lines = []
+    detector = current_detector()
+    if detector is not None:
+        lines += detector_metrics.gauge_lines(
+            'scam_detector_model_info',
+            'Model version being served (content hash).',
+            [({'version': detector.model_version or ''}, 1)],
+        )
+        cache = detector.cache
+        if cache is not None:
+            lines += detector_metrics.gauge_lines(
+                'scam_detector_cache_hits_total', 'Prediction cache hits.', [({}, cache.hits)], kind='counter'
+            )
+            lines += detector_metrics.gauge_lines(
+                'scam_detector_cache_misses_total', 'Prediction cache misses.', [({}, cache.misses)], kind='counter'
+            )
+            if cache.size() is not None:
+                lines += detector_metrics.gauge_lines(
+                    'scam_detector_cache_entries', 'Entries in the local prediction cache.', [({}, cache.size())]
+                )
+    campaigns = get_campaign_index()
+    if campaigns is not None:
+        lines += detector_metrics.gauge_lines(
+            'scam_detector_campaign_entries',
+            'Signatures in the served campaign index.',
+            [({'generation': str(campaigns.generation)}, campaigns.n_entries)],
+        )
+    matcher = get_indicator_matcher()
+    if matcher is not None:
+        lines += detector_metrics.gauge_lines(
+            'scam_detector_indicators', 'Reported scammer contacts being matched.', [({}, len(matcher.reports))]
+        )
+        lines += detector_metrics.gauge_lines(
+            'scam_detector_indicator_scans_total', 'Texts scanned after passing the Bloom filter.',
+            [({}, matcher.scanned)], kind='counter',
+        )
+    buffer = get_write_buffer()
+    if buffer is not None:
+        lines += detector_metrics.gauge_lines(
+            'scam_detector_write_queue_depth',
+            'Detections waiting in the write-behind buffer.',
+            [({}, buffer.pending())],
+        )
+        lines += detector_metrics.gauge_lines(
+            'scam_detector_write_flushed_total', 'Detections written by the buffer.', [({}, buffer.flushed)],
+            kind='counter',
+        )
+        lines += detector_metrics.gauge_lines(
+            'scam_detector_write_failed_flushes_total', 'Failed write-behind flushes.', [({}, buffer.failed_flushes)],
+            kind='counter',
+        )
+        lines += detector_metrics.gauge_lines(
+            'scam_detector_write_dropped_total', 'Detections dropped after a failed flush left no room to re-queue them.',
+            [({}, buffer.dropped)], kind='counter',
+        )
+        lines += detector_metrics.gauge_lines(
+            'scam_detector_write_rejected_total', 'Detections dropped after failing MAX_ATTEMPTS writes.',
+            [({}, buffer.rejected)], kind='counter',
+        )
+    return lines
+
+
+def prometheus_metrics(request):
+    """Prometheus scrape endpoint (this process's values only)"""
+    if not getattr(settings, 'SCAM_DETECTOR_METRICS', {}).get('ENABLED', True):
+        raise Http404('Metrics are disabled')
+    return HttpResponse(
+        detector_metrics.render(_scrape_time_metrics()),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
@@ -0,0 +1,288 @@
+"""
+Write-behind buffer for detection history and daily statistics.
+
+Request handlers hand over unsaved DetectionHistory objects and statistics
+deltas instead of writing them; a background thread flushes them with one
+bulk_create and one F() update per day, when MAX_BATCH items are pending or
+every FLUSH_INTERVAL seconds. At most MAX_PENDING items are held in memory:
+past that, callers wait for the flusher (backpressure), so an unclean
+shutdown loses at most MAX_PENDING detections. A clean shutdown flushes
+everything via atexit.
+
+When a batch insert fails on a bad row (a constraint or value error) the
+batch is written row by row, so one bad row cannot hold back the others;
+a row that fails MAX_ATTEMPTS flushes is logged and dropped. Any other
+error (e.g. the database is down) puts the whole batch back for the next
+flush.
+
+Configured by settings.SCAM_DETECTOR_WRITE_BUFFER; when it is disabled the
+same functions write straight to the database.
+"""
+import atexit
+import logging
+import threading
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DataError, IntegrityError, close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .metrics import span
+from .models import DetectionHistory, ScamStatistics
+
+DEFAULTS = {
+    'ENABLED': True,
+    'MAX_BATCH': 500,
+    'FLUSH_INTERVAL': 1.0,
+    'MAX_PENDING': 10000,
+    'MAX_ATTEMPTS': 3,
+}
+# Errors caused by the rows themselves rather than by the database
+ROW_ERRORS = (DataError, IntegrityError, ValueError, TypeError)
+
+logger = logging.getLogger(__name__)
+
+
+def apply_statistics(deltas):
+    """Add {date: [total, scam, legitimate]} deltas with atomic F() updates"""
+    with transaction.atomic():
+        for date, (total, scams, legitimate) in deltas.items():
+            ScamStatistics.objects.get_or_create(date=date)
+            ScamStatistics.objects.filter(date=date).update(
+                total_detections=F('total_detections') + total,
+                scam_detections=F('scam_detections') + scams,
+                legitimate_detections=F('legitimate_detections') + legitimate,
+            )
+
+
+def _statistics_delta(is_scam):
+    return {timezone.now().date(): [1, 1 if is_scam else 0, 0 if is_scam else 1]}
+
+
+class DetectionWriteBuffer:
+    def __init__(self, max_batch=500, flush_interval=1.0, max_pending=10000, max_attempts=3):
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self._detections = []
+        self._statistics = defaultdict(lambda: [0, 0, 0])
+        self._lock = threading.Lock()
+        self._drained = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = None
+        self.flushed = 0
+        self.failed_flushes = 0
+        self.dropped = 0  # Detections lost because a failed batch did not fit back
+        self.rejected = 0  # Detections dropped after failing MAX_ATTEMPTS writes
+
+    def pending(self):
+        return len(self._detections)
+
+    def add_detections(self, detections):
+        """Queue unsaved DetectionHistory objects. Never touches the database."""
+        with self._lock:
+            while len(self._detections) >= self.max_pending and not self._stopped:
+                self._wakeup.set()
+                self._drained.wait(timeout=self.flush_interval)
+            self._detections.extend(detections)
+            full = len(self._detections) >= self.max_batch
+        self._ensure_thread()
+        if full:
+            self._wakeup.set()
+
+    def try_add_detections(self, detections):
+        """add_detections() without waiting: False, with nothing queued, when the buffer is full"""
+        with self._lock:
+            if len(self._detections) >= self.max_pending and not self._stopped:
+                self._wakeup.set()
+                return False
+            self._detections.extend(detections)
+            full = len(self._detections) >= self.max_batch
+        self._ensure_thread()
+        if full:
+            self._wakeup.set()
+        return True
+
+    def add_statistics(self, deltas):
+        with self._lock:
+            for date, values in deltas.items():
+                current = self._statistics[date]
+                for i, value in enumerate(values):
+                    current[i] += value
+        self._ensure_thread()
+
+    def flush(self):
+        """Write everything queued so far. Safe to call from any thread."""
+        with self._flush_lock:
+            with self._lock:
+                detections, self._detections = self._detections, []
+                statistics, self._statistics = self._statistics, defaultdict(lambda: [0, 0, 0])
+                self._drained.notify_all()
+            if not detections and not statistics:
+                return 0
+            try:
+                with span('flush'), transaction.atomic():
+                    DetectionHistory.objects.bulk_create(detections, batch_size=self.max_batch)
+                    apply_statistics(statistics)
+            except ROW_ERRORS as e:
+                self.failed_flushes += 1
+                logger.warning('Detection batch insert failed (%s); writing %d detections one by one', e, len(detections))
+                _forget_ids(detections)
+                written = self._flush_rows(detections)
+                try:
+                    apply_statistics(statistics)
+                except Exception as e:
+                    self._requeue([], statistics, e)
+                self.flushed += written
+                return written
+            except Exception as e:
+                _forget_ids(detections)
+                self._requeue(detections, statistics, e)
+                return 0
+            self.flushed += len(detections)
+            return len(detections)
+
+    def _flush_rows(self, detections):
+        """
+        Insert detections one at a time, each in its own savepoint. A row
+        that fails is re-queued until it has failed max_attempts times, then
+        logged and dropped. Returns the number written.
+        """
+        written = 0
+        retry = []
+        for i, detection in enumerate(detections):
+            try:
+                with transaction.atomic():
+                    DetectionHistory.objects.bulk_create([detection])
+            except ROW_ERRORS as e:
+                detection._write_attempts = getattr(detection, '_write_attempts', 0) + 1
+                if detection._write_attempts < self.max_attempts:
+                    retry.append(detection)
+                    continue
+                self.rejected += 1
+                logger.error(
+                    'Dropping detection %s (detected at %s) after %d failed writes: %s',
+                    detection.reference, detection.detected_at, detection._write_attempts, e,
+                )
+            except Exception as e:
+                # Not the row's fault; the rest waits for the next flush
+                _forget_ids(detections[i:i + 1])
+                self._requeue(retry + detections[i:], {}, e)
+                return written
+            else:
+                written += 1
+        if retry:
+            self._requeue(retry, {}, None)
+        return written
+
+    def _requeue(self, detections, statistics, error):
+        """Put unwritten work back at the head of the queue, within the pending bound"""
+        if error is not None:
+            self.failed_flushes += 1
+        with self._lock:
+            room = max(0, self.max_pending - len(self._detections))
+            self._detections[:0] = detections[:room]
+            for date, values in statistics.items():
+                current = self._statistics[date]
+                for i, value in enumerate(values):
+                    current[i] += value
+        dropped = max(0, len(detections) - room)
+        self.dropped += dropped
+        if dropped:
+            logger.error(
+                'Detection write-behind flush failed (%s); dropped %d of %d detections, %d re-queued',
+                error, dropped, len(detections), len(detections) - dropped,
+            )
+        elif error is not None:
+            logger.error('Detection write-behind flush failed (%s); %d detections re-queued', error, len(detections))
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._stopped or (self._thread is not None and self._thread.is_alive()):
+                    return
+                self._thread = threading.Thread(target=self._run, name='detection-write-buffer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(timeout=self.flush_interval)
+            self._wakeup.clear()
+            close_old_connections()
+            self.flush()
+        connection.close()
+
+    def close(self):
+        """Stop the flusher and write whatever is still queued."""
+        self._stopped = True
+        self._wakeup.set()
+        with self._lock:
+            self._drained.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=self.flush_interval * 5)
+        self.flush()
+
+
+def _forget_ids(detections):
+    """Undo the primary keys a rolled-back bulk_create assigned, so the rows are inserted again"""
+    for detection in detections:
+        detection.pk = None
+        detection._state.adding = True
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_write_buffer():
+    """The process-wide buffer, or None if write-behind is disabled"""
+    global _buffer
+    config = {**DEFAULTS, **getattr(settings, 'SCAM_DETECTOR_WRITE_BUFFER', {})}
+    if not config['ENABLED']:
+        return None
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = DetectionWriteBuffer(
+                    max_batch=config['MAX_BATCH'],
+                    flush_interval=config['FLUSH_INTERVAL'],
+                    max_pending=config['MAX_PENDING'],
+                    max_attempts=config['MAX_ATTEMPTS'],
+                )
+                atexit.register(_buffer.close)
+    return _buffer
+
+
+def record_detections(detections):
+    """Save DetectionHistory objects, through the buffer when it is enabled"""
+    buffer = get_write_buffer()
+    with span('history'):
+        if buffer is None:
+            DetectionHistory.objects.bulk_create(detections)
+        else:
+            buffer.add_detections(detections)
+
+
+async def arecord_detections(detections):
+    buffer = get_write_buffer()
+    with span('history'):
+        if buffer is None:
+            await DetectionHistory.objects.abulk_create(detections)
+        elif not buffer.try_add_detections(detections):
+            # Full: wait for the flusher in a thread, not on the event loop
+            await sync_to_async(buffer.add_detections, thread_sensitive=False)(detections)
+
+
+def record_statistics(is_scam):
+    """Count one detection in today's ScamStatistics row"""
+    buffer = get_write_buffer()
+    with span('statistics'):
+        if buffer is None:
+            apply_statistics(_statistics_delta(is_scam))
+        else:
+            buffer.add_statistics(_statistics_delta(is_scam))
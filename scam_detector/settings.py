@@ -29,6 +29,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'detector.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -91,3 +92,138 @@ MEDIA_ROOT = BASE_DIR / 'media'
 
 # Redirect to homepage after login
 LOGIN_REDIRECT_URL = '/' 
+
+# Prediction cache in front of ScamDetector.predict. 'local' is a per-process
+# LRU; 'django' uses the Django cache named by ALIAS, which workers share when
+# that cache is (e.g. Redis or Memcached). Set BACKEND to None to disable.
+SCAM_DETECTOR_CACHE = {
+    'BACKEND': 'local',
+    'MAX_SIZE': 10000,
+    'TTL': 3600,
+    'ALIAS': 'default',
+}
+
+# Maximum number of texts accepted by /api/detect/batch/
+SCAM_DETECTOR_BATCH_MAX_TEXTS = 100
+
+# Serve api_detect, api_statistics and mark_feedback with the async views in
+# detector/async_views.py (for ASGI deployments). Inference then runs in a
+# thread pool of SCAM_DETECTOR_INFERENCE_WORKERS threads (default: CPU count).
+SCAM_DETECTOR_ASYNC_API = False
+SCAM_DETECTOR_INFERENCE_WORKERS = None
+
+# Write-behind buffering of DetectionHistory inserts and ScamStatistics
+# updates (detector/write_buffer.py): flushed every FLUSH_INTERVAL seconds or
+# once MAX_BATCH rows are queued; at most MAX_PENDING rows wait in memory.
+# A row that fails MAX_ATTEMPTS flushes (e.g. a constraint error) is logged
+# and dropped instead of blocking the rows behind it.
+SCAM_DETECTOR_WRITE_BUFFER = {
+    'ENABLED': True,
+    'MAX_BATCH': 500,
+    'FLUSH_INTERVAL': 1.0,
+    'MAX_PENDING': 10000,
+    'MAX_ATTEMPTS': 3,
+}
+
+# Hourly/daily detection rollups read by the dashboards. With
+# CATCH_UP_ON_READ a dashboard read that finds new detections or feedback
+# rolls up to READ_BATCH_SIZE of them first (taking the watermark lock).
+# Busy sites should run `python manage.py rollup_statistics` from cron (e.g.
+# every minute), so reads find the rollups current and never write.
+SCAM_DETECTOR_ROLLUPS = {
+    'CATCH_UP_ON_READ': True,
+    'READ_BATCH_SIZE': 5000,
+}
+
+# Features used by `train_model`: 'vocabulary' keeps one column per word;
+# 'hashing' hashes words (and adjacent word pairs with BIGRAMS) into a fixed
+# N_BUCKETS columns, so model size no longer grows with the corpus. Compare
+# the two with `python manage.py bench_hashing`. In vocabulary mode, words in
+# fewer than MIN_DF training messages are dropped and, with MAX_FEATURES, only
+# the best words by SELECTION ('frequency', 'chi2' or 'mutual_info') are kept.
+SCAM_DETECTOR_TOKENIZER = {
+    'MODE': 'vocabulary',
+    'N_BUCKETS': 2 ** 18,
+    'BIGRAMS': False,
+    'MIN_DF': 1,
+    'MAX_FEATURES': None,
+    'SELECTION': 'frequency',
+}
+
+# Load and warm the model in DetectorConfig.ready() instead of on the first
+# request, then gc.freeze() it so forked workers (gunicorn --preload) share
+# its pages. /api/ready/ returns 503 until that has happened.
+SCAM_DETECTOR_PRELOAD = False
+
+# Model registry (detector/model_registry.py): each trained model is written
+# atomically to PATH/<content hash>/ and the active version is a database row.
+# Workers check for a new active version every POLL_INTERVAL seconds and swap
+# it in (None disables the check). See `python manage.py model_versions`.
+SCAM_DETECTOR_MODEL_REGISTRY = {
+    'PATH': 'scam_detector_models',
+    'POLL_INTERVAL': 5.0,
+}
+
+# Timing histograms and counters (detector/metrics.py), served at /metrics in
+# the Prometheus text format. ENABLED = False stops recording and returns 404;
+# BUCKETS (seconds) replaces the default histogram bounds.
+SCAM_DETECTOR_METRICS = {
+    'ENABLED': True,
+    'BUCKETS': None,
+}
+
+# Pre-tokenized corpus cache (detector/corpus_cache.py): training and
+# evaluation read token ids from PATH/<source file hash>-v<n>/ instead of
+# re-tokenizing the corpus. Built on first use; ENABLED = False reads the text.
+SCAM_DETECTOR_CORPUS_CACHE = {
+    'ENABLED': True,
+    'PATH': 'scam_detector_corpus_cache',
+}
+
+# Near-duplicate index of known scam campaigns (detector/campaigns.py):
+# confirmed scams are MinHashed (NUM_PERM hashes of SHINGLE_SIZE-word
+# shingles, BANDS LSH bands) and predictions get the campaign_id of any
+# stored message at least THRESHOLD similar. Run
+# `python manage.py update_campaigns` periodically; workers pick up a new
+# index within POLL_INTERVAL seconds. At most MAX_CAMPAIGNS campaigns and
+# MAX_ENTRIES signatures are kept; the least recently seen go first.
+SCAM_DETECTOR_CAMPAIGNS = {
+    'ENABLED': True,
+    'PATH': 'scam_detector_campaigns',
+    'NUM_PERM': 64,
+    'BANDS': 16,
+    'SHINGLE_SIZE': 3,
+    'THRESHOLD': 0.5,
+    'DUPLICATE_SIMILARITY': 0.9,
+    'MAX_ENTRIES': 250000,
+    'MAX_CAMPAIGNS': 100000,
+    'POLL_INTERVAL': 30.0,
+}
+
+# Phone numbers, emails and URLs from verified ScamReport.contact_info
+# (detector/indicators.py), matched in every text and reported as
+# result['indicators'] next to the verdict. New verified reports are picked
+# up every POLL_INTERVAL seconds; BLOOM_ERROR_RATE sizes the pre-filter.
+SCAM_DETECTOR_INDICATORS = {
+    'ENABLED': True,
+    'POLL_INTERVAL': 60.0,
+    'BLOOM_ERROR_RATE': 0.01,
+}
+
+# Log the detector app's INFO messages (model swaps, preloading, index
+# reloads) and warnings to the console; Django's own logging is unchanged.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'detector': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
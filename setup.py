@@ -57,6 +57,8 @@ def main():
     print("\nThe application will be available at: http://127.0.0.1:8000/")
     print("\nOptional: Create a superuser account:")
     print("  python manage.py createsuperuser")
+    print("\nIn production, keep the dashboard rollups current from cron (e.g. every minute):")
+    print("  python manage.py rollup_statistics")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file